@@ -0,0 +1,300 @@
+'''A benchmark suite for gsfd's grep, subGrep, multiGrep, sed and bulk_sed and
+grep.py's process_grep_query, run over reproducible synthetic directory trees.
+	python benchmark_suite.py                        # time everything, print a table
+	python benchmark_suite.py --quick                # smaller trees, for a quick check
+	python benchmark_suite.py --save results.json    # also write the results as JSON
+	python benchmark_suite.py --baseline base.json   # compare with stored results
+If there's a grep_benchmarks_baseline.json next to this module, it's the
+default baseline. Save one from the version you're changing, then run the
+suite again after the change:
+	python benchmark_suite.py --save grep_benchmarks_baseline.json
+	(make the change)
+	python benchmark_suite.py
+The exit status is 1 if any case got slower (or used more memory) by more
+than the tolerance, or returned a different number of results, than in the
+baseline.
+Each tree (see CORPORA and make_corpus) is generated from a fixed seed, so it's
+the same on every run. Every case is timed as the best of a few runs, and its
+peak memory (of Python objects, with tracemalloc; worker processes aren't
+counted) is measured in a separate run.
+See grep_benchmarks for before/after comparisons of particular optimizations.
+'''
+import argparse
+import json
+import locale
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import gsfd
+from grep_benchmarks import WORDS
+
+NON_ASCII_WORDS = ('café', 'naïve', 'über', 'señor', 'déjà')
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+							 'grep_benchmarks_baseline.json')
+
+# each corpus is make_corpus's arguments; encodings is a key of ENCODING_MIXES
+CORPORA = {
+	'many_small': dict(n_files = 3000, file_size = 2000, encodings = 'utf_8', match_density = 0.01),
+	'mixed_encodings': dict(n_files = 1000, file_size = 8000, encodings = 'all',
+							match_density = 0.01),
+	'few_big': dict(n_files = 8, file_size = 4 << 20, encodings = 'common',
+					match_density = 0.001),
+	'dense': dict(n_files = 1000, file_size = 8000, encodings = 'utf_8', match_density = 0.5),
+}
+
+ENCODING_MIXES = {
+	'utf_8': ('utf_8',),
+	'common': ('utf_8', 'utf_8_sig', 'utf_16', 'latin_1', 'cp1252'),
+	'all': None, # every codec in encodings_text_files.encodings that can write the text
+}
+
+GREP_OPTIONS = ('', '-i', '-c', '-l', '-n', '-h', '-v -c', '-o', '-f', '-f -a', '-d', '-b', '-j4')
+
+
+def usable_encodings(encodings = None):
+	'''The codecs in encodings (by default, encodings_text_files.encodings) that
+can encode every word make_corpus writes and decode it back, without
+duplicates. None (open()'s default) becomes the locale's preferred encoding.'''
+	if encodings is None:
+		from encodings_text_files import encodings
+	text = ' '.join(WORDS + NON_ASCII_WORDS) + '\n'
+	usable = []
+	for encoding in encodings:
+		if encoding is None:
+			encoding = locale.getpreferredencoding(False)
+		try:
+			if text.encode(encoding).decode(encoding) != text:
+				continue
+		except (LookupError, UnicodeError, ValueError, TypeError):
+			continue
+		if encoding not in usable:
+			usable.append(encoding)
+	return usable
+
+
+def encoding_mix(name):
+	'''The codecs of the ENCODING_MIXES entry name.'''
+	mix = ENCODING_MIXES[name]
+	return usable_encodings() if mix is None else mix
+
+
+def make_corpus(root, n_files = 1000, file_size = 4000, encodings = ('utf_8',),
+				match_density = 0.01, needle = 'zebra', files_per_dir = 50, fanout = 8, seed = 0):
+	'''Writes a synthetic directory tree under root, the same for the same
+arguments every time, and returns a manifest of what's in it.
+n_files: number of files. They're spread files_per_dir to a directory, in a
+	tree of directories with fanout subdirectories each. Two thirds are *.txt
+	and one third *.py.
+file_size: about how many characters of text each file has.
+encodings: the codecs the files are written in (e.g., from usable_encodings),
+	each file picking one at random.
+match_density: the fraction of lines that contain needle.
+The lines are random words from grep_benchmarks.WORDS and NON_ASCII_WORDS.
+The manifest is a dict with the number of 'files', the total 'bytes', the
+number of files in each of the 'encodings', and the number of 'matching_lines'.'''
+	rng = random.Random(seed)
+	words = WORDS * 4 + NON_ASCII_WORDS
+	manifest = {'files': n_files, 'bytes': 0, 'encodings': {}, 'matching_lines': 0}
+	for ii in range(n_files):
+		parts = []
+		dir_number = ii // files_per_dir
+		while dir_number:
+			dir_number, digit = divmod(dir_number - 1, fanout)
+			parts.append(f'd{digit}')
+		dirName = os.path.join(root, *reversed(parts))
+		os.makedirs(dirName, exist_ok = True)
+		lines = []
+		size = 0
+		while size < file_size:
+			line = [rng.choice(words) for jj in range(10)]
+			if rng.random() < match_density:
+				line[rng.randrange(10)] = needle
+				manifest['matching_lines'] += 1
+			line = ' '.join(line)
+			lines.append(line)
+			size += len(line) + 1
+		encoding = rng.choice(encodings)
+		data = '\n'.join(lines).encode(encoding)
+		ext = 'py' if ii % 3 == 0 else 'txt'
+		with open(os.path.join(dirName, f'file{ii}.{ext}'), 'wb') as f:
+			f.write(data)
+		manifest['bytes'] += len(data)
+		manifest['encodings'][encoding] = manifest['encodings'].get(encoding, 0) + 1
+	return manifest
+
+
+def _process_grep_query(query):
+	import grep # -s needs commanum
+	return grep.process_grep_query(query, 'return')
+
+
+def _cases():
+	'''The cases of the suite: a list of (name, function, needs_cleanup), where
+function runs the case in the directory containing the corpus (as 'corpus')
+and returns its result.'''
+	cases = []
+	for options in GREP_OPTIONS:
+		# -f and -d look for names, like file12.txt and d1
+		pattern = '1' if ('-f' in options or '-d' in options) else 'zebra'
+		query = f"-r {options} '{pattern}' /corpus".replace('  ', ' ')
+		cases.append((f'grep {options}'.strip(), lambda query = query: gsfd.grep(query), False))
+	pipeline = ["-r -f 'txt' /corpus", "'zebra'", "-c 'meat'"]
+	cases.append(('subGrep -f -}} -}} -c', lambda: gsfd.subGrep(pipeline), False))
+	queries = ["-r -c 'zebra' /corpus", "-r -n 'café' /corpus", "-r -l 'lambda self' /corpus"]
+	cases.append(('multiGrep -c -n -l', lambda: gsfd.multiGrep(queries), False))
+	cases.append(('process_grep_query -m -s -t',
+				  lambda: _process_grep_query("-r -m -s -t 'zebra' /corpus"), False))
+	def matching_files():
+		return gsfd.grep("-r -l 'zebra' /corpus")
+	cases.append(('sed', lambda: gsfd.sed(matching_files(), 'zebra', 'okapi',
+										  ask_permission = False), True))
+	cases.append(('bulk_sed', lambda: gsfd.bulk_sed(matching_files(), 'zebra', 'okapi'), True))
+	return cases
+
+
+def _files(root):
+	return {os.path.join(dirpath, fname) for dirpath, dirs, fnames in os.walk(root)
+			for fname in fnames}
+
+
+def _result_size(result):
+	try:
+		return len(result)
+	except TypeError:
+		return result if isinstance(result, int) else None
+
+
+def measure(function, repeat = 3, cleanup = None):
+	'''Runs function repeat times, timing each run, then once more under
+tracemalloc. cleanup (if given) is called after each run, untimed.
+Returns {'seconds': best time, 'median_seconds': median time, 'peak_bytes':
+peak traced memory, 'results': len() of what function returned (or None)}.'''
+	times = []
+	for ii in range(repeat):
+		start = time.perf_counter()
+		result = function()
+		times.append(time.perf_counter() - start)
+		if cleanup is not None:
+			cleanup()
+	tracemalloc.start()
+	try:
+		function()
+		peak = tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+		if cleanup is not None:
+			cleanup()
+	times.sort()
+	return {'seconds': times[0], 'median_seconds': times[len(times) // 2],
+			'peak_bytes': peak, 'results': _result_size(result)}
+
+
+def run_suite(corpora = None, cases = None, repeat = 3, scale = 1.0, log = print):
+	'''Generates each corpus in corpora (names in CORPORA; all by default) in a
+temporary directory and measures each case (names from _cases; all by
+default) on it. scale multiplies the number of files and the size of each file.
+Cases that can't run (e.g., grep.py's dependencies aren't installed) are
+recorded with the 'error' instead of the measurements.
+Returns a dict that json.dump can save: {'python': version, 'platform': ...,
+'scale': scale, 'corpora': {corpus: manifest}, 'results': {"corpus: case":
+measurements (see measure)}}.'''
+	out = {'python': platform.python_version(), 'platform': platform.platform(),
+		   'scale': scale, 'corpora': {}, 'results': {}}
+	all_cases = [case for case in _cases() if cases is None or case[0] in cases]
+	cwd = os.getcwd()
+	for corpus in (CORPORA if corpora is None else corpora):
+		spec = dict(CORPORA[corpus])
+		spec['encodings'] = encoding_mix(spec['encodings'])
+		spec['n_files'] = max(1, round(spec['n_files'] * scale))
+		spec['file_size'] = max(1, round(spec['file_size'] * scale))
+		with tempfile.TemporaryDirectory() as root:
+			out['corpora'][corpus] = make_corpus(os.path.join(root, 'corpus'), **spec)
+			files = _files(root)
+			def cleanup():
+				for file in _files(root) - files:
+					os.remove(file)
+			os.chdir(root)
+			try:
+				for name, function, needs_cleanup in all_cases:
+					key = f'{corpus}: {name}'
+					try:
+						out['results'][key] = measure(function, repeat,
+													  cleanup if needs_cleanup else None)
+					except Exception as ex:
+						out['results'][key] = {'error': f'{type(ex).__name__}: {ex}'}
+					if log is not None:
+						log(format_result(key, out['results'][key]))
+			finally:
+				os.chdir(cwd)
+	return out
+
+
+def format_result(key, result):
+	'''One line of the table of results.'''
+	if 'error' in result:
+		return f"{key:45} {result['error']}"
+	return (f"{key:45} {result['seconds']*1e3:10.1f} ms {result['peak_bytes']/(1<<20):9.2f} MiB"
+			f" {result['results']!s:>8} results")
+
+
+def compare(results, baseline, tolerance = 0.25):
+	'''Compares the results of run_suite with those of an earlier run.
+Returns a list of (key, what, baseline value, current value) for each case
+that got slower or used more memory by more than the fraction tolerance, or
+returned a different number of results. Only the cases in both are compared.'''
+	changes = []
+	for key, current in results['results'].items():
+		old = baseline['results'].get(key)
+		if old is None or 'error' in old or 'error' in current:
+			continue
+		if current['seconds'] > old['seconds'] * (1 + tolerance):
+			changes.append((key, 'seconds', old['seconds'], current['seconds']))
+		if current['peak_bytes'] > old['peak_bytes'] * (1 + tolerance):
+			changes.append((key, 'peak_bytes', old['peak_bytes'], current['peak_bytes']))
+		if current['results'] != old['results']:
+			changes.append((key, 'results', old['results'], current['results']))
+	return changes
+
+
+def main(argv = None):
+	parser = argparse.ArgumentParser(description = __doc__.split('\n')[0])
+	parser.add_argument('--corpus', action = 'append', choices = list(CORPORA),
+						help = 'a corpus to run (can be repeated; default: all)')
+	parser.add_argument('--case', action = 'append',
+						help = 'a case to run, e.g. "grep -c" (can be repeated; default: all)')
+	parser.add_argument('--repeat', type = int, default = 3)
+	parser.add_argument('--quick', action = 'store_true', help = 'trees a tenth the size')
+	parser.add_argument('--save', help = 'write the results to this JSON file')
+	parser.add_argument('--baseline', default = BASELINE_FILE,
+						help = 'JSON file of results to compare with')
+	parser.add_argument('--tolerance', type = float, default = 0.25)
+	args = parser.parse_args(argv)
+	scale = 0.1 if args.quick else 1.0
+	results = run_suite(args.corpus, args.case, args.repeat, scale)
+	if args.save:
+		with open(args.save, 'w') as f:
+			json.dump(results, f, indent = 1)
+	if not os.path.exists(args.baseline):
+		return 0
+	with open(args.baseline) as f:
+		baseline = json.load(f)
+	if baseline.get('scale') != scale:
+		print(f"\nThe baseline in {args.baseline} was run at scale {baseline.get('scale')},"
+			  f" not {scale}; not comparing.")
+		return 0
+	changes = compare(results, baseline, args.tolerance)
+	print(f'\nCompared with {args.baseline}:')
+	for key, what, old, new in changes:
+		ratio = f' ({new/old:.2f}x)' if what != 'results' and old else ''
+		print(f'{key:45} {what:10} {old} -> {new}{ratio}')
+	if not changes:
+		print(f'no case is more than {args.tolerance:.0%} worse.')
+	return 1 if changes else 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -1,10 +1,10 @@
-from gsfd import grep,increment_name
+from gsfd import grep,igrep,increment_name,SearchStats
 import re
 import time
+import heapq
 import os
 import sys
-from dateutil import parser
-from commanum import format_bytes, byteform_to_num
+# commanum is only imported for -s, to keep one-shot queries quick to start
 
 def fname_checker(fname,ext):
 	ext_begin = -len(fname)
@@ -19,20 +19,179 @@ def last_mod_time(fname,as_datetime=False):
 Default return value is a formatted datetime string. If as_datetime, then 
 return a datetime.datetime object representing that time.'''
 	mod_time_seconds = os.path.getmtime(fname)
-	formatted_time_string = time.ctime(mod_time_seconds)
 	if as_datetime:
-		return parser.parse(formatted_time_string)
+		import datetime
+		return datetime.datetime.fromtimestamp(int(mod_time_seconds)) # whole seconds, like ctime
 	else:
-		return formatted_time_string
+		return time.ctime(mod_time_seconds)
 
 
 def filesize(f):
 	return os.path.getsize(f)
 
+
+def format_mtime(mtime):
+	'''Formats a modification time in seconds since the epoch (e.g. os.stat's
+st_mtime) the way -m displays it, e.g. '2021-03-14 15:09:26'.'''
+	return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))
+
+
+def stat_of(f, entries):
+	'''os.stat(f), from f's os.DirEntry in entries (filled in by gsfd.grep) if
+it has one, so that the file isn't stat'ed again.'''
+	entry = entries.get(f)
+	return os.stat(f) if entry is None else entry.stat()
+
+
+def top_files(stats, n, key):
+	'''Returns the n (file, os.stat result) pairs in stats with the largest
+key(stat), largest first, in O(len(stats) log n) time.
+Pairs with equal keys stay in the order they were in.'''
+	return heapq.nlargest(n, stats, key = lambda x: key(x[1]))
+
+COMPRESSION_MODULES = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'lzma', '.lzma': 'lzma',
+					   '.zst': 'compression.zstd'} # compression.zstd is new in Python 3.14
+
+
+def open_output(fname):
+	'''Opens the file fname for writing text, compressed according to its last
+extension (see COMPRESSION_MODULES) if that names a compression format.'''
+	import importlib
+	ext = os.path.splitext(fname)[1].lower()
+	if ext in COMPRESSION_MODULES:
+		return importlib.import_module(COMPRESSION_MODULES[ext]).open(fname, 'wt', encoding = 'utf-8')
+	return open(fname, 'w')
+
+
+def output_name(write_to_name):
+	'''The name of the file -w writes to: write_to_name with its extension
+changed to .json unless it's .jsonl (both optionally followed by a compression
+extension; see open_output), and a number added if that file exists.'''
+	stem, compression = os.path.splitext(write_to_name)
+	if compression.lower() not in COMPRESSION_MODULES:
+		stem, compression = write_to_name, ''
+	if not stem.lower().endswith('.jsonl'):
+		stem = fname_checker(stem,'json')
+	return increment_name(stem + compression)
+
+
+def is_jsonl(fname):
+	'''True if fname's extension (before any compression extension) is .jsonl.'''
+	stem, ext = os.path.splitext(fname)
+	if ext.lower() in COMPRESSION_MODULES:
+		stem, ext = os.path.splitext(stem)
+	return ext.lower() == '.jsonl'
+
+
+def write_jsonl(f, records):
+	'''Writes each of the records to the text file f as one line of JSON
+(JSON Lines), and returns how many there were.'''
+	import json
+	count = 0
+	for record in records:
+		f.write(json.dumps(record))
+		f.write('\n')
+		count += 1
+	return count
+
+
+def jsonl_records(results, options, limit = None):
+	'''Yields, as soon as each is complete, a record for the JSON Lines output
+of a query, given the (file, line index, line) tuples gsfd.igrep yields for
+it and the options of its last part. The records are:
+	-d, -f, -l: file (or directory) name
+	-h: line (with -n, [line number in its file, line])
+	-c: [file, count of matching lines]
+	-n: [file, line index, line]
+	otherwise: [file, line]
+so that the elements of what grep returns (or, for a dict, its items) can be
+rebuilt from them. Like grep, stops after limit files (-c, -n or no options)
+or limit records (otherwise) if limit is not None.'''
+	d,f,c,h,n,l = [(x in options) for x in 'dfchnl']
+	as_list = d or f or h or l
+	if limit is not None and limit <= 0:
+		return
+	files = set() # files done or in progress; pipelines can repeat a file
+	count = 0 # -c count for lastfile
+	lastfile = None
+	nrecords = 0
+	for file, ind, line in results:
+		if as_list:
+			if d or f:
+				yield file
+			elif not h: # -l
+				if file == lastfile:
+					continue
+				yield file
+			else:
+				ind_in_file = ind_in_file + 1 if file == lastfile else 0
+				yield [ind_in_file, line] if n else line
+			lastfile = file
+			nrecords += 1
+			if limit is not None and nrecords == limit:
+				break
+			continue
+		if file != lastfile:
+			if file in files: # the same file again, e.g. from overlapping directories
+				continue
+			if c and lastfile is not None:
+				yield [lastfile, count]
+			if limit is not None and len(files) == limit:
+				lastfile = None
+				break
+			files.add(file)
+			lastfile = file
+			count = 0
+		if c:
+			count += 1
+		elif n:
+			yield [file, ind, line]
+		else:
+			yield [file, line]
+	if c and lastfile is not None:
+		yield [lastfile, count]
+	results.close()
+
+
+def resultset_records(resultset):
+	'''Yields the records jsonl_records would have made for a resultset that
+has already been built (the rows of a -m or -s resultset are records too).'''
+	if not isinstance(resultset, dict):
+		yield from resultset
+		return
+	for file, matches in resultset.items():
+		if isinstance(matches, int): # -c
+			yield [file, matches]
+			continue
+		for match in matches:
+			yield [file, *match] if isinstance(match, tuple) else [file, match]
+
+
+def print_records(records, options, show = True):
+	'''Prints each of the records (see jsonl_records) of a query whose last part
+has the given options as soon as it is made (unless show is False), and
+returns the summary printed for grep's resultset: its number of files, or for
+-d, -f, -h and -l its length.'''
+	as_list = any((x in options) for x in 'dfhl')
+	count = 0
+	lastfile = None
+	for record in records:
+		if show:
+			print(record)
+		if as_list:
+			count += 1
+		elif record[0] != lastfile: # jsonl_records never goes back to a file
+			lastfile = record[0]
+			count += 1
+	return count
+
+
 queryParser = "\s*(?P<options>(?:-[a-z\d]+\s+)*)(?P<text>'.+?')(?:\s+(?P<fname>/[^}\t]+)(?: -}} |\s*$))?"
 
 w_query_splitter = " -}} \s*-w\s+'(.+)'"
 
+statsParser = "\s*--stats(?:\s+|$)"
+
 
 def has_option(Grep_,option):
 	options,regexes,fnames = list(zip(*re.findall(queryParser,Grep_)))
@@ -45,16 +204,30 @@ You can display the working directory with 'd' or 'dir', change the working
 directory with 'cd <new directory name>', and display the contents of the
 working directory with 'ls'.
 You can write the results of a query to a JSON file by terminating the query
-with " -}} -w '<name of file to write to>'.
+with " -}} -w '<name of file to write to>'. If the name ends with .jsonl, the
+results are written as JSON Lines while the search runs; add .gz, .bz2 or .xz
+(e.g. 'results.jsonl.gz') to compress the file.
+If you will be searching the same directory many times, 'index <directory>'
+(default the working directory) builds an index of the text in its files, so
+that later searches of it only read the files that could match.
+To make repeated searches faster still, start a grep server in another window
+with 'python grep.py --server'. While it runs, queries are sent to it, and it
+keeps the directory listings and file contents it has read in memory.
+Start a query with --stats to see where its time went: how long walking the
+directories, reading, decoding and searching the files took, and how many
+files, bytes and lines each of those went through.
 Finally, you can supply a numeric argument to limit the size of the resultset.
 '''
 
 grep.options = ('-a(ll file types)',
+ '-b(ig files: search memory-mapped bytes)',
  '-c(ount occurrences of pattern)',
  '-d(irectories only)',
  '-f(ilenames and directories only)',
+ '-g (skip ignored, VCS, virtualenv and binary files)',
  '-h (display lines, not files)',
  '-i (case insensitive)',
+ '-j[N] (search files in parallel with N worker processes)',
  '-l (list filenames)',
  '-m (get last Modification time)',
  '-n (line Numbers only)',
@@ -66,7 +239,34 @@ grep.options = ('-a(ll file types)',
  '-v (display only things that DON\'T match)',
  '-w (write results of query to a JSON file)')
  
-def process_grep_query(query, mode = 'print', has_warned_fname = False):
+def process_grep_query(query, mode = 'print', has_warned_fname = False, encoding_cache = None, index = None,
+					   file_cache = None, search_stats = None):
+	'''Runs a grep query, handling the options that only this module knows about.
+encoding_cache, index and file_cache are passed to gsfd.grep; the REPL uses
+True for encoding_cache, so that the encodings of the files in a directory are
+only detected the first time it is searched, and the index made by its 'index'
+command. The grep server (see grep_server) also passes its file_cache.
+If the query ends with -}} -w 'name.jsonl' (optionally name.jsonl.gz etc.;
+see open_output), the results are written as JSON Lines (see jsonl_records).
+Unless -m, -s or -p need the whole resultset first, each record is then
+written as soon as gsfd.igrep finds it, so memory use stays flat however
+big the resultset is, and the number of records written is returned (or
+printed) instead of the resultset.
+In print mode, unless -m, -s, -p or -w need the whole resultset, the records
+are likewise printed as igrep finds them (see print_records), followed by the
+number of results.
+A query that starts with --stats is run with a gsfd.SearchStats, which is
+printed after the results. search_stats: a gsfd.SearchStats to add the counts
+and times of the search to, or None.'''
+	stats_flag = re.match(statsParser, query)
+	if stats_flag and search_stats is None:
+		search_stats = SearchStats()
+		start = time.perf_counter()
+		result = process_grep_query(query[stats_flag.end():], mode, has_warned_fname, encoding_cache,
+									index, file_cache, search_stats)
+		print(search_stats)
+		print(f'total  {time.perf_counter() - start:9.3f} s')
+		return result
 	try: #make the query
 		parsed_query = [re.findall(queryParser, x)[0] for x in query.split('-}}')]
 		options, regexes,fnames = list(zip(*parsed_query))
@@ -89,15 +289,9 @@ def process_grep_query(query, mode = 'print', has_warned_fname = False):
 		print("That's not a recognized command. Try again.")
 		return
 	
-	try:
-		resultset = grep(query)
-	except (IndexError,re.error):
-		print("Malformed query. Try again.")
-		return
-	
-	num_results = len(resultset)
+	num_results = None
 	for optset in options:
-		num = re.findall('\d+', optset)
+		num = re.findall('(?:^|\s)-(\d+)\\b', optset) # not the N in -jN
 		if len(num) > 0:
 			num_results = int(num[0]) # find numeric arg
 	 
@@ -105,39 +299,61 @@ def process_grep_query(query, mode = 'print', has_warned_fname = False):
 	s_option = any(('s' in x) for x in options) # find file sizes
 	t_option = any(('t' in x) for x in options) # used -t option, get count of files and sum of sizes
 	
-	if (num_results < len(resultset)) and (not (s_option or m_option)):
-		if isinstance(resultset, dict):
-			short_results = {}
-			for ii, elt in enumerate(resultset):
-				if ii == num_results:
-					break
-				short_results[elt] = resultset[elt]
-			resultset = short_results
-		else:
-			resultset = resultset[:num_results] # truncate resultset to n responses, where n is numeric arg
+	jsonl = w_option and is_jsonl(write_to_name)
+	if w_option:
+		write_to_name = output_name(write_to_name)
 	
-	if m_option:
-		modtime_d = [(f,last_mod_time(f,True)) for f in resultset]
-		modtime_d.sort(key=lambda x: x[1],reverse=True)
-		modtime_d = [(x,str(y)) for x,y in modtime_d]
-		resultset = modtime_d[:num_results]
-		del modtime_d
+	entries = {} # os.DirEntry of each file grep walks over, for -m and -s
+	try:
+		if jsonl and not (s_option or m_option or any(('p' in x) for x in options)):
+			# stream the records straight from the search to the file
+			with open_output(write_to_name) as f:
+				summary = write_jsonl(f, jsonl_records(
+					igrep(query, encoding_cache = encoding_cache, index = index,
+						  file_cache = file_cache, stats = search_stats),
+					options[-2], num_results))
+			if mode == 'print':
+				print(summary)
+				return has_warned_fname
+			return summary
+		if mode == 'print' and not (w_option or s_option or m_option or any(('p' in x) for x in options)):
+			# print the results as they are found
+			print(print_records(jsonl_records(
+				igrep(query, encoding_cache = encoding_cache, index = index,
+					  file_cache = file_cache, stats = search_stats),
+				options[-1], num_results), options[-1], show = not t_option))
+			return has_warned_fname
+		if s_option or m_option: # need every result to find the newest/biggest
+			resultset = grep(query, encoding_cache = encoding_cache, index = index,
+							 entries = entries, file_cache = file_cache, stats = search_stats)
+		else: # stop searching once we have n responses, where n is numeric arg
+			resultset = grep(query, limit = num_results, encoding_cache = encoding_cache,
+							 index = index, file_cache = file_cache, stats = search_stats)
+	except (IndexError,re.error):
+		print("Malformed query. Try again.")
+		return
 	
-	if s_option: 
-		if not m_option:
-			sizes = [(f, filesize(f)) for f in resultset]
-			sizes.sort(key = lambda x: x[1], reverse = True)
-			sizes = sizes[:num_results]
-			summary = [len(sizes), format_bytes(sum(x[-1] for x in sizes))]
-			sizes = [(x, format_bytes(y)) for x,y in sizes]
-		else:
-			sizes = [f + (filesize(f[0]),) for f in resultset]
-			sizes.sort(key = lambda x: x[2], reverse = True)
-			sizes = sizes[:num_results]
-			summary = [len(sizes), format_bytes(sum(x[-1] for x in sizes))]
-			sizes = [(x, y, format_bytes(z)) for x,y,z in sizes]
-		resultset = sizes
-		del sizes
+	if num_results is None:
+		num_results = len(resultset)
+	
+	if s_option:
+		from commanum import format_bytes
+	if m_option or s_option:
+		stats = [(f, stat_of(f, entries)) for f in resultset] # the only stat of each file
+		if m_option: # the newest num_results files...
+			stats = top_files(stats, num_results, lambda st: st.st_mtime)
+		if s_option: # ...or the biggest, or the newest sorted by size
+			stats = top_files(stats, num_results, lambda st: st.st_size)
+		resultset = []
+		for f, st in stats:
+			row = (f,)
+			if m_option:
+				row += (format_mtime(st.st_mtime),)
+			if s_option:
+				row += (format_bytes(st.st_size),)
+			resultset.append(row)
+	if s_option:
+		summary = [len(stats), format_bytes(sum(st.st_size for f, st in stats))]
 	else:
 		summary = len(resultset)
 	
@@ -163,9 +379,11 @@ def process_grep_query(query, mode = 'print', has_warned_fname = False):
 	
 	if w_option: #used -w option, write results to files
 		import json
-		write_to_name = increment_name(fname_checker(write_to_name,'json'))
-		with open(write_to_name,'w') as f:
-			json.dump(resultset,f)
+		with open_output(write_to_name) as f:
+			if not jsonl:
+				json.dump(resultset,f)
+			else:
+				write_jsonl(f, resultset_records(resultset))
 		del write_to_name
 	
 	if mode == 'print':
@@ -177,12 +395,74 @@ def process_grep_query(query, mode = 'print', has_warned_fname = False):
 	return resultset
 
 
+indexParser = "\s*index(?:\s|$)"
+
+
+def index_command(query):
+	'''Handles the REPL command 'index <directory>'. Returns the new
+trigram_index.TrigramIndex, or None if there's no such directory.'''
+	from trigram_index import TrigramIndex
+	from gsfd import EncodingCache
+	root = re.sub("^\s*index\s*",'',query)
+	root = re.sub('\'|"','',root) or '.'
+	if not os.path.isdir(root):
+		print(f"The directory {root} was not found.")
+		return None
+	index = TrigramIndex(root, EncodingCache.for_root(os.path.abspath(root)))
+	print(f"Indexed {index.update()[0]} files in {index.root}.")
+	return index
+
+
+def server_socket():
+	'''The Unix socket the grep server (see grep_server) listens on by default:
+grep_server.sock in a directory that only this user can use, $XDG_RUNTIME_DIR
+or else a grep_server_<user id> directory in the temp directory, which the
+server creates with permissions 0700.'''
+	runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+	if not runtime_dir:
+		# not tempfile.gettempdir(): importing tempfile takes longer than a small query
+		tmp = os.environ.get('TMPDIR') or os.environ.get('TEMP') or os.environ.get('TMP') or '/tmp'
+		user = os.getuid() if hasattr(os, 'getuid') else os.environ.get('USERNAME', 'user')
+		runtime_dir = os.path.join(tmp, f'grep_server_{user}')
+	return os.path.join(runtime_dir, 'grep_server.sock')
+
+
+def run_query(query, has_warned_fname = False, index = None, encoding_cache = True):
+	'''Runs an 'index' command or a grep query from the command line or the REPL,
+in the grep server if one is running (see grep_server), else in this process.
+-p queries always run here, since they open files and may ask for input.
+Returns (has_warned_fname, index).'''
+	try:
+		opens_files = has_option(query, 'p')
+	except ValueError: # not a grep query
+		opens_files = False
+	path = server_socket()
+	if not opens_files and os.path.exists(path):
+		import grep_server # only now, so one-shot queries don't pay for importing it
+		try:
+			output, has_warned_fname = grep_server.send(query, has_warned_fname, path)
+		except OSError: # no server running, or it isn't this user's
+			pass
+		else:
+			print(output, end = '')
+			return has_warned_fname, index
+	if re.match(indexParser, query):
+		return has_warned_fname, index_command(query) or index
+	return process_grep_query(query, 'print', has_warned_fname,
+							  encoding_cache = encoding_cache, index = index), index
+
+
 def main():
 	has_warned_fname = False
+	index = None
 	args = sys.argv
+	if len(args) > 1 and args[1] == '--server':
+		import grep_server
+		grep_server.serve(*args[2:3])
+		return
 	if len(args) > 1: #first arg is always path to the module's file
 		query = ' '.join(args[1:])
-		has_warned_fname = process_grep_query(query, 'print', has_warned_fname)
+		run_query(query, has_warned_fname, encoding_cache = None)
 		return
 	print(helpstring)
 	while True:
@@ -212,8 +492,11 @@ def main():
 		elif query=='ls':
 			print(os.listdir('.'))
 			continue
+		elif re.match(indexParser, query):
+			has_warned_fname, index = run_query(query, has_warned_fname, index)
+			continue
 		else: #parse the query as a grep query
-			has_warned_fname = process_grep_query(query, 'print', has_warned_fname)
+			has_warned_fname, index = run_query(query, has_warned_fname, index)
 		print()
 		del query
 	return None
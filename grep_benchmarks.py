@@ -0,0 +1,501 @@
+'''Benchmarks for gsfd's grep machinery.
+Run this module (python grep_benchmarks.py) to print the timings.
+Everything is generated from a fixed random seed, so the numbers from two
+versions of gsfd can be compared directly.
+'''
+import asyncio
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import gsfd
+
+WORDS = ('foo', 'bar', 'baz', 'meat', 'tofu', 'alpha', 'beta', 'gamma', 'def',
+		 'import', 'class', 'return', 'x1', 'y2', 'lambda', 'print', 'self')
+
+
+def make_text(n_lines = 20000, words_per_line = 10, match_density = 0.01,
+			  needle = 'zebra', seed = 0):
+	'''Returns a string with n_lines lines of random words from WORDS, about
+match_density of which also contain needle.'''
+	rng = random.Random(seed)
+	lines = []
+	for ii in range(n_lines):
+		words = [rng.choice(WORDS) for jj in range(words_per_line)]
+		if rng.random() < match_density:
+			words[rng.randrange(words_per_line)] = needle
+		lines.append(' '.join(words))
+	return '\n'.join(lines)
+
+
+def per_line_condition(regex, flags = 0, o = False):
+	'''The per-line lambda gsfd.grep used to build for each query before
+GrepMatcher, kept here for comparison.'''
+	if o:
+		return lambda line: any((re.fullmatch(regex,x,flags) is not None) \
+								for x in line.split())
+	return lambda line: re.search(regex,line,flags) is not None
+
+
+def bench_line_matching(text = None, number = 5):
+	'''Times finding the matching lines of text (default make_text()) with the
+old per-line lambdas and with gsfd.GrepMatcher, for a few regexes with and
+without -o and -i.
+Returns a list of (regex, options, old seconds, new seconds), where the
+seconds are the best of number runs.'''
+	if text is None:
+		text = make_text()
+	cases = [('zebra', ''), ('zeb.a', '-i'), ('^def', ''), ('zebra', '-o'),
+			 ('ze\\w+', '-o -i'), ('meat|tofu', '')]
+	results = []
+	for regex, options in cases:
+		flags = re.I if '-i' in options else 0
+		o = '-o' in options
+		def old():
+			cond = per_line_condition(regex, flags, o)
+			return [(ind, line) for ind, line in enumerate(text.split('\n'))
+					if cond(line)]
+		def new():
+			return list(gsfd.GrepMatcher(regex, flags, o).matching_lines(text))
+		assert old() == new(), (regex, options)
+		old_time = min(timeit.repeat(old, number = 1, repeat = number))
+		new_time = min(timeit.repeat(new, number = 1, repeat = number))
+		results.append((regex, options, old_time, new_time))
+	return results
+
+
+def make_tree(root, n_files = 3000, n_lines = 50, match_density = 0.05, seed = 0):
+	'''Writes n_files text files of make_text(n_lines, ...) directly in the
+directory root (a flat directory, so that per-file query strings work the
+same on every OS), and returns root.
+A third of the files are named *.py instead of *.txt.'''
+	os.makedirs(root, exist_ok = True)
+	for ii in range(n_files):
+		ext = 'py' if ii % 3 == 0 else 'txt'
+		with open(os.path.join(root, f'file{ii}.{ext}'), 'w') as f:
+			f.write(make_text(n_lines, match_density = match_density, seed = seed + ii))
+	return root
+
+
+def old_subGrep(greps):
+	'''gsfd.subGrep before queries were compiled into pipeline stages: every
+query after the first is re-parsed and re-run by grep on each file, which
+re-reads and re-decodes the file. Must be run from the directory containing
+the files (see bench_pipeline).'''
+	resultset = gsfd.grep(greps[0])
+	for Grep in greps[1:-1]:
+		new_results = []
+		for fname in resultset:
+			new_results.extend(gsfd.grep(Grep.strip()+' /'+os.path.basename(fname)))
+		resultset = new_results
+	output = {}
+	for f in resultset:
+		output.update(gsfd.grep(greps[-1]+' /'+os.path.basename(f)))
+	return output
+
+
+def bench_pipeline(n_files = 3000, number = 3):
+	'''Times the 3-stage pipeline "-f 'txt' /. -}} 'zebra' -}} -c 'meat'" over
+a make_tree(n_files) directory with old_subGrep and gsfd.subGrep.
+Returns (number of files, old seconds, new seconds), where the seconds are the
+best of number runs.'''
+	greps = ["-f 'txt' /.", "'zebra'", "-c 'meat'"]
+	cwd = os.getcwd()
+	with tempfile.TemporaryDirectory() as root:
+		make_tree(root, n_files)
+		os.chdir(root)
+		try:
+			old = {os.path.basename(f): c for f, c in old_subGrep(greps).items()}
+			new = {os.path.basename(f): c for f, c in gsfd.subGrep(greps).items()}
+			assert old == new
+			old_time = min(timeit.repeat(lambda: old_subGrep(greps), number = 1, repeat = number))
+			new_time = min(timeit.repeat(lambda: gsfd.subGrep(greps), number = 1, repeat = number))
+		finally:
+			os.chdir(cwd)
+	return n_files, old_time, new_time
+
+
+class DelayedFileSystem(gsfd.FileSystem):
+	'''The local filesystem, but every call sleeps for delay seconds first,
+like a filesystem mounted over a slow network.'''
+	def __init__(self, delay = 0.005):
+		self.delay = delay
+	
+	def scandir(self, path):
+		time.sleep(self.delay)
+		return super().scandir(path)
+	
+	def isfile(self, path):
+		time.sleep(self.delay)
+		return super().isfile(path)
+	
+	def stat(self, path):
+		time.sleep(self.delay)
+		return super().stat(path)
+	
+	def read(self, path):
+		time.sleep(self.delay)
+		return super().read(path)
+
+
+def bench_agrep(n_files = 300, delay = 0.005, concurrencies = (1, 8, 32)):
+	'''Times gsfd.agrep searching a make_tree(n_files) directory on a
+DelayedFileSystem(delay) with each of concurrencies, checking that it gets the
+same results as gsfd.grep on the local filesystem.
+Returns a list of (concurrency, seconds).'''
+	results = []
+	query = "-r -c 'zebra' /tree"
+	cwd = os.getcwd()
+	with tempfile.TemporaryDirectory() as root:
+		make_tree(os.path.join(root, 'tree'), n_files)
+		os.chdir(root)
+		try:
+			expected = gsfd.grep(query)
+			assert expected
+			fs = DelayedFileSystem(delay)
+			for concurrency in concurrencies:
+				start = time.perf_counter()
+				found = asyncio.run(gsfd.agrep(query, concurrency, fs = fs))
+				results.append((concurrency, time.perf_counter() - start))
+				assert found == expected
+		finally:
+			os.chdir(cwd)
+	return results
+
+
+def bench_file_cache(n_files = 3000, number = 5):
+	'''Times a recursive search of a make_tree(n_files) directory from scratch
+and with a warm gsfd.FileCache (as in grep_server), checking that both get the
+same results.
+Returns (number of files, cold seconds, warm seconds), best of number runs.'''
+	query = "-r -c 'zebra' /tree"
+	cwd = os.getcwd()
+	with tempfile.TemporaryDirectory() as root:
+		make_tree(os.path.join(root, 'tree'), n_files)
+		os.chdir(root)
+		try:
+			file_cache = gsfd.FileCache()
+			assert gsfd.grep(query) == gsfd.grep(query, file_cache = file_cache)
+			cold = min(timeit.repeat(lambda: gsfd.grep(query), number = 1, repeat = number))
+			warm = min(timeit.repeat(lambda: gsfd.grep(query, file_cache = file_cache),
+									 number = 1, repeat = number))
+		finally:
+			os.chdir(cwd)
+	return n_files, cold, warm
+
+
+class _CountingEntry:
+	'''An os.DirEntry that counts its first (system call making) stat().'''
+	def __init__(self, entry, counter):
+		self._entry = entry
+		self._counter = counter
+		self._stat = {}
+		self.name = entry.name
+		self.path = entry.path
+	
+	def __fspath__(self):
+		return self.path
+	
+	def is_dir(self, *, follow_symlinks = True):
+		return self._entry.is_dir(follow_symlinks = follow_symlinks)
+	
+	def is_file(self, *, follow_symlinks = True):
+		return self._entry.is_file(follow_symlinks = follow_symlinks)
+	
+	def is_symlink(self):
+		return self._entry.is_symlink()
+	
+	def inode(self):
+		return self._entry.inode()
+	
+	def stat(self, *, follow_symlinks = True):
+		if follow_symlinks not in self._stat:
+			self._counter.count('DirEntry.stat')
+			self._stat[follow_symlinks] = self._entry.stat(follow_symlinks = follow_symlinks)
+		return self._stat[follow_symlinks]
+
+
+class SyscallCounter:
+	'''A context manager that counts the filesystem metadata system calls made
+while it's active, without strace: calls to os.stat, os.lstat, os.listdir and
+os.scandir (including those made by os.path.isdir, os.path.getsize, os.walk
+etc.), and the first stat() of each os.DirEntry (one system call on POSIX).
+counts maps each of these names to its number of calls.'''
+	NAMES = ('stat', 'lstat', 'listdir', 'scandir')
+	
+	def __init__(self):
+		self.counts = {}
+	
+	def count(self, name):
+		self.counts[name] = self.counts.get(name, 0) + 1
+	
+	def total(self):
+		return sum(self.counts.values())
+	
+	def _wrap(self, name, func):
+		def wrapper(*args, **kwargs):
+			self.count(name)
+			return func(*args, **kwargs)
+		return wrapper
+	
+	def __enter__(self):
+		self._originals = {name: getattr(os, name) for name in self.NAMES}
+		for name, func in self._originals.items():
+			setattr(os, name, self._wrap(name, func))
+		scandir = self._originals['scandir']
+		counter = self
+		class CountingScandir:
+			def __init__(self, path = '.'):
+				counter.count('scandir')
+				self._it = scandir(path)
+			def __enter__(self):
+				return self
+			def __exit__(self, *args):
+				self._it.close()
+			def __iter__(self):
+				return self
+			def __next__(self):
+				return _CountingEntry(next(self._it), counter)
+			def close(self):
+				self._it.close()
+		os.scandir = CountingScandir
+		return self
+	
+	def __exit__(self, *args):
+		for name, func in self._originals.items():
+			setattr(os, name, func)
+
+
+def old_d_listing(dirName):
+	'''How gsfd.grep found the subdirectories for a non-recursive -d query
+before it used os.scandir: an os.path.isdir call per entry.'''
+	return [os.path.join(dirName, thing) for thing in os.listdir(dirName)
+			if os.path.isdir(os.path.join(dirName, thing))]
+
+
+def bench_syscalls(n_dirs = 10, files_per_dir = 100):
+	'''Counts the system calls (see SyscallCounter) needed to find the
+modification times and sizes of every file in a tree of n_dirs directories
+of files_per_dir files each, and to list its directories with a
+non-recursive -d query, the way grep.py did it before and after grep passed
+along the os.DirEntry objects from its walk.
+Returns a list of (what, old counts, new counts).'''
+	results = []
+	cwd = os.getcwd()
+	with tempfile.TemporaryDirectory() as root:
+		for ii in range(n_dirs):
+			make_tree(os.path.join(root, 'tree', f'dir{ii}'), files_per_dir, n_lines = 5)
+		os.chdir(root)
+		try:
+			query = "-r -f '.' /tree"
+			with SyscallCounter() as old:
+				files = gsfd.grep(query)
+				[(os.path.getmtime(f), os.path.getsize(f)) for f in files]
+			with SyscallCounter() as new:
+				entries = {}
+				files = gsfd.grep(query, entries = entries)
+				[(entries[f].stat().st_mtime, entries[f].stat().st_size) for f in files]
+			results.append(('-r -f -m -s', old.counts, new.counts))
+			with SyscallCounter() as old:
+				old_dirs = old_d_listing(os.path.abspath('tree'))
+			with SyscallCounter() as new:
+				new_dirs = gsfd.grep("-d '.' /tree")[:-1] # not tree itself
+			assert old_dirs == new_dirs
+			results.append(('-d', old.counts, new.counts))
+		finally:
+			os.chdir(cwd)
+	return results
+
+
+def bench_ignore(n_files = 300, n_ignored = 3000, number = 3):
+	'''Times a recursive search of a project of n_files files whose .gitignore
+leaves out a node_modules directory of n_ignored more, plus a .git directory
+and a virtualenv of the same size, with and without -g.
+Returns (seconds without -g, seconds with -g, files searched without -g,
+files searched with -g), best of number runs.'''
+	queries = ("-r -l 'zebra' /proj", "-r -g -l 'zebra' /proj")
+	cwd = os.getcwd()
+	with tempfile.TemporaryDirectory() as root:
+		proj = os.path.join(root, 'proj')
+		make_tree(os.path.join(proj, 'src'), n_files)
+		for junk in ('node_modules', '.git', 'venv'):
+			make_tree(os.path.join(proj, junk), n_ignored)
+		open(os.path.join(proj, 'venv', 'pyvenv.cfg'), 'w').close()
+		with open(os.path.join(proj, '.gitignore'), 'w') as f:
+			f.write('node_modules/\n')
+		os.chdir(root)
+		try:
+			results = []
+			for query in queries:
+				searched = len(gsfd.grep(query.replace('-l', '-f -a').replace("'zebra'", "'.'")))
+				seconds = min(timeit.repeat(lambda: gsfd.grep(query), number = 1, repeat = number))
+				results.append((seconds, searched))
+		finally:
+			os.chdir(cwd)
+	(plain, plain_files), (ignoring, ignoring_files) = results
+	return plain, ignoring, plain_files, ignoring_files
+
+
+def bench_multi(n_files = 3000, number = 3):
+	'''Times four queries for different patterns over a make_tree(n_files)
+directory run one after another with gsfd.grep and together with
+gsfd.multiGrep, checking that both get the same results.
+Returns (number of patterns, separate seconds, multiGrep seconds), best of
+number runs.'''
+	queries = ["-r -c 'zebra' /tree", "-r -n 'meat|tofu' /tree", "-r -l 'apple' /tree",
+			   "-r -i -c 'ZEBRA' /tree"]
+	cwd = os.getcwd()
+	with tempfile.TemporaryDirectory() as root:
+		make_tree(os.path.join(root, 'tree'), n_files)
+		os.chdir(root)
+		try:
+			assert [gsfd.grep(query) for query in queries] == gsfd.multiGrep(queries)
+			separate = min(timeit.repeat(lambda: [gsfd.grep(query) for query in queries],
+										 number = 1, repeat = number))
+			multi = min(timeit.repeat(lambda: gsfd.multiGrep(queries), number = 1, repeat = number))
+		finally:
+			os.chdir(cwd)
+	return len(queries), separate, multi
+
+
+def bench_modes(n_files = 3000, n_big = 5, big_lines = 200000, number = 3):
+	'''Times a recursive query in each output mode over a make_tree(n_files)
+directory that also has n_big files of big_lines lines (with a match near
+the top of each), with gsfd.grep as it is and with every file searched in
+full for every matching line, as it was before the engine looked at what the
+options need (see gsfd._want). Also counts the files each query opens.
+Returns a list of (options, files opened, full seconds, seconds), best of
+number runs.'''
+	modes = ['', '-l', '-c', '-f', '-f -a', '-d']
+	results = []
+	cwd = os.getcwd()
+	want = gsfd._want
+	with tempfile.TemporaryDirectory() as root:
+		tree = make_tree(os.path.join(root, 'tree'), n_files)
+		for ii in range(n_big):
+			with open(os.path.join(tree, f'big{ii}.txt'), 'w') as f:
+				f.write('zebra\n' + make_text(big_lines, seed = ii))
+		os.chdir(root)
+		opened = []
+		def counting_open(*args, **kwargs):
+			opened.append(args[0])
+			return open(*args, **kwargs)
+		try:
+			for options in modes:
+				query = f"-r {options} 'zebra' /tree"
+				gsfd.open = counting_open
+				try:
+					new = gsfd.grep(query)
+				finally:
+					del gsfd.open
+				gsfd._want = lambda options: None
+				try:
+					assert gsfd.grep(query) == new
+					full = min(timeit.repeat(lambda: gsfd.grep(query), number = 1, repeat = number))
+				finally:
+					gsfd._want = want
+				seconds = min(timeit.repeat(lambda: gsfd.grep(query), number = 1, repeat = number))
+				results.append((options, len(opened), full, seconds))
+				opened.clear()
+		finally:
+			os.chdir(cwd)
+	return results
+
+
+def bench_stats(n_files = 3000, number = 5):
+	'''Times a recursive search of a make_tree(n_files) directory without and
+with a gsfd.SearchStats, to check that keeping the counts and times costs
+little (and not keeping them nothing).
+Returns (seconds without, seconds with, the SearchStats of one search), best of
+number runs.'''
+	query = "-r 'zebra' /tree"
+	cwd = os.getcwd()
+	with tempfile.TemporaryDirectory() as root:
+		make_tree(os.path.join(root, 'tree'), n_files)
+		os.chdir(root)
+		try:
+			stats = gsfd.SearchStats()
+			assert gsfd.grep(query, stats = stats) == gsfd.grep(query)
+			without = min(timeit.repeat(lambda: gsfd.grep(query), number = 1, repeat = number))
+			with_stats = min(timeit.repeat(lambda: gsfd.grep(query, stats = gsfd.SearchStats()),
+										   number = 1, repeat = number))
+		finally:
+			os.chdir(cwd)
+	return without, with_stats, stats
+
+
+LAZY_MODULES = ('asyncio', 'concurrent.futures', 'dateutil', 'commanum')
+
+
+def import_times(module, python = sys.executable):
+	'''Imports module in a new interpreter with -X importtime and returns a dict
+mapping each module imported (by it or by the interpreter's startup) to its
+cumulative import time in seconds.'''
+	here = os.path.dirname(os.path.abspath(__file__))
+	env = dict(os.environ, PYTHONPATH = os.pathsep.join(filter(None, [here,
+															  os.environ.get('PYTHONPATH')])))
+	stderr = subprocess.run([python, '-X', 'importtime', '-c', f'import {module}'], env = env,
+							capture_output = True, text = True, check = True).stderr
+	times = {}
+	for line in stderr.splitlines():
+		m = re.match(r'import time:\s*\d+\s*\|\s*(\d+)\s*\|\s*(\S+)', line)
+		if m:
+			times[m[2]] = int(m[1]) / 1e6
+	return times
+
+
+def bench_import_time(modules = ('gsfd', 'grep'), number = 5):
+	'''Times importing each of modules (what every one-shot "python grep.py ..."
+pays before it searches anything) with -X importtime in a new interpreter, and
+checks that none of LAZY_MODULES, which are only imported by the code that needs
+them, are imported along with it.
+Returns a list of (module, seconds, the LAZY_MODULES it imported), best of
+number runs.'''
+	results = []
+	for module in modules:
+		runs = [import_times(module) for ii in range(number)]
+		seconds = min(times[module] for times in runs)
+		results.append((module, seconds, [lazy for lazy in LAZY_MODULES if lazy in runs[0]]))
+	return results
+
+
+if __name__ == '__main__':
+	print('Line matching (per-line lambdas vs. GrepMatcher):')
+	for regex, options, old_time, new_time in bench_line_matching():
+		print(f"{options:>6} {regex!r:12} {old_time*1e3:9.2f} ms {new_time*1e3:9.2f} ms"
+			  f" ({old_time/new_time:.1f}x)")
+	n_files, old_time, new_time = bench_pipeline()
+	print(f'3-stage -}}}} pipeline over {n_files} files (old vs. compiled stages):')
+	print(f"{old_time:9.3f} s {new_time:9.3f} s ({old_time/new_time:.1f}x)")
+	print('agrep on a filesystem with 5 ms latency, 300 files:')
+	for concurrency, seconds in bench_agrep():
+		print(f"concurrency {concurrency:3} {seconds:9.3f} s")
+	n_files, cold, warm = bench_file_cache()
+	print(f'Repeated -r search of {n_files} files (from scratch vs. warm FileCache):')
+	print(f"{cold:9.3f} s {warm:9.3f} s ({cold/warm:.1f}x)")
+	print('System calls for a tree of 1000 files in 10 directories (old vs. new):')
+	for what, old_counts, new_counts in bench_syscalls():
+		print(f"{what:12} {sum(old_counts.values()):6} {sum(new_counts.values()):6}"
+			  f"   {old_counts} vs. {new_counts}")
+	plain, ignoring, plain_files, ignoring_files = bench_ignore()
+	print(f'-r search of a project with ignored node_modules, .git and venv directories:')
+	print(f"without -g {plain:9.3f} s ({plain_files} files)  with -g {ignoring:9.3f} s"
+		  f" ({ignoring_files} files) ({plain/ignoring:.1f}x)")
+	n_patterns, separate, multi = bench_multi()
+	print(f'{n_patterns} patterns over 3000 files (one grep each vs. one multiGrep):')
+	print(f"{separate:9.3f} s {multi:9.3f} s ({separate/multi:.1f}x)")
+	print('-r queries by output mode over 3000 small and 5 big files (files opened,'
+		  ' every line of every file vs. only what the options need):')
+	for options, opened, full, seconds in bench_modes():
+		print(f"{options or '(none)':>6} {opened:5} {full:9.3f} s {seconds:9.3f} s ({full/seconds:.1f}x)")
+	without, with_stats, stats = bench_stats()
+	print('-r search of 3000 files without and with a SearchStats:')
+	print(f"{without:9.3f} s {with_stats:9.3f} s ({with_stats/without - 1:+.1%})")
+	print(stats)
+	print('Import time (-X importtime, best of 5):')
+	for module, seconds, eager in bench_import_time():
+		print(f"{module:6} {seconds*1e3:7.1f} ms" + (f"  also imported: {', '.join(eager)}" if eager else ''))
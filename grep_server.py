@@ -0,0 +1,145 @@
+'''A long-running server for grep.py queries, with warm caches.
+Every query the grep.py REPL runs by itself starts from scratch: it walks the
+directories, detects the encodings of the files, and reads and decodes them.
+The server keeps the directory listings, the decoded texts (see
+gsfd.FileCache) and the encodings (see gsfd.EncodingCache) between queries,
+only re-reading what has changed since, so repeating a search of the same
+project takes milliseconds.
+Start it in its own window with
+	python grep.py --server [socket path]
+While it's running, grep.py sends its queries to it and prints the results.
+It listens on a Unix domain socket, so it's not available on Windows. The
+socket is in a directory only you can use (see grep.server_socket), and
+clients only talk to a socket that you own, since the server reads files as
+you and sees every query.
+'''
+import io
+import json
+import os
+import re
+import socket
+import socketserver
+import stat
+import traceback
+from contextlib import redirect_stdout
+from gsfd import FileCache
+from grep import server_socket
+
+DEFAULT_SOCKET = server_socket()
+
+
+def _check_private_dir(dirname):
+	'''Raises PermissionError unless the directory dirname belongs to this user
+and nobody else can use it.'''
+	st = os.lstat(dirname)
+	if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+		raise PermissionError(f"{dirname} isn't a private directory of this user.")
+
+
+def _check_owner(path):
+	'''Raises an OSError unless path is a Unix socket that belongs to this user,
+so that queries are never sent to a server someone else started.'''
+	st = os.lstat(path)
+	if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+		raise PermissionError(f"{path} isn't a socket of this user.")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+	'''Handles one request: a line of JSON {"line": REPL line, "cwd": the
+client's working directory, "has_warned_fname": bool}, answered with a line
+of JSON {"output": what the REPL would have printed, "has_warned_fname": bool}.'''
+	def handle(self):
+		request = self.rfile.readline()
+		if not request: # just is_running checking that the server is there
+			return
+		request = json.loads(request)
+		has_warned_fname = request['has_warned_fname']
+		output = io.StringIO()
+		with redirect_stdout(output):
+			try:
+				os.chdir(request['cwd'])
+				has_warned_fname = self.server.run(request['line'], has_warned_fname)
+			except Exception:
+				traceback.print_exc(file = output)
+		self.wfile.write(json.dumps({'output': output.getvalue(),
+									 'has_warned_fname': has_warned_fname}).encode('utf-8') + b'\n')
+
+
+class GrepServer(socketserver.UnixStreamServer):
+	'''Runs grep.py queries sent to the Unix socket path, one at a time, with a
+FileCache whose texts can take up to max_bytes of memory.
+The REPL's 'index' command builds an index in the server too.'''
+	def __init__(self, path = DEFAULT_SOCKET, max_bytes = 256 << 20):
+		self.file_cache = FileCache(max_bytes)
+		self.index = None
+		super().__init__(path, _Handler)
+	
+	def server_bind(self):
+		# it reads and writes files as you, so nobody else may connect, not even
+		# between binding and a chmod
+		umask = os.umask(0o177)
+		try:
+			super().server_bind()
+		finally:
+			os.umask(umask)
+	
+	def run(self, line, has_warned_fname):
+		'''Runs a line from the REPL (an index command or a grep query).
+Returns has_warned_fname.'''
+		import grep
+		if re.match(grep.indexParser, line):
+			self.index = grep.index_command(line) or self.index
+			return has_warned_fname
+		return grep.process_grep_query(line, 'print', has_warned_fname, encoding_cache = True,
+									   index = self.index, file_cache = self.file_cache)
+
+
+def is_running(path = DEFAULT_SOCKET):
+	'''True if a server of this user's is listening on the Unix socket path.'''
+	try:
+		_check_owner(path)
+		with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+			sock.connect(path)
+		return True
+	except (OSError, AttributeError): # AttributeError: no AF_UNIX on this platform
+		return False
+
+
+def send(line, has_warned_fname = False, path = DEFAULT_SOCKET):
+	'''Has the server listening on the Unix socket path run a line from the REPL
+in this process's working directory.
+Returns (what it printed, has_warned_fname).
+Raises OSError if there's no server there, or path isn't this user's.'''
+	if not hasattr(socket, 'AF_UNIX'):
+		raise OSError("Unix domain sockets aren't supported on this platform.")
+	_check_owner(path)
+	request = {'line': line, 'cwd': os.getcwd(), 'has_warned_fname': has_warned_fname}
+	with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+		sock.connect(path)
+		sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+		with sock.makefile('rb') as f:
+			reply = json.loads(f.readline())
+	return reply['output'], reply['has_warned_fname']
+
+
+def serve(path = DEFAULT_SOCKET, max_bytes = 256 << 20):
+	'''Runs a GrepServer on the Unix socket path until interrupted.
+The directory of the default path is created (private to this user) if need
+be; the server won't start in it if someone else could use it.'''
+	if path == DEFAULT_SOCKET:
+		dirname = os.path.dirname(path)
+		os.makedirs(dirname, 0o700, exist_ok = True)
+		_check_private_dir(dirname)
+	if os.path.exists(path):
+		if is_running(path):
+			print(f"A grep server is already running at {path}.")
+			return
+		os.remove(path) # left behind by a server that didn't shut down cleanly
+	with GrepServer(path, max_bytes) as server:
+		print(f"grep server listening at {path}. Press Ctrl+C to stop it.")
+		try:
+			server.serve_forever()
+		except KeyboardInterrupt:
+			pass
+		finally:
+			os.remove(path)
@@ -1,402 +1,2099 @@
-'''
-
-grep: a semi-functional workalike of the grep function in Linux for finding regex and
-	other strings in files.
-'''
-import re, os, string
-
-def is_iterable(x):
-	'''returns False for strings, True for all other iterables'''
-	return hasattr(x,'__iter__') and not isinstance(x,str)
-
-def fname_checker(fname,ext):
-	ext_begin = -len(fname)
-	for ind in range(1,len(fname)+1):
-		if fname[-ind]=='.':
-			ext_begin = ind
-			break
-	return fname[:-ext_begin] + '.' + ext
-
-
-def get_ext(fname):
-	'''Returns (fname (not including extension), extension).'''
-	for ii in range(len(fname)-1,0,-1):
-		if fname[ii]=='.':
-			return fname[:ii],fname[ii:]
-	return fname,''
-
-
-def increment_name(fname,check_dups = True,start_num = 0):
-	'''If fname is not the name of an extant file, returns fname. Else:
-Create a new file name with _{number} appended to the end of fname,
-where "number" is either start_num (if check_dups is False or
-no file already exists with that extension) or the lowest integer n greater
-than start_num such that no file namedfname+"_"+str(n)+(fname's extension)
-already exists with that extension.'''
-	fname = os.path.abspath(fname)
-	stem,ext = get_ext(fname)
-	if not check_dups:
-		return stem+'_'+str(start_num)+ext
-	else:
-		if not (os.path.exists(fname) or os.path.isfile(fname)):
-			return fname
-		ii = start_num
-		while True:
-			new_ext = stem+'_'+str(ii)+ext
-			if not os.path.exists(new_ext):
-				return new_ext
-			ii += 1
-
-			
-from encodings_text_files import encodings
-#includes something like 100 different encodings, starting with the most common
-def get_text_best_encoding(fname, print_on_exception = False):
-	for enc_num,encoding in enumerate(encodings):
-		try:
-			with open(fname,'r', encoding = encoding) as f:
-				#print(encoding,end=', ')
-				return f.read() #we found a good encoding, stop trying new ones.
-		except:
-			pass #keep trying other encodings
-	if enc_num >= len(encodings)-1:
-		if not print_on_exception:
-			raise UnicodeDecodeError("Could not find the encoding for this file.")
-		print("Could not find the encoding for this file.")
-
-textTypeFiles = "\.(txt|py|ipynb|json|js|htm[l]?|css|[ct]sv|R|Rmd|sql|fwf|c|cpp|bat)$"
-
-grepParser = re.compile(("(?P<options>(?:-[a-z\d]+\s+)*)"
-						  "'(?P<regex>.+)' "
-						  "(?P<File_or_containing_directory>/.+)"))
-
-
-def grep(Input):
-	"""The grep filter searches a .txt file for a particular pattern of characters,
-and displays all lines that contain that pattern. The pattern that is searched
-in the file is referred to as the regular expression
-(grep stands for globally search for regular expression and print out).
-grep has an "options" attribute so you can see the options you can use.
-
-Format for Input:
-[options] 'pattern' /[filename or containing directory]
-
-Alternative format for input:
-[options 1] '[pattern 1]' /[containing dir] -}} [options 2] '[pattern 2]'
-	( -}} ... -}} [options n] '[pattern n]')?
-	If the command is in this alternative format, finds the set of files in
-	[containing dir] that satisfy the first query, then uses each query
-	between the first and the last to refine the set of files, and returns
-	the results of the final query.
-	See subGrep.
-
-By default, returns a dict mapping filenames to a list of lines in that file
-	where the regex is matched. Some options change the return type.
-
-IMPORTANT: You NEED to have exactly one space between the options block and
-the pattern block, the pattern block MUST be enclosed by '', there MUST
-be exactly one space between the pattern block and the filename block, and
-the filename block must be preceded by /.
-
-Options Description
--f : Searches only the filenames of text-type files for matches to the regex. 
-	(returns list)
--a : Special case of -f. Matches regex in filenames of all files, not just 
-	text-type files.
--c : This prints only a count of the lines that match a pattern 
-	(returns dict)
--h : Display the matched lines, but do not display the filenames. 
-	(returns list)
--i : case-insensitive match
-	(does not affect return type)
--l : Displays list of a filenames only. 
-	(returns list)
--n : Display the matched lines and their line numbers. 
-	(returns dict mapping to tuples)
--v : Matches all the lines that DO NOT match the pattern
-	(does not affect return type)
--o : Match whole word or filename. For filenames, matches only the part
-	of the filename that is not in the parent directory name (so any subdir
-	name plus the file name in the -r case or just the filename otherwise).
--d : Searches only directory names for matches to the regex.
-	(returns list)
--r : Recursively searches through the entire directory tree beneath a given
-	directory (all subdirectories within that directory as well as the 
-	directory itself)
-	(does not affect return type)
-	"""
-	if ' -}} ' in Input:
-		greps = [x.strip() for x in Input.split(' -}} ')]
-		return subGrep(greps)
-		
-	
-	parsedInput = re.findall(grepParser, Input.strip())[0]
-	options = list(map(lambda x: x.lower().strip(),
-					filter(lambda x: len(x)>0,
-						   re.split("(?:\s+|^)-",parsedInput[0])
-						   ))) 
-	#split the options substring into letters, convert to lower-case
-	
-	regex = parsedInput[1]
-	dirName = os.path.abspath(str.join("\\", parsedInput[2].split('/')[1:]))
-	
-	#print(options,regex,dirName)
-
-	c = ('c' in options)
-	h = ('h' in options)
-	i = ('i' in options)
-	l = ('l' in options)
-	n = ('n' in options)
-	v = ('v' in options)
-	d = ('d' in options)
-	o = ('o' in options)
-	r = ('r' in options)
-	f = ('f' in options)
-	a = ('a' in options)
-
-	goodFiles = {}
-	goodFilesLineNums = {}
-	goodDirs = []
-	
-	if i:
-		if o:
-			goodness_condition = lambda line: any((re.fullmatch(regex,x,re.I) is not None) \
-													for x in line.split())
-			f_goodness_condition = lambda fname: re.fullmatch(regex,fname,re.I) is not None
-		else:
-			goodness_condition = lambda line: re.search(regex,line,re.I) is not None
-			f_goodness_condition = lambda fname: re.search(regex,fname,re.I) is not None
-	else:
-		if o:
-			goodness_condition = lambda line: any((re.fullmatch(regex,x) is not None) \
-													for x in line.split())
-			f_goodness_condition = lambda fname: re.fullmatch(regex,fname) is not None
-		else:
-			goodness_condition = lambda line: re.search(regex,line) is not None
-			f_goodness_condition = lambda fname: re.search(regex,fname) is not None
-	
-	dirIsFile = os.path.isfile(dirName)
-	if not dirIsFile:
-		try:
-			if r:
-				filesToSearch=[]
-				for root, dirs, files in os.walk(dirName):
-					if d:
-						for Dir in dirs:
-							Dir = os.path.join(root,Dir)
-							if f_goodness_condition(Dir) ^ v: #hooray for XOR!!
-								goodDirs.append(Dir)
-						continue
-					for fname in files:
-						filesToSearch.append(os.path.join(root, fname))
-			else:
-				filesToSearch = os.listdir(dirName)
-				if d:
-					for thing in filesToSearch:
-						Dir = os.path.join(dirName,thing)
-						if os.path.isdir(Dir) and f_goodness_condition(Dir) ^ v:
-							goodDirs.append(Dir)
-		except:
-			# if re.search(textTypeFiles, fname):
-				# dirIsFile = True
-			filesToSearch = []
-		
-		if d:
-			if f_goodness_condition(dirName) ^ v:
-				goodDirs.append(dirName) #need to consider the starting dir too
-			filesToSearch = [] #consider only directories with d option
-		
-		for fname in filesToSearch:
-			file = os.path.join(dirName,fname)
-			if f and a:
-				if f_goodness_condition(fname) ^ v:
-					goodFiles.setdefault(file,0)
-			elif (re.search(textTypeFiles, fname)):
-				if f:
-					if f_goodness_condition(fname) ^ v:
-						goodFiles.setdefault(file,0)
-					continue
-				lines = get_text_best_encoding(file,print_on_exception=True).split('\n')
-				for ind in range(len(lines)):
-					line=lines[ind]
-					if goodness_condition(line) ^ v:
-						goodFiles.setdefault(file, [])
-						goodFiles[file].append(line)
-						goodFilesLineNums.setdefault(file, [])
-						goodFilesLineNums[file].append((ind, line))
-
-	if dirIsFile:
-		file=dirName
-		if f:
-			if f_goodness_condition(file) ^ v:
-				goodFiles.setdefault(file,0)
-		else:
-			lines = get_text_best_encoding(file,print_on_exception=True).split('\n')
-			for ind in range(len(lines)):
-				line = lines[ind]
-				if goodness_condition(line) ^ v:
-					goodFiles.setdefault(dirName, [])
-					goodFiles[dirName].append(line)
-					goodFilesLineNums.setdefault(dirName, [])
-					goodFilesLineNums[dirName].append((ind, line))
-	
-	
-	if d:
-		return goodDirs
-	if f:
-		return list(goodFiles.keys())
-	
-	if c:
-		fileLineCounts={}
-		for key in goodFiles:
-			fileLineCounts[key] = len(goodFiles[key])
-		return fileLineCounts
-	if h:
-		linelist=[]
-		linelistWithNums=[]
-		for key in goodFiles:
-			for ind in range(len(goodFiles[key])):
-				line = goodFiles[key][ind]
-				linelist.append(line)
-				linelistWithNums.append((ind, line))
-		if n: 
-			return linelistWithNums
-		return linelist
-	if n:
-		return goodFilesLineNums
-	if l:
-		return list(goodFiles.keys())
-	return goodFiles
-
-grep.options = ('-a(ll file types)',
- '-c(ount occurrences of pattern)',
- '-d(irectories only)',
- '-f(ilenames and directories only)',
- '-h (display lines, not files)',
- '-i (case insensitive)',
- '-l (list filenames)',
- '-n (line Numbers only)',
- '-o (match only entire words)',
- '-r(ecursive search)',
- '-v (display only things that DON\'T match)')
-
-def subGrep(greps):
-	'''Iterates through the grep queries in greps. Generates a set of files
-with the first grep query.
-Uses each grep query between the first and the last to iteratively refine 
-this result set, and returns the union of results from the last query made
-on the result set generated by the penultimate query.
-	'''
-	# print(greps)
-	# print()
-	resultset = grep(greps[0])
-	options = grepParser.findall(greps[0])[0]
-	# print(resultset)
-	# print()
-	for Grep in greps[1:-1]:
-		Grep = Grep.strip()
-		# print(Grep)
-		new_results = []
-		for fname in resultset:
-			new_results.extend(grep(Grep+' /'+fname))
-		resultset = new_results
-		# print(resultset)
-		# print()
-	
-	if re.search('-[dhfl]',greps[-1]):
-		output = []
-		for f in resultset:
-			output.extend(grep(greps[-1]+' /'+f))
-	else:
-		output = {}
-		for f in resultset:
-			output.update(grep(greps[-1]+' /'+f))
-	return output
-
-
-def sed(grep_or_fname,regex,repl,ask_permission = True,name_mangle = '_sed',flags=0):
-	"""Search for regex in files, replace them, writing to new files if desired.
-grep_or_fname: a filename, a list of filenames, or a grep query for
-	filenames.
-regex: string, a regular expression or string to be replaced.
-repl: string, a pattern for replacing the string in the file(s).
-ask_permission: bool. If True, shows what will be replaced before each
-	replacement, and allows you to quit at any point if you want.
-name_mangle: string. If '', files will be overwritten by this function.
-	THIS IS OBVIOUSLY DANGEROUS! Thus, the default is to write a new file
-	with '_sed' appended to the filename.
-
-Solution: http://thinkpython2.com/code/sed.py.
-meat=re.compile('meat', flags=re.I)
-Test for non-recursive form: gsfd.sed('ludd', 'eehive', './/delicious//bluddText inc15.txt')
-Test for recursive form: gsfd.sed(meat, 'tofu', './/delicious', recursive=True)
-Test for non-recursive form with name choice: gsfd.sed('ludd', 'eehive', 'bluddNew.txt', './/delicious//bluddText inc15.txt')
-Test for error handling in recursive form: gsfd.sed('dfd', '23rer', '33254223432', recursive=True)
-Test for error handling in non-recursive form: gsfd.sed('dfd', '23rer', '33254223432')
-zargothrax=gsfd.grep("-i -r 'argothrax' /C:/Users/molso/Documents/html stuff")
-	"""
-	try:
-		is_grep_query = not os.path.isfile(grep_or_fname)
-	except: #it's an iterable of file names, not a string, which causes error
-		is_grep_query = False
-	findregex = re.compile(regex,flags)
-	if is_grep_query:
-		files = grep(grep_or_fname)
-	else:
-		if is_iterable(grep_or_fname):
-			files = list(grep_or_fname)
-		else:
-			files = [grep_or_fname]
-	if len(files)==0:
-		print("No files found.")
-	for file in files:
-		try:
-			text = get_text_best_encoding(file)
-		except:
-			print(f"File {file} not found, or its encoding could not be determined.")
-			continue
-		newtext = ''
-		last_index = 0
-		if ask_permission:
-			print(f"\nNow in file {file}.")
-			has_replacements = False
-			for to_replace in findregex.finditer(text):
-				has_replacements = True
-				start,end= to_replace.span()
-				newtext += text[last_index:start]
-				old = text[start:end]
-				new_ = findregex.sub(repl,old)
-				last_index = end
-				decision = input((f"\nAre you sure you want to replace \"{old}\""
-						   f" with \"{new_}\"?"
-						   "\nIf yes, press 1. If no, press something else."
-						   "\nIf you don't want to be asked permission again, press 99.\t"))
-				if decision not in ['1','99']:
-					next_decision = input(("\nPrematurely terminating replacements."
-						   " Press 1 to continue to other files, "
-						   "or something else to exit function.\t"))
-					if next_decision == '1':
-						newtext += old
-						break
-					else:
-						return
-				newtext += new_
-				if decision == '99':
-					print("\nPermission will no longer be requested.")
-					newtext += findregex.sub(repl,text[end:])
-					last_index = len(text)
-					ask_permission = False
-					break
-			newtext += text[last_index:]
-		else: #not requesting permission
-			has_replacements = True
-			newtext += findregex.sub(repl,text)
-		if has_replacements: #only overwrite file if anything has been changed
-			fname,ext = get_ext(file)
-			if name_mangle != '':
-				newfile = increment_name(fname + name_mangle + ext)
-			else:
-				newfile = file
-			#this will overwrite old file if name_mangle is ''
-			with open(newfile,'w') as f:
-				f.write(newtext)
-	return
+'''
+
+grep: a semi-functional workalike of the grep function in Linux for finding regex and
+	other strings in files.
+'''
+import re, os, sys, string, types, codecs, locale, json, mmap, itertools, time, threading
+from collections import OrderedDict
+# asyncio and concurrent.futures are imported by the functions that use them,
+# since importing them takes longer than a small search
+
+def is_iterable(x):
+	'''returns False for strings, True for all other iterables'''
+	return hasattr(x,'__iter__') and not isinstance(x,str)
+
+def fname_checker(fname,ext):
+	ext_begin = -len(fname)
+	for ind in range(1,len(fname)+1):
+		if fname[-ind]=='.':
+			ext_begin = ind
+			break
+	return fname[:-ext_begin] + '.' + ext
+
+
+def get_ext(fname):
+	'''Returns (fname (not including extension), extension).'''
+	for ii in range(len(fname)-1,0,-1):
+		if fname[ii]=='.':
+			return fname[:ii],fname[ii:]
+	return fname,''
+
+
+def increment_name(fname,check_dups = True,start_num = 0):
+	'''If fname is not the name of an extant file, returns fname. Else:
+Create a new file name with _{number} appended to the end of fname,
+where "number" is either start_num (if check_dups is False or
+no file already exists with that extension) or the lowest integer n greater
+than start_num such that no file namedfname+"_"+str(n)+(fname's extension)
+already exists with that extension.'''
+	fname = os.path.abspath(fname)
+	stem,ext = get_ext(fname)
+	if not check_dups:
+		return stem+'_'+str(start_num)+ext
+	else:
+		if not (os.path.exists(fname) or os.path.isfile(fname)):
+			return fname
+		ii = start_num
+		while True:
+			new_ext = stem+'_'+str(ii)+ext
+			if not os.path.exists(new_ext):
+				return new_ext
+			ii += 1
+
+			
+from encodings_text_files import encodings
+#includes something like 100 different encodings, starting with the most common
+
+def _probe_order(encodings):
+	'''Yields the encodings worth trying to decode a text file with, in the order
+given. None (the default encoding of open()) becomes the locale's preferred
+encoding. Drops duplicates, codecs that this Python doesn't have, and codecs
+that can't decode bytes to text at all (rot_13, base64_codec, zlib_codec,
+undefined...).'''
+	seen = set()
+	for encoding in encodings:
+		if encoding is None:
+			encoding = locale.getpreferredencoding(False)
+		if encoding == 'undefined': #always raises an exception
+			continue
+		try:
+			name = codecs.lookup(encoding).name
+			b'\n'.decode(encoding)
+		except LookupError: # not in this Python, or not a bytes -> text codec
+			continue
+		except UnicodeError: # e.g., a lone byte is not valid utf_16
+			pass
+		if name not in seen:
+			seen.add(name)
+			yield encoding
+
+_probe_encodings = [] # the start of _probe_order(encodings)
+_probe_rest = _probe_order(encodings) # the rest of it
+_probe_lock = threading.Lock()
+
+
+def _probe_iter():
+	'''Yields _probe_order(encodings).
+Looking up a codec imports its module, so each one is only looked up the first
+time it's needed; most files are decoded by one of the first few.'''
+	ii = 0
+	while True:
+		if ii == len(_probe_encodings):
+			with _probe_lock: # agrep detects encodings on several threads
+				if ii == len(_probe_encodings):
+					encoding = next(_probe_rest, None)
+					if encoding is None:
+						return
+					_probe_encodings.append(encoding)
+		yield _probe_encodings[ii]
+		ii += 1
+
+# utf_32 first, because its little-endian BOM starts with utf_16's
+_BOMS = ((codecs.BOM_UTF32_LE, 'utf_32'),
+		 (codecs.BOM_UTF32_BE, 'utf_32'),
+		 (codecs.BOM_UTF8, 'utf_8_sig'),
+		 (codecs.BOM_UTF16_LE, 'utf_16'),
+		 (codecs.BOM_UTF16_BE, 'utf_16'))
+
+SAMPLE_SIZE = 1 << 16 # bytes
+
+
+def _candidate_encodings(data, sample_size = SAMPLE_SIZE, stats = None):
+	'''Yields the encodings that might be the encoding of the bytes data, most
+likely first: the encoding indicated by a byte order mark if there is one,
+then every probed encoding that can decode the first sample_size bytes.
+Each encoding is counted once in stats (a SearchStats) if it's given, whether
+it's probed on the sample or taken from the byte order mark, so decoding the
+whole of data with an encoding yielded here isn't another attempt.'''
+	for bom, encoding in _BOMS:
+		if data.startswith(bom):
+			if stats is not None:
+				stats.encoding_attempts += 1
+			yield encoding
+			break
+	sample = data[:sample_size]
+	final = len(data) <= sample_size
+	for encoding in _probe_iter():
+		if stats is not None:
+			stats.encoding_attempts += 1
+		try:
+			# an incremental decoder won't choke on a character cut in half at the end
+			codecs.getincrementaldecoder(encoding)().decode(sample, final)
+		except (UnicodeError, ValueError):
+			continue
+		yield encoding
+
+
+def detect_encoding(data, sample_size = SAMPLE_SIZE):
+	'''Guess the encoding of the bytes data (e.g. the start of a file) from its
+byte order mark, or else the first encoding in encodings_text_files.encodings
+that can decode its first sample_size bytes.
+Returns None if nothing can decode it.'''
+	return next(_candidate_encodings(data, sample_size), None)
+
+
+def _normalize_newlines(text):
+	'''Converts \r\n and \r to \n, like reading a file in text mode.'''
+	if '\r' in text:
+		return text.replace('\r\n','\n').replace('\r','\n')
+	return text
+
+
+def decode_best_encoding(data, stats = None):
+	'''Decodes the bytes data with the best encoding for it (see detect_encoding),
+returning (text, encoding). Only one full decode is needed unless the best
+encoding for the sample chokes on something later on.
+Newlines are normalized to '\n', like reading a file in text mode.
+stats: a SearchStats or None. If given, every encoding tried is counted in it.'''
+	for encoding in _candidate_encodings(data, stats = stats): # counts the attempts
+		try:
+			text = data.decode(encoding)
+		except (UnicodeError, ValueError):
+			continue
+		return _normalize_newlines(text), encoding
+	raise UnicodeError("Could not find the encoding for this file.")
+
+
+def _read_text(fname, encoding = None, stats = None):
+	'''Reads the file fname once and returns (text, encoding), decoding it
+with encoding if that's given and works, or else the best encoding for it.
+If stats (a SearchStats) is given, the reading and decoding are added to it.'''
+	if stats is None:
+		with open(fname,'rb') as f:
+			return _decode_text(f.read(), encoding)
+	start = time.perf_counter()
+	with open(fname,'rb') as f:
+		data = f.read()
+	read = time.perf_counter()
+	stats.read_seconds += read - start
+	stats.files_read += 1
+	stats.bytes_read += len(data)
+	try:
+		return _decode_text(data, encoding, stats)
+	finally:
+		stats.decode_seconds += time.perf_counter() - read
+		stats.bytes_decoded += len(data)
+
+
+def _decode_text(data, encoding = None, stats = None):
+	'''Decodes the bytes data like _read_text decodes a file's contents.'''
+	if encoding is not None:
+		if stats is not None:
+			stats.encoding_attempts += 1
+		try:
+			return _normalize_newlines(data.decode(encoding)), encoding
+		except (UnicodeError, LookupError):
+			pass # the file must have changed; detect the encoding again
+	return decode_best_encoding(data, stats)
+
+
+class SearchStats:
+	'''Counts and times for the phases of a search, to see where its time goes.
+Pass one to grep (or igrep, subGrep or multiGrep) as stats, and print it:
+>>> stats = SearchStats()
+>>> gsfd.grep("-r 'zebra' /delicious", stats = stats)
+>>> print(stats)
+The phases, and what is counted in each, are:
+walk: listing directories and picking the files to search (including
+	updating a trigram index). dirs_walked, files_walked (files found), and
+	files_skipped (not text-type, binary with -g, or ruled out by the index).
+read: reading the bytes of files. files_read and bytes_read.
+decode: detecting encodings and decoding. encoding_attempts (each encoding
+	tried on a file, whether on its start, the whole of it, or both, counts
+	once) and bytes_decoded.
+match: searching the texts. files_searched, lines_searched (the lines in the
+	texts searched, up to the first match with -l), and matches (matching
+	lines, or matching names with -f and -d).
+Also counted are files_cached (texts taken from a FileCache) and
+files_unreadable. Files searched through a memory map (-b) or a chunk at a
+time (big files with -l) are read and decoded while they're searched, so all
+their time is match time, and only their matches are counted. With worker
+processes (-j), the times are added up over the workers.
+A search without a SearchStats doesn't keep any of these.
+	'''
+	COUNTS = ('dirs_walked', 'files_walked', 'files_skipped', 'files_read', 'bytes_read',
+			  'encoding_attempts', 'bytes_decoded', 'files_searched', 'lines_searched',
+			  'matches', 'files_cached', 'files_unreadable')
+	PHASES = ('walk', 'read', 'decode', 'match')
+	
+	def __init__(self):
+		for name in self.COUNTS:
+			setattr(self, name, 0)
+		for phase in self.PHASES:
+			setattr(self, phase + '_seconds', 0.0)
+	
+	def merge(self, other):
+		'''Adds the counts and times of the SearchStats other to these.'''
+		for name in self.COUNTS + tuple(phase + '_seconds' for phase in self.PHASES):
+			setattr(self, name, getattr(self, name) + getattr(other, name))
+	
+	def as_dict(self):
+		'''The counts and times (as phase_seconds) in a dict.'''
+		return {name: getattr(self, name)
+				for name in self.COUNTS + tuple(phase + '_seconds' for phase in self.PHASES)}
+	
+	def __repr__(self):
+		return f'SearchStats({self.as_dict()})'
+	
+	def __str__(self):
+		per_file = (f' ({self.encoding_attempts / self.files_read:.1f} per file)'
+					if self.files_read else '')
+		details = {
+			'walk': f'{self.dirs_walked:,} dirs, {self.files_walked:,} files walked,'
+					f' {self.files_skipped:,} skipped',
+			'read': f'{self.files_read:,} files, {self.bytes_read:,} bytes read',
+			'decode': f'{self.bytes_decoded:,} bytes decoded, {self.encoding_attempts:,}'
+					  f' encoding attempts{per_file}',
+			'match': f'{self.files_searched:,} files, {self.lines_searched:,} lines searched,'
+					 f' {self.matches:,} matches',
+		}
+		lines = [f'{phase:7}{getattr(self, phase + "_seconds"):9.3f} s  {details[phase]}'
+				 for phase in self.PHASES]
+		if self.files_cached or self.files_unreadable:
+			lines.append(f'{self.files_cached:,} files from the file cache,'
+						 f' {self.files_unreadable:,} unreadable')
+		return '\n'.join(lines)
+
+
+def _timed(iterable, stats):
+	'''Yields what iterable yields, adding the time spent getting each item
+(e.g., walking the directories to find the next file) to stats.walk_seconds.'''
+	iterator = iter(iterable)
+	while True:
+		start = time.perf_counter()
+		try:
+			item = next(iterator)
+		except StopIteration:
+			stats.walk_seconds += time.perf_counter() - start
+			return
+		stats.walk_seconds += time.perf_counter() - start
+		yield item
+
+
+class EncodingCache:
+	'''Remembers the encoding detected for each file, so that searching the
+same files again needs only one decode per file and no detection.
+An entry is keyed by the file's path and only used while the file's
+modification time and size are what they were when it was made.
+path: where the cache is saved as JSON (see save). If None, the cache
+	lives only in memory.
+max_entries: the most files to remember. When there are more, the least
+	recently used entries are dropped.
+Use EncodingCache.for_root(directory) to get the (shared) cache that lives
+in a sidecar file at the top of a directory tree.
+	'''
+	FILENAME = '.gsfd_encoding_cache'
+	_for_root = {}
+	
+	def __init__(self, path = None, max_entries = 100000):
+		self.path = path
+		self.max_entries = max_entries
+		self.entries = OrderedDict() # file -> [mtime_ns, size, encoding]
+		self.dirty = False
+		if path is not None:
+			try:
+				with open(path) as f:
+					for fname, mtime, size, encoding in json.load(f):
+						self.entries[fname] = [mtime, size, encoding]
+			except (OSError, ValueError, TypeError):
+				pass # no usable cache yet
+	
+	@classmethod
+	def for_root(cls, root, max_entries = 100000):
+		'''Returns the cache kept in the FILENAME sidecar of directory root,
+loading it only the first time it is asked for.'''
+		path = os.path.join(root, cls.FILENAME)
+		if path not in cls._for_root:
+			cls._for_root[path] = cls(path, max_entries)
+		return cls._for_root[path]
+	
+	def __len__(self):
+		return len(self.entries)
+	
+	def get(self, fname, stat = None):
+		'''Returns the remembered encoding of file fname, or None if there is
+none or the file has changed since. stat is fname's os.stat result, if
+you already have it.'''
+		entry = self.entries.get(fname)
+		if entry is None:
+			return None
+		try:
+			if stat is None:
+				stat = os.stat(fname)
+		except OSError:
+			return None
+		if entry[0] != stat.st_mtime_ns or entry[1] != stat.st_size:
+			return None
+		self.entries.move_to_end(fname)
+		return entry[2]
+	
+	def set(self, fname, encoding, stat = None):
+		'''Remembers that file fname (whose os.stat result is stat) has encoding.'''
+		try:
+			if stat is None:
+				stat = os.stat(fname)
+		except OSError:
+			return
+		self.entries[fname] = [stat.st_mtime_ns, stat.st_size, encoding]
+		self.entries.move_to_end(fname)
+		while len(self.entries) > self.max_entries:
+			self.entries.popitem(last = False)
+		self.dirty = True
+	
+	def save(self):
+		'''Writes the cache to its path (if it has one and has changed), least
+recently used entries first. Failing to write it is not an error.'''
+		if self.path is None or not self.dirty:
+			return
+		tmp = self.path + '.tmp'
+		try:
+			with open(tmp, 'w') as f:
+				json.dump([[fname] + entry for fname, entry in self.entries.items()], f)
+			os.replace(tmp, self.path)
+			self.dirty = False
+		except OSError:
+			pass
+
+
+class _CachedEntry:
+	'''Stands in for an os.DirEntry in a listing from a FileCache. Its type
+comes from the listing; its stat() is fresh for each search.'''
+	__slots__ = ('name', 'path', '_is_dir', '_is_symlink', '_stat')
+	
+	def __init__(self, dirName, name, is_dir, is_symlink):
+		self.name = name
+		self.path = os.path.join(dirName, name)
+		self._is_dir = is_dir
+		self._is_symlink = is_symlink
+		self._stat = None
+	
+	def is_dir(self):
+		return self._is_dir
+	
+	def is_symlink(self):
+		return self._is_symlink
+	
+	def stat(self):
+		if self._stat is None:
+			self._stat = os.stat(self.path)
+		return self._stat
+
+
+class FileCache:
+	'''Keeps directory listings and decoded file contents in memory between
+searches, for long-running processes like grep_server.
+A directory's listing is reused until its modification time changes, and a
+file's text until its modification time or size changes. A search with a warm
+cache still stats each directory and file it looks at, but only lists or
+reads the ones that changed.
+max_bytes: the memory budget for the texts. When they take up more than this,
+	the least recently used ones are dropped. Files whose text alone is bigger
+	are read every time.
+	'''
+	def __init__(self, max_bytes = 256 << 20):
+		self.max_bytes = max_bytes
+		self.nbytes = 0
+		self.texts = OrderedDict() # fname -> [mtime_ns, size, text, encoding, nbytes]
+		self.listings = {} # dirName -> (mtime_ns, list of (name, is_dir, is_symlink))
+	
+	def __len__(self):
+		return len(self.texts)
+	
+	def scandir(self, dirName):
+		'''Like listing the directory dirName with os.scandir, but from the cache
+if the directory hasn't changed. Returns a list of DirEntry-like objects.'''
+		try:
+			mtime_ns = os.stat(dirName).st_mtime_ns
+		except OSError:
+			self.listings.pop(dirName, None)
+			return []
+		listing = self.listings.get(dirName)
+		if listing is None or listing[0] != mtime_ns:
+			listing = (mtime_ns, [(entry.name, _is_dir(entry), _is_symlink(entry))
+								  for entry in _scandir(dirName)])
+			self.listings[dirName] = listing
+		return [_CachedEntry(dirName, *x) for x in listing[1]]
+	
+	def read_text(self, fname, encoding = None, stats = None):
+		'''_read_text(fname, encoding, stats), but from the cache if the file
+hasn't changed. Returns (text, encoding).'''
+		stat = os.stat(fname)
+		entry = self.texts.get(fname)
+		if entry is not None:
+			if entry[:2] == [stat.st_mtime_ns, stat.st_size]:
+				self.texts.move_to_end(fname)
+				if stats is not None:
+					stats.files_cached += 1
+				return entry[2], entry[3]
+			self._forget(fname)
+		text, encoding = _read_text(fname, encoding, stats)
+		nbytes = sys.getsizeof(text)
+		if nbytes <= self.max_bytes:
+			self.texts[fname] = [stat.st_mtime_ns, stat.st_size, text, encoding, nbytes]
+			self.nbytes += nbytes
+			while self.nbytes > self.max_bytes:
+				self._forget(next(iter(self.texts)))
+		return text, encoding
+	
+	def _forget(self, fname):
+		self.nbytes -= self.texts.pop(fname)[4]
+
+
+def get_text_best_encoding(fname, print_on_exception = False, encoding_cache = None):
+	'''Returns the text of the file named fname, read once and decoded with the
+best encoding for it (see decode_best_encoding).
+If encoding_cache (an EncodingCache) remembers fname's encoding, that is used
+without any detection; otherwise the detected encoding is added to it.
+If the file can't be read or decoded, raises an error, or prints a message and
+returns None if print_on_exception.'''
+	try:
+		if encoding_cache is None:
+			with open(fname,'rb') as f:
+				return decode_best_encoding(f.read())[0]
+		known = encoding_cache.get(fname)
+		text, encoding = _read_text(fname, known)
+	except (OSError, UnicodeError):
+		if not print_on_exception:
+			raise
+		print("Could not find the encoding for this file.")
+		return
+	if encoding != known:
+		encoding_cache.set(fname, encoding)
+	return text
+
+textTypeFiles = "\.(txt|py|ipynb|json|js|htm[l]?|css|[ct]sv|R|Rmd|sql|fwf|c|cpp|bat)$"
+
+grepParser = re.compile(("(?P<options>(?:-[a-z\d]+\s+)*)"
+						  "'(?P<regex>.+)' "
+						  "(?P<File_or_containing_directory>/.+)"))
+
+
+# per-line semantics can't be reproduced on the whole file text for regexes that
+# look at the start/end of the string or peek across the ends of a line
+# (\B is in here because it never matches an empty line)
+_no_whole_buffer = re.compile(r'\\[ABZ]|\(\?<?[=!]')
+# with -o, ^ and $ refer to the ends of each word
+_no_whole_buffer_o = re.compile(r'\\[ABZ]|\(\?<?[=!]|[$^]')
+
+
+class GrepMatcher:
+	'''The regex of a grep query, compiled once and reused for every line and
+file name the query looks at.
+regex: string, the regex.
+flags: re flags (e.g., re.I).
+o: bool. If True, a line matches only if some whitespace-separated word in it
+	is matched in its entirety, and a name matches only if it is matched in its
+	entirety.
+v: bool. If True, matching_lines yields the lines that DON'T match.
+
+Rather than splitting a file's text into lines and testing each one,
+matching_lines searches the whole text with one compiled regex (in MULTILINE
+mode, so ^ and $ still work per line) and maps the offsets of the matches back
+to line numbers, testing individual lines only to confirm matches that cross
+the end of a line.
+matching_lines_bytes does the same on the raw bytes of a file.
+	'''
+	def __init__(self, regex, flags = 0, o = False, v = False):
+		self.pattern = re.compile(regex, flags)
+		self.o = o
+		self.v = v
+		self.bytes_pattern = None
+		no_whole_buffer = _no_whole_buffer_o if o else _no_whole_buffer
+		self.whole_buffer = not v and no_whole_buffer.search(regex) is None
+		if self.whole_buffer:
+			if o:
+				# candidate words: matches with whitespace or nothing on either side
+				buffer_regex = '(?<!\\S)(?:' + regex + ')(?!\\S)'
+			else:
+				buffer_regex = regex
+			try:
+				self.buffer_pattern = re.compile(buffer_regex, flags | re.M)
+			except re.error: # e.g., global flags in the middle of buffer_regex
+				self.whole_buffer = False
+			# in the raw bytes, $ would have to match before the \r of a \r\n
+			if self.whole_buffer and buffer_regex.isascii() and '$' not in buffer_regex:
+				try:
+					self.bytes_pattern = re.compile(buffer_regex.encode(), (flags & re.I) | re.M)
+				except re.error: # e.g., (?u)
+					pass
+	
+	def line_matches(self, line):
+		'''True if the line satisfies the regex (ignoring v).'''
+		if self.o:
+			return any((self.pattern.fullmatch(x) is not None) for x in line.split())
+		return self.pattern.search(line) is not None
+	
+	def name_matches(self, fname):
+		'''True if the file or directory name satisfies the regex (ignoring v).'''
+		if self.o:
+			return self.pattern.fullmatch(fname) is not None
+		return self.pattern.search(fname) is not None
+	
+	def matching_lines(self, text):
+		'''Yields (line index, line) for each line of text that satisfies the
+query (including v).'''
+		if not self.whole_buffer:
+			for ind, line in enumerate(text.split('\n')):
+				if self.line_matches(line) ^ self.v:
+					yield ind, line
+			return
+		search = self.buffer_pattern.search
+		end = len(text)
+		pos = 0 # start of the line with index ind
+		ind = 0
+		while pos <= end:
+			match = search(text, pos)
+			if match is None:
+				return
+			start = match.start()
+			ind += text.count('\n', pos, start)
+			line_start = text.rfind('\n', pos, start) + 1 or pos
+			line_end = text.find('\n', start)
+			if line_end == -1:
+				line_end = end
+			line = text[line_start:line_end]
+			if (match.end() <= line_end and not self.o) or self.line_matches(line):
+				yield ind, line
+			# any other matches on this line don't matter
+			pos = line_end + 1
+			ind += 1
+	
+	def count_matching_lines(self, text):
+		'''The number of lines of text that satisfy the query (including v), i.e.
+how many lines matching_lines would yield, without slicing out the lines or
+counting the ones in between.'''
+		if not self.whole_buffer or self.o:
+			return sum(1 for match in self.matching_lines(text))
+		search = self.buffer_pattern.search
+		end = len(text)
+		pos = 0
+		count = 0
+		while pos <= end:
+			match = search(text, pos)
+			if match is None:
+				break
+			start = match.start()
+			line_end = text.find('\n', start)
+			if line_end == -1:
+				line_end = end
+			if (match.end() <= line_end
+					or self.line_matches(text[text.rfind('\n', pos, start) + 1 or pos:line_end])):
+				count += 1
+			pos = line_end + 1
+		return count
+	
+	def matching_lines_bytes(self, buf, encoding, start = 0):
+		'''Like matching_lines, but for buf, the raw bytes (e.g., an mmap.mmap) of
+text in an ASCII-compatible encoding, starting at offset start.
+Only lines that might match are decoded (with errors replaced); the rest of
+buf is never copied. If possible (see bytes_pattern), buf is searched with a
+bytes version of the regex. On bytes, . matches a single byte and \\w, \\s,
+etc. only match ASCII characters, so lines that only match because of
+non-ASCII characters can be missed; every line yielded does match.
+If there is no bytes_pattern (the regex isn't ASCII, contains $, or can't be
+searched for in the whole text at all), every line is decoded and tested in
+turn.'''
+		def get_line(line_start, line_end):
+			line = buf[line_start:line_end]
+			if line.endswith(b'\r'):
+				line = line[:-1]
+			return line.decode(encoding, 'replace')
+		end = len(buf)
+		pos = start # start of the line with index ind
+		ind = 0
+		if self.bytes_pattern is None or start > 0:
+			# ^ doesn't match at start, so test the first line by itself
+			while pos <= end:
+				line_end = buf.find(b'\n', pos)
+				if line_end == -1:
+					line_end = end
+				line = get_line(pos, line_end)
+				if self.line_matches(line) ^ self.v:
+					yield ind, line
+				pos = line_end + 1
+				ind += 1
+				if self.bytes_pattern is not None:
+					break
+			else:
+				return
+		search = self.bytes_pattern.search
+		while pos <= end:
+			match = search(buf, pos)
+			if match is None:
+				return
+			match_start = match.start()
+			ind += _count_newlines(buf, pos, match_start)
+			line_start = buf.rfind(b'\n', pos, match_start) + 1 or pos
+			line_end = buf.find(b'\n', match_start)
+			if line_end == -1:
+				line_end = end
+			line = get_line(line_start, line_end)
+			if self.line_matches(line):
+				yield ind, line
+			pos = line_end + 1
+			ind += 1
+
+
+class MultiMatcher:
+	'''The GrepMatchers of several queries (see multiGrep), for searching a
+text that has been read and decoded once for all of them.
+matching_lines yields (line index, line, index in matchers of the query) for
+each line that satisfies each query, all of the first query's lines first.
+
+Each regex still makes its own pass over the text. Combining them into one
+alternation with a named group for each, (?P<p0>regex0)|(?P<p1>regex1)|...,
+doesn't make that any cheaper with the re module: it can't use its fast
+literal search on an alternation, so the combined pass is slower than all the
+separate ones together, and every line it finds still has to be tested
+against each regex to see which ones it satisfies.
+	'''
+	def __init__(self, matchers):
+		self.matchers = list(matchers)
+	
+	def matching_lines(self, text):
+		'''Yields (line index, line, query index) for each line of text and each
+query it satisfies.'''
+		for k, matcher in enumerate(self.matchers):
+			for ind, line in matcher.matching_lines(text):
+				yield ind, line, k
+	
+	def matching_lines_bytes(self, buf, encoding, start = 0):
+		'''Like matching_lines, but for buf, the raw bytes (e.g., an mmap.mmap)
+of text in an ASCII-compatible encoding, starting at offset start (see
+GrepMatcher.matching_lines_bytes).'''
+		for k, matcher in enumerate(self.matchers):
+			for ind, line in matcher.matching_lines_bytes(buf, encoding, start):
+				yield ind, line, k
+
+
+def _count_newlines(buf, start, end, chunk = 1 << 20):
+	'''Counts the newlines in buf[start:end] a chunk at a time, so that buf can
+be an mmap.mmap without the whole range being copied.'''
+	count = 0
+	for ii in range(start, end, chunk):
+		count += buf[ii:min(ii + chunk, end)].count(b'\n')
+	return count
+
+
+def _ascii_compatible(encoding):
+	'''True if encoding is UTF-8 or a single-byte encoding in which every ASCII
+byte means its ASCII character, so that bytes regexes and newline searches
+can be run on the raw bytes.'''
+	try:
+		if codecs.lookup(encoding).name in ('utf-8', 'utf-8-sig'):
+			return True
+		ascii = bytes(range(128))
+		return (ascii.decode(encoding) == ascii.decode('ascii')
+				and len(bytes(range(256)).decode(encoding, 'replace')) == 256)
+	except (LookupError, UnicodeError):
+		return False
+
+MMAP_MIN_SIZE = 1 << 20 # bytes; smaller files are cheaper to just read
+
+
+def _want(options):
+	'''What a search with these options needs from each file it reads: 'first'
+(just its first matching line, for -l), 'count' (just how many lines match,
+for -c), or None (every matching line).'''
+	if 'h' in options:
+		return None
+	if 'l' in options:
+		return 'first'
+	if 'c' in options:
+		return 'count'
+	return None
+
+
+def _matching(lines, want):
+	'''What _grep_file returns for lines, an iterator of the (line index, line)
+tuples for the lines of a file that satisfy a query: a list of them, a list
+of just the first one if want is 'first' (the rest are never looked for), or
+how many there are if want is 'count'.'''
+	if want == 'count':
+		return sum(1 for line in lines)
+	if want == 'first':
+		return list(itertools.islice(lines, 1))
+	return list(lines)
+
+
+def _matching_text(matcher, text, want, stats = None):
+	'''_matching for the lines of text. The search is added to stats (a
+SearchStats) if that's given.'''
+	if stats is not None:
+		start = time.perf_counter()
+	if want == 'count':
+		matches = matcher.count_matching_lines(text)
+	else:
+		matches = _matching(matcher.matching_lines(text), want)
+	if stats is not None:
+		if want == 'first' and matches:
+			lines = matches[0][0] + 1
+		else:
+			lines = text.count('\n') + 1
+		_searched(stats, matches, start, lines)
+	return matches
+
+
+def _searched(stats, matches, start, lines = 0):
+	'''Adds the search of a file that started at time.perf_counter() start, went
+through lines lines, and found matches (as returned by _matching) to stats.'''
+	stats.match_seconds += time.perf_counter() - start
+	stats.files_searched += 1
+	stats.lines_searched += lines
+	stats.matches += matches if isinstance(matches, int) else len(matches)
+
+FIRST_MATCH_CHUNK = 1 << 18 # bytes; -l reads bigger files this much at a time
+
+
+def _grep_first(file, matcher, encoding = None, chunk = FIRST_MATCH_CHUNK):
+	'''Searches the file for its first line that satisfies the query (for -l),
+reading and decoding it chunk bytes at a time, so that nothing after the
+chunk with that line is ever read. Files no bigger than chunk are just read.
+Returns ([(line index, line)] or [], encoding), or None if the file turned out
+not to be in the encoding (the one given, or else the one detected from its
+start) before a matching line was found, in which case it has to be read
+normally. A file that would only have failed to decode after its first match
+is still reported as matching.'''
+	chunk = max(chunk, SAMPLE_SIZE + 1)
+	with open(file, 'rb') as f:
+		data = f.read(chunk)
+		if len(data) < chunk: # that's the whole file
+			text, encoding = _decode_text(data, encoding)
+			return _matching(matcher.matching_lines(text), 'first'), encoding
+		if encoding is None:
+			encoding = detect_encoding(data[:SAMPLE_SIZE + 1])
+			if encoding is None:
+				return None
+		decoder = codecs.getincrementaldecoder(encoding)()
+		carry = '' # the start of a line that continues in the next chunk
+		ind = 0 # index of the first line of text
+		while True:
+			final = len(data) < chunk
+			try:
+				text = carry + decoder.decode(data, final)
+			except (UnicodeError, ValueError):
+				return None
+			if final:
+				carry = ''
+			else:
+				# a \r at the end might be the start of a \r\n
+				body_end = len(text) - text.endswith('\r')
+				cut = max(text.rfind('\n', 0, body_end), text.rfind('\r', 0, body_end))
+				if cut == -1: # no complete line yet
+					carry = text
+					data = f.read(chunk)
+					continue
+				carry = text[cut+1:]
+				if text.startswith('\r\n', cut - 1):
+					cut -= 1
+				text = text[:cut]
+			text = _normalize_newlines(text)
+			for line_ind, line in matcher.matching_lines(text):
+				return [(ind + line_ind, line)], encoding
+			if final:
+				return [], encoding
+			ind += text.count('\n') + 1
+			data = f.read(chunk)
+
+
+def _grep_mmap(file, matcher, encoding = None, want = None):
+	'''Searches the file through a read-only memory map, without ever holding
+its whole text in memory (see GrepMatcher.matching_lines_bytes).
+Returns (_matching(the matching lines, want), encoding), or None if the file's
+encoding isn't ASCII-compatible, in which case it has to be read normally.'''
+	with open(file, 'rb') as f, mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as mm:
+		if encoding is None:
+			# one byte more than the sample tells the decoders the sample isn't all
+			encoding = detect_encoding(mm[:SAMPLE_SIZE + 1])
+		if encoding is None or not _ascii_compatible(encoding):
+			return None
+		start = 0
+		if codecs.lookup(encoding).name == 'utf-8-sig' and mm[:3] == codecs.BOM_UTF8:
+			start = 3
+		return _matching(matcher.matching_lines_bytes(mm, encoding, start), want), encoding
+
+
+def _grep_file(args):
+	'''Worker used by grep to search a single text file.
+args is a tuple (file, matcher, encoding, mmap_min_size, want, stats) so that
+this can be mapped over a process pool; encoding is the file's encoding if it
+is already known, else None. Files of at least mmap_min_size bytes (if it's
+not None) are searched through a memory map if their encoding allows (see
+_grep_mmap). If want is 'first', the file is read only up to its first
+matching line (see _grep_first). stats is a SearchStats to add the search of
+this file to, or None.
+Returns (list of (line index, line) tuples for the lines that satisfy the
+query (see _matching for what want changes), the encoding the file was
+decoded with, stats).'''
+	file, matcher, encoding, mmap_min_size, want, stats = args
+	try:
+		if stats is not None:
+			start = time.perf_counter()
+		if mmap_min_size is not None and os.path.getsize(file) >= max(mmap_min_size, 1):
+			result = _grep_mmap(file, matcher, encoding, want)
+			if result is not None:
+				if stats is not None:
+					_searched(stats, result[0], start)
+				return result + (stats,)
+		# (_grep_first just reads small files whole, which is timed better below)
+		if want == 'first' and (stats is None or os.path.getsize(file) >= FIRST_MATCH_CHUNK):
+			result = _grep_first(file, matcher, encoding)
+			if result is not None:
+				if stats is not None:
+					_searched(stats, result[0], start, result[0][0][0] + 1 if result[0] else 0)
+				return result + (stats,)
+		text, encoding = _read_text(file, encoding, stats)
+	except (OSError, UnicodeError):
+		print("Could not find the encoding for this file.")
+		if stats is not None:
+			stats.files_unreadable += 1
+		return _matching(iter(()), want), None, stats
+	return _matching_text(matcher, text, want, stats), encoding, stats
+
+
+def _grep_files(files, matcher, workers = None, encoding_cache = None, mmap_min_size = None,
+				file_cache = None, want = None, stats = None):
+	'''Searches each file in files, serially if workers is None or 1, otherwise
+by fanning the files out over a process pool with that many workers.
+Yields (file, list of (line index, line) tuples) in the same order as files,
+whichever way the files were searched. Serial searches read each file only
+when the next result is asked for.
+If encoding_cache (an EncodingCache) is given, the files it knows the encodings
+of are decoded without detection, and it learns the encodings of the others.
+mmap_min_size and want are passed to _grep_file; with want 'count', a count
+of matching lines takes the place of each list.
+A serial search without mmap_min_size reads the files through file_cache
+(a FileCache) if that's given.
+If stats (a SearchStats) is given, the search of each file is added to it.'''
+	def known_encoding(file):
+		return None if encoding_cache is None else encoding_cache.get(file)
+	def learn(task, result):
+		if encoding_cache is not None and result[1] not in (None, task[2]):
+			encoding_cache.set(task[0], result[1])
+		if stats is not None and result[2] is not stats: # from a worker process
+			stats.merge(result[2])
+		return task[0], result[0]
+	if not workers or workers == 1:
+		for file in files:
+			task = (file, matcher, known_encoding(file), mmap_min_size, want, stats)
+			if file_cache is None or mmap_min_size is not None:
+				yield learn(task, _grep_file(task))
+				continue
+			try:
+				text, encoding = file_cache.read_text(file, task[2], stats)
+			except (OSError, UnicodeError):
+				print("Could not find the encoding for this file.")
+				if stats is not None:
+					stats.files_unreadable += 1
+				yield file, _matching(iter(()), want)
+				continue
+			yield learn(task, (_matching_text(matcher, text, want, stats), encoding, stats))
+		return
+	tasks = [(file, matcher, known_encoding(file), mmap_min_size, want,
+			  None if stats is None else SearchStats()) for file in files]
+	# big chunks amortize the cost of pickling; small ones keep workers busy
+	chunksize = max(1, len(tasks) // (workers * 8))
+	from concurrent.futures import ProcessPoolExecutor
+	executor = ProcessPoolExecutor(workers)
+	try:
+		for task, result in zip(tasks, executor.map(_grep_file, tasks, chunksize = chunksize)):
+			yield learn(task, result)
+	finally:
+		# if the caller stopped early, don't wait for the files nobody wants
+		executor.shutdown(cancel_futures = True)
+
+
+def _parse_options(Input):
+	'''Returns the list of options (without their leading '-') at the start of
+a grep query.'''
+	optstring = re.match("(?:-[a-z\d]+(?:\s+|$))*", Input.strip())[0]
+	return list(map(lambda x: x.lower().strip(),
+					filter(lambda x: len(x)>0,
+						   re.split("(?:\s+|^)-",optstring)
+						   )))
+
+
+def _parse_query(Input):
+	'''Splits a (non-piped) grep query into (options, regex, absolute path).'''
+	parsedInput = re.findall(grepParser, Input.strip())[0]
+	options = _parse_options(parsedInput[0])
+	#split the options substring into letters, convert to lower-case
+	regex = parsedInput[1]
+	dirName = os.path.abspath(str.join("\\", parsedInput[2].split('/')[1:]))
+	return options, regex, dirName
+
+
+def _scandir(dirName):
+	'''The list of os.DirEntry objects for the things in the directory
+dirName, or [] if it can't be listed.'''
+	try:
+		with os.scandir(dirName) as it:
+			return list(it)
+	except OSError:
+		return []
+
+
+def _is_dir(entry):
+	'''entry.is_dir(), but False if that fails, like os.path.isdir.'''
+	try:
+		return entry.is_dir()
+	except OSError:
+		return False
+
+
+def _is_symlink(entry):
+	'''entry.is_symlink(), but False if that fails, like os.path.islink.'''
+	try:
+		return entry.is_symlink()
+	except OSError:
+		return False
+
+
+def _walk(top, file_cache = None, ignore = None):
+	'''os.walk(top) (top-down, not following symbolic links, skipping the
+directories that can't be listed), but yields (dirpath, dirs, nondirs) where
+dirs and nondirs are lists of os.DirEntry objects rather than names.
+A DirEntry knows whether it's a directory without a system call (on most
+platforms), and remembers its stat result once asked for it.
+If file_cache (a FileCache) is given, the directories are listed through it.
+If ignore (an ignore_rules.IgnoreRules) is given, the files and directories
+it ignores are left out, and the ignored directories are never listed.'''
+	scandir = _scandir if file_cache is None else file_cache.scandir
+	stack = [(top, None if ignore is None else ignore.root_rules(top))]
+	while stack:
+		top, rules = stack.pop()
+		listing = scandir(top)
+		if ignore is not None:
+			rules = ignore.dir_rules(top, {entry.name for entry in listing}, rules)
+		dirs, nondirs = [], []
+		for entry in listing:
+			is_dir = _is_dir(entry)
+			if ignore is None or not ignore.ignores(entry.path, is_dir, rules):
+				(dirs if is_dir else nondirs).append(entry)
+		yield top, dirs, nondirs
+		for entry in reversed(dirs):
+			if not _is_symlink(entry):
+				stack.append((entry.path, rules))
+
+
+def _listing(dirName, file_cache = None, ignore = None):
+	'''The os.DirEntry objects for the things directly inside dirName (through
+file_cache if given) that ignore (if given) doesn't ignore.'''
+	listing = (_scandir if file_cache is None else file_cache.scandir)(dirName)
+	if ignore is None:
+		return listing
+	rules = ignore.dir_rules(dirName, {entry.name for entry in listing}, ignore.root_rules(dirName))
+	return [entry for entry in listing if not ignore.ignores(entry.path, _is_dir(entry), rules)]
+
+
+def _is_binary(file):
+	'''ignore_rules.is_binary, imported only by the searches that need it.'''
+	from ignore_rules import is_binary
+	return is_binary(file)
+
+
+def _list_files(dirName, r, entries = None, file_cache = None, ignore = None, stats = None):
+	'''Yields the files to consider for a search of directory dirName:
+every file in the tree (as full paths) if r, otherwise just the names of the
+things directly inside dirName.
+If entries is a dict, it maps the full path of each file yielded to its
+os.DirEntry. Directories are listed through file_cache if it's given, and
+what ignore (an ignore_rules.IgnoreRules) ignores is left out. The directories
+and files are counted in stats (a SearchStats) if it's given.'''
+	if r:
+		for root, dirs, files in _walk(dirName, file_cache, ignore):
+			if stats is not None:
+				stats.dirs_walked += 1
+			for entry in files:
+				if entry.name != EncodingCache.FILENAME:
+					if stats is not None:
+						stats.files_walked += 1
+					if entries is not None:
+						entries[entry.path] = entry
+					yield entry.path
+	else:
+		if stats is not None:
+			stats.dirs_walked += 1
+		for entry in _listing(dirName, file_cache, ignore):
+			if entry.name != EncodingCache.FILENAME:
+				if stats is not None and not _is_dir(entry):
+					stats.files_walked += 1
+				if entries is not None:
+					entries[entry.path] = entry
+				yield entry.name
+
+
+def igrep(Input, workers = None, encoding_cache = None, index = None, entries = None,
+		  file_cache = None, ignore = None, stats = None):
+	"""Generator version of grep, taking the same queries.
+Rather than building the whole resultset, yields (file, line index, line)
+for each matching line as soon as it is found, so you can start using the
+results (or stop the search) before every file has been read.
+With the -f, -a, and -d options, nothing is read from the files (except with
+-g -f -a, which has to look at the start of each file to skip binaries), and
+this yields (file or directory name, None, None) for each match.
+What the options of the query need decides how much of each file is looked
+at: with -l (and not -h), only the first matching line of each file is
+found and yielded, and the rest of the file isn't searched, or (if it's big)
+even read; with -c (and not -h or -l), the matching lines are only counted,
+and this yields (file, None, None) for each of them.
+The -h and -n options don't change what this yields.
+See grep for the query format and the options.
+	"""
+	if ' -}} ' in Input:
+		greps = [x.strip() for x in Input.split(' -}} ')]
+		yield from _isubGrep(greps, workers, encoding_cache, index, entries, file_cache, ignore,
+							 stats)
+		return
+	
+	options, regex, dirName = _parse_query(Input)
+	
+	#print(options,regex,dirName)
+	
+	if encoding_cache is True:
+		root = os.path.dirname(dirName) if os.path.isfile(dirName) else dirName
+		encoding_cache = EncodingCache.for_root(root)
+		try:
+			yield from _igrep(options, regex, dirName, workers, encoding_cache, index, entries,
+							  file_cache, ignore, stats)
+		finally:
+			encoding_cache.save()
+	else:
+		yield from _igrep(options, regex, dirName, workers, encoding_cache, index, entries,
+							  file_cache, ignore, stats)
+
+
+def _search_settings(options, workers, ignore):
+	'''Returns (workers, mmap_min_size, ignore) for a search with these options,
+given the workers and ignore arguments of grep.'''
+	mmap_min_size = MMAP_MIN_SIZE if 'b' in options else None
+	if ignore is None and 'g' in options:
+		ignore = True
+	if ignore is True:
+		from ignore_rules import IgnoreRules
+		ignore = IgnoreRules()
+	if workers is None:
+		for opt in options:
+			j = re.fullmatch('j(\d*)', opt)
+			if j:
+				workers = int(j[1]) if j[1] else os.cpu_count()
+	return workers, mmap_min_size, ignore
+
+
+def _igrep(options, regex, dirName, workers, encoding_cache, index, entries = None,
+		   file_cache = None, ignore = None, stats = None):
+	'''igrep for a single parsed query.'''
+	i = ('i' in options)
+	v = ('v' in options)
+	d = ('d' in options)
+	o = ('o' in options)
+	r = ('r' in options)
+	f = ('f' in options)
+	a = ('a' in options)
+	workers, mmap_min_size, ignore = _search_settings(options, workers, ignore)
+	matcher = GrepMatcher(regex, re.I if i else 0, o, v)
+	f_goodness_condition = matcher.name_matches
+	
+	if os.path.isfile(dirName):
+		if d:
+			return
+		if f:
+			if f_goodness_condition(dirName) ^ v:
+				if stats is not None:
+					stats.matches += 1
+				yield dirName, None, None
+			return
+		if ignore is not None and ignore.skip_binary and _is_binary(dirName):
+			_skipped(stats)
+			return
+		yield from _results(_grep_files([dirName], matcher, None, encoding_cache, mmap_min_size,
+										file_cache, _want(options), stats), _want(options))
+		return
+	
+	if d:
+		if r:
+			dirs = (entry for root, dirs, files in _walk(dirName, file_cache, ignore)
+					if _walked(stats) for entry in dirs)
+		else:
+			_walked(stats)
+			dirs = (entry for entry in _listing(dirName, file_cache, ignore) if _is_dir(entry))
+		if stats is not None:
+			dirs = _timed(dirs, stats)
+		for entry in dirs:
+			if f_goodness_condition(entry.path) ^ v: #hooray for XOR!!
+				if entries is not None:
+					entries[entry.path] = entry
+				if stats is not None:
+					stats.matches += 1
+				yield entry.path, None, None
+		if f_goodness_condition(dirName) ^ v:
+			if stats is not None:
+				stats.matches += 1
+			yield dirName, None, None #need to consider the starting dir too
+		return
+	
+	if f:
+		# only -a has to open the files, to leave out binaries (text-type files
+		# are taken to be text)
+		sniff = a and ignore is not None and ignore.skip_binary
+		fnames = _list_files(dirName, r, entries, file_cache, ignore, stats)
+		if stats is not None:
+			fnames = _timed(fnames, stats)
+		for fname in fnames:
+			if (a or re.search(textTypeFiles, fname)) and f_goodness_condition(fname) ^ v:
+				file = os.path.join(dirName,fname)
+				if not (sniff and _is_binary(file)):
+					if stats is not None:
+						stats.matches += 1
+					yield file, None, None
+		return
+	
+	textFiles = _text_files(dirName, r, None if v else [(regex, matcher.pattern.flags)], index,
+							entries, file_cache, ignore, stats)
+	if stats is not None:
+		textFiles = _timed(textFiles, stats)
+	yield from _results(_grep_files(textFiles, matcher, workers, encoding_cache, mmap_min_size,
+									file_cache, _want(options), stats), _want(options))
+
+
+def _results(searched, want):
+	'''Yields igrep's (file, line index, line) tuples for what _grep_files
+yields. With want 'count', there's (file, None, None) for each matching line.'''
+	for file, matches in searched:
+		if want == 'count':
+			counted = (file, None, None)
+			for ii in range(matches):
+				yield counted
+		else:
+			for ind, line in matches:
+				yield file, ind, line
+
+
+def _candidates(index, queries):
+	'''The union of index.candidates for each (regex, flags) in queries, or None
+if the index can't rule out any files for one of them.'''
+	found = set()
+	for regex, flags in queries:
+		candidates = index.candidates(regex, flags)
+		if candidates is None:
+			return None
+		found |= candidates
+	return found
+
+
+def _text_files(dirName, r, queries, index = None, entries = None, file_cache = None,
+				ignore = None, stats = None):
+	'''Yields the full paths of the text-type files a search of the directory
+dirName reads, in the order they're searched.
+queries: a list of the (regex, flags) being searched for, used to skip the
+	files that index says can't match any of them, or None to read every file
+	(e.g., for -v).
+index, entries, file_cache, ignore and stats are as for grep.'''
+	candidates = None
+	if ignore is None and index is not None and index.covers(dirName):
+		index.update()
+		candidates = None if queries is None else _candidates(index, queries)
+		files = index.files_under(dirName, r) # all text-type files
+		if stats is not None:
+			files = _counted(files, stats)
+	else:
+		if index is not None and index.covers(dirName) and queries is not None:
+			# the index doesn't know what's ignored, so walk and use it to skip files
+			index.update()
+			candidates = _candidates(index, queries)
+		files = (os.path.join(dirName,fname) for fname in _list_files(dirName, r, entries, file_cache,
+																	   ignore, stats)
+				 if re.search(textTypeFiles, fname) or _skipped(stats))
+	sniff = ignore is not None and ignore.skip_binary
+	for file in files:
+		if ((candidates is None or file in candidates) and not (sniff and _is_binary(file))
+				or _skipped(stats)):
+			yield file
+
+
+def _walked(stats):
+	'''Counts a directory in stats.dirs_walked (if stats isn't None). Returns True.'''
+	if stats is not None:
+		stats.dirs_walked += 1
+	return True
+
+
+def _counted(files, stats):
+	'''Yields the files, counting them in stats.files_walked.'''
+	for file in files:
+		stats.files_walked += 1
+		yield file
+
+
+def _skipped(stats):
+	'''Counts a file in stats.files_skipped (if stats isn't None). Returns False,
+so that "keep(file) or _skipped(stats)" counts the files that aren't kept.'''
+	if stats is not None:
+		stats.files_skipped += 1
+	return False
+
+
+def _collect(results, options, limit = None):
+	'''Arranges the (file, line index, line) tuples yielded by igrep into
+whatever grep returns for these options.
+If limit is not None, stops pulling results from igrep as soon as there are
+limit files (when returning a dict) or limit elements (when returning a list).'''
+	d = ('d' in options)
+	f = ('f' in options)
+	c = ('c' in options)
+	h = ('h' in options)
+	n = ('n' in options)
+	l = ('l' in options)
+	as_list = d or f or h or l
+	out = [] if as_list else {}
+	if limit is not None and limit <= 0:
+		return out
+	lastfile = None
+	ind_in_file = 0
+	for file, ind, line in results:
+		if d or f:
+			out.append(file)
+		elif as_list and not h: # -l
+			if file != lastfile:
+				out.append(file)
+		elif h:
+			ind_in_file = ind_in_file + 1 if file == lastfile else 0
+			out.append((ind_in_file, line) if n else line)
+		else:
+			if file not in out:
+				if limit is not None and len(out) == limit:
+					break
+				out[file] = 0 if c else []
+			if c:
+				out[file] += 1
+			elif n:
+				out[file].append((ind, line))
+			else:
+				out[file].append(line)
+		lastfile = file
+		if as_list and limit is not None and len(out) == limit:
+			break
+	if isinstance(results, types.GeneratorType):
+		results.close()
+	return out
+
+
+def grep(Input, workers = None, limit = None, encoding_cache = None, index = None,
+		 entries = None, file_cache = None, ignore = None, stats = None):
+	"""The grep filter searches a .txt file for a particular pattern of characters,
+and displays all lines that contain that pattern. The pattern that is searched
+in the file is referred to as the regular expression
+(grep stands for globally search for regular expression and print out).
+grep has an "options" attribute so you can see the options you can use.
+
+Format for Input:
+[options] 'pattern' /[filename or containing directory]
+
+Alternative format for input:
+[options 1] '[pattern 1]' /[containing dir] -}} [options 2] '[pattern 2]'
+	( -}} ... -}} [options n] '[pattern n]')?
+	If the command is in this alternative format, finds the set of files in
+	[containing dir] that satisfy the first query, then uses each query
+	between the first and the last to refine the set of files, and returns
+	the results of the final query.
+	See subGrep.
+
+Input can also be a list of queries for different patterns in the same file
+or directory, e.g. ["-r -c 'meat' /delicious", "-r -l 'tofu' /delicious"].
+	Every file is then read just once for all of them, and a list of their
+	resultsets is returned. See multiGrep.
+
+By default, returns a dict mapping filenames to a list of lines in that file
+	where the regex is matched. Some options change the return type.
+
+IMPORTANT: You NEED to have exactly one space between the options block and
+the pattern block, the pattern block MUST be enclosed by '', there MUST
+be exactly one space between the pattern block and the filename block, and
+the filename block must be preceded by /.
+
+Options Description
+-f : Searches only the filenames of text-type files for matches to the regex. 
+	(returns list)
+-a : Special case of -f. Matches regex in filenames of all files, not just 
+	text-type files.
+-b : Big files. Files of at least MMAP_MIN_SIZE bytes in UTF-8 or a single-byte
+	encoding are memory-mapped and searched as bytes, so only the matching
+	lines are ever decoded and memory use doesn't grow with the file size.
+	On bytes, . matches one byte and \w, \s etc. only match ASCII, so
+	matches that depend on non-ASCII characters may be missed.
+	(does not affect return type)
+-c : This prints only a count of the lines that match a pattern 
+	(returns dict)
+-h : Display the matched lines, but do not display the filenames. 
+	(returns list)
+-i : case-insensitive match
+	(does not affect return type)
+-l : Displays list of a filenames only. 
+	(returns list)
+-n : Display the matched lines and their line numbers. 
+	(returns dict mapping to tuples)
+-v : Matches all the lines that DO NOT match the pattern
+	(does not affect return type)
+-o : Match whole word or filename. For filenames, matches only the part
+	of the filename that is not in the parent directory name (so any subdir
+	name plus the file name in the -r case or just the filename otherwise).
+-d : Searches only directory names for matches to the regex.
+	(returns list)
+-r : Recursively searches through the entire directory tree beneath a given
+	directory (all subdirectories within that directory as well as the 
+	directory itself)
+	(does not affect return type)
+-g : Skips what a .gitignore or .ignore file says to, version control
+	directories (.git etc.), virtualenvs, and binary files (those with a NUL
+	byte in their first KB), like ripgrep. Ignored directories are not
+	walked into. See ignore_rules.
+	With -f, only -a has to sniff the files for binaries.
+	(does not affect return type)
+-j[N] : Reads and searches files in parallel using a pool of N worker processes
+	(e.g., -j4). With no N, uses one worker per CPU. Results come back in
+	the same order as a serial search.
+	(does not affect return type)
+
+workers: int or None. Number of worker processes to search files with.
+	If not None, overrides the -j option.
+limit: int or None. If not None, stop searching once the resultset has limit
+	files (for dict resultsets) or limit elements (for list resultsets).
+encoding_cache: an EncodingCache, True, or None. If not None, the encodings of
+	the files searched are remembered in (and, for files that haven't changed,
+	taken from) this cache instead of being detected every time.
+	True means the cache saved in the directory searched (see
+	EncodingCache.for_root), which is then updated on disk after the search.
+index: a trigram_index.TrigramIndex or None. If the directory searched is
+	covered by the index, the index is updated and then used to skip the
+	files that can't contain a match, rather than reading every file.
+entries: a dict or None. If a dict, the search adds to it the os.DirEntry
+	of every file and directory it found while walking the directory
+	tree, keyed by full path. A DirEntry's is_dir() needs no system call
+	on most platforms, and its stat() at most one (none on Windows), which
+	is cached, so e.g. sorting the results by size or modification time
+	through entries never stats a file twice.
+file_cache: a FileCache or None. If not None, directory listings and the
+	text of the files searched are taken from (and kept in) this cache,
+	so that searching the same files again only re-reads what changed.
+	Not used by -j searches, or for reading files with -b.
+ignore: an ignore_rules.IgnoreRules, True, or None. If not None, the search
+	skips what it ignores, as with -g (which is the same as True, the default
+	IgnoreRules()). Use an IgnoreRules to add exclude globs, e.g.
+	IgnoreRules(excludes = ['*.min.js', 'build/']).
+stats: a SearchStats or None. If not None, the counts and times of the phases
+	of the search (walking, reading, decoding and matching) are added to it.
+	Print it for a report of where the time went.
+	"""
+	if not isinstance(Input, str):
+		return multiGrep(Input, workers, limit, encoding_cache, index, entries, file_cache, ignore,
+						 stats)
+	if ' -}} ' in Input:
+		greps = [x.strip() for x in Input.split(' -}} ')]
+		return subGrep(greps, workers, limit, encoding_cache, index, entries, file_cache, ignore,
+					   stats)
+	return _collect(igrep(Input, workers, encoding_cache, index, entries, file_cache, ignore,
+						  stats), _parse_options(Input), limit)
+
+grep.options = ('-a(ll file types)',
+ '-b(ig files: search memory-mapped bytes)',
+ '-c(ount occurrences of pattern)',
+ '-d(irectories only)',
+ '-f(ilenames and directories only)',
+ '-g (skip ignored, VCS, virtualenv and binary files)',
+ '-h (display lines, not files)',
+ '-i (case insensitive)',
+ '-j[N] (search files in parallel with N worker processes)',
+ '-l (list filenames)',
+ '-n (line Numbers only)',
+ '-o (match only entire words)',
+ '-r(ecursive search)',
+ '-v (display only things that DON\'T match)')
+
+stageParser = re.compile("(?P<options>(?:-[a-z\d]+\s+)*)'(?P<regex>.+)'")
+
+
+class _PipeStage:
+	'''A query after the first one in a -}} pipeline ("[options] 'pattern'"),
+parsed and compiled once for all the files that reach it.'''
+	def __init__(self, query):
+		optstring, self.regex = re.findall(stageParser, query.strip())[0]
+		self.options = _parse_options(optstring)
+		self.d = ('d' in self.options)
+		self.f = ('f' in self.options)
+		self.v = ('v' in self.options)
+		self.want = _want(self.options)
+		self.matcher = GrepMatcher(self.regex, re.I if 'i' in self.options else 0,
+								   'o' in self.options, self.v)
+
+
+def _pipe(path, stages, encoding_cache = None, entries = None, file_cache = None,
+		  ignore = None, stats = None, done = None):
+	'''Runs path (a result of the previous stage) through the rest of the
+pipeline stages, yielding what igrep would yield for the last stage.
+A file is dropped by the first stage it doesn't satisfy; its text is read
+at most once, however many stages look at it. A directory (from a -d
+stage) is searched by the next stage like any directory, and the results of
+that search go through the remaining stages.
+entries, file_cache, ignore and stats are as for grep; the entries already in
+entries save a system call here.
+done: a set or None. If a set, the files the last stage has already yielded
+results for (which are added to it) are skipped, so that a file reached again
+through overlapping directories isn't counted twice.'''
+	entry = None if entries is None else entries.get(path)
+	if os.path.isdir(path) if entry is None else _is_dir(entry):
+		stage = stages[0]
+		results = _igrep(stage.options, stage.regex, path, None, encoding_cache, None, entries,
+						 file_cache, ignore, stats)
+		if len(stages) == 1:
+			yield from results if done is None else _unseen(results, done)
+			return
+		lastpath = None
+		for newpath, ind, line in results:
+			if newpath != lastpath:
+				yield from _pipe(newpath, stages[1:], encoding_cache, entries, file_cache, ignore,
+								 stats, done)
+			lastpath = newpath
+		return
+	if done is not None and path in done:
+		return
+	text = None
+	for ii, stage in enumerate(stages):
+		last = (ii == len(stages) - 1)
+		if stage.d: # a file has no directories in it
+			return
+		if stage.f:
+			if not (stage.matcher.name_matches(path) ^ stage.v):
+				return
+			if last:
+				if done is not None:
+					done.add(path)
+				yield path, None, None
+			continue
+		if text is None:
+			known = None if encoding_cache is None else encoding_cache.get(path)
+			try:
+				if file_cache is None:
+					text, encoding = _read_text(path, known, stats)
+				else:
+					text, encoding = file_cache.read_text(path, known, stats)
+			except (OSError, UnicodeError):
+				print("Could not find the encoding for this file.")
+				if stats is not None:
+					stats.files_unreadable += 1
+				return
+			if encoding_cache is not None and encoding != known:
+				encoding_cache.set(path, encoding)
+		if last:
+			if done is not None:
+				done.add(path)
+			yield from _results([(path, _matching_text(stage.matcher, text, stage.want, stats))],
+								stage.want)
+		elif next(stage.matcher.matching_lines(text), None) is None: # one matching line is enough
+			return
+
+
+def _unseen(results, done):
+	'''Yields the (file, line index, line) results for the files not in the set
+done, adding them to it.'''
+	lastfile = None
+	for result in results:
+		if result[0] != lastfile:
+			lastfile = result[0]
+			seen = lastfile in done
+			done.add(lastfile)
+		if not seen:
+			yield result
+
+
+def _isubGrep(greps, workers = None, encoding_cache = None, index = None, entries = None,
+			  file_cache = None, ignore = None, stats = None):
+	'''Generator behind subGrep; yields what igrep yields for the last query.
+Every query is parsed and compiled just once, and each result of the first
+query goes through all the other queries before the next one is looked at.
+When the last query returns a dict (see grep), each file's results are
+yielded only once, even if overlapping directories reach it more than once.'''
+	owns_cache = encoding_cache is True
+	if owns_cache:
+		dirName = _parse_query(greps[0])[2]
+		root = os.path.dirname(dirName) if os.path.isfile(dirName) else dirName
+		encoding_cache = EncodingCache.for_root(root)
+	try:
+		stages = [_PipeStage(Grep) for Grep in greps[1:]]
+		done = None if any(o in stages[-1].options for o in 'dfhl') else set()
+		lastpath = None
+		for path, ind, line in igrep(greps[0], workers, encoding_cache, index, entries,
+									 file_cache, ignore, stats):
+			if path != lastpath:
+				yield from _pipe(path, stages, encoding_cache, entries, file_cache, ignore, stats,
+								 done)
+			lastpath = path
+	finally:
+		if owns_cache:
+			encoding_cache.save()
+
+
+def subGrep(greps, workers = None, limit = None, encoding_cache = None, index = None,
+			entries = None, file_cache = None, ignore = None, stats = None):
+	'''Iterates through the grep queries in greps. Generates a set of files
+with the first grep query.
+Uses each grep query between the first and the last to iteratively refine 
+this result set, and returns the union of results from the last query made
+on the result set generated by the penultimate query.
+The queries after the first are written without a file or directory, e.g.
+["-r -f 'zebra' /delicious", "-i 'meat'", "-c 'tofu'"].
+workers is passed to grep for the first query, which searches the whole
+directory. limit, encoding_cache, index, entries, file_cache, ignore and stats
+work as in grep.
+	'''
+	return _collect(_isubGrep(greps, workers, encoding_cache, index, entries, file_cache, ignore,
+							  stats), _parse_options(greps[-1]), limit)
+
+
+def multiGrep(queries, workers = None, limit = None, encoding_cache = None, index = None,
+			  entries = None, file_cache = None, ignore = None, stats = None):
+	'''Runs several grep queries for different patterns over the same file or
+directory in one walk, reading and decoding each file just once for all the
+patterns (see MultiMatcher).
+Returns a list with what grep would return for each query, in order, e.g.
+>>> multiGrep(["-r -c 'zebra' /delicious", "-r -n 'meat' /delicious", "-r -l 'tofu' /delicious"])
+[{file: count, ...}, {file: [(line index, line), ...], ...}, [file, ...]]
+All the queries have to search the same file or directory, and the ones that
+read files have to agree on -r and -g (a ValueError is raised otherwise).
+The -b and -j options apply to the whole search if any query has them.
+-f and -d queries, which don't read any files, are just run by grep. -}}
+pipelines aren't supported.
+limit applies to each resultset; the other arguments work as in grep.
+	'''
+	parsed = []
+	for query in queries:
+		if ' -}} ' in query:
+			raise ValueError("multiGrep doesn't support -}} pipelines: " + repr(query))
+		parsed.append(_parse_query(query))
+	if len({dirName for options, regex, dirName in parsed}) > 1:
+		raise ValueError('All the queries of a multiGrep must search the same file or directory.')
+	content = [k for k, (options, regex, dirName) in enumerate(parsed)
+			   if not ('d' in options or 'f' in options)]
+	if len({('r' in parsed[k][0], 'g' in parsed[k][0]) for k in content}) > 1:
+		raise ValueError('All the queries of a multiGrep that read files must agree on -r and -g.')
+	owns_cache = encoding_cache is True
+	if owns_cache:
+		dirName = parsed[0][2]
+		root = os.path.dirname(dirName) if os.path.isfile(dirName) else dirName
+		encoding_cache = EncodingCache.for_root(root)
+	try:
+		resultsets = [None] * len(queries)
+		for k, query in enumerate(queries):
+			if k not in content:
+				resultsets[k] = grep(query, workers, limit, encoding_cache, index, entries,
+									 file_cache, ignore, stats)
+		if content:
+			found = [[] for k in content]
+			for file, ind, line, k in _imultiGrep([parsed[k] for k in content], workers,
+												  encoding_cache, index, entries, file_cache,
+												  ignore, stats):
+				found[k].append((file, ind, line))
+			for k, results in zip(content, found):
+				resultsets[k] = _collect(results, parsed[k][0], limit)
+	finally:
+		if owns_cache:
+			encoding_cache.save()
+	return resultsets
+
+
+def _imultiGrep(parsed, workers, encoding_cache, index, entries = None, file_cache = None,
+				ignore = None, stats = None):
+	'''Searches for the parsed queries (a list of (options, regex, path), all
+with the same path) together, yielding (file, line index, line, index in parsed
+of the query) for each line of each file and each query it satisfies.'''
+	dirName = parsed[0][2]
+	all_options = [opt for options, regex, _ in parsed for opt in options]
+	workers, mmap_min_size, ignore = _search_settings(all_options, workers, ignore)
+	matchers = [GrepMatcher(regex, re.I if 'i' in options else 0, 'o' in options, 'v' in options)
+				for options, regex, _ in parsed]
+	if os.path.isfile(dirName):
+		if ignore is not None and ignore.skip_binary and _is_binary(dirName):
+			_skipped(stats)
+			return
+		textFiles = [dirName]
+	else:
+		queries = None
+		if not any(matcher.v for matcher in matchers):
+			queries = [(matcher.pattern.pattern, matcher.pattern.flags) for matcher in matchers]
+		textFiles = _text_files(dirName, 'r' in all_options, queries, index, entries, file_cache,
+								ignore, stats)
+		if stats is not None:
+			textFiles = _timed(textFiles, stats)
+	for file, matches in _grep_files(textFiles, MultiMatcher(matchers), workers, encoding_cache,
+									 mmap_min_size, file_cache, stats = stats):
+		for ind, line, k in matches:
+			yield file, ind, line, k
+
+
+class FileSystem:
+	'''The blocking filesystem calls agrep makes, each of which it runs in a
+worker thread. This one uses the local filesystem; subclass it to search
+something else, or to make the calls artificially slow (see
+grep_benchmarks.DelayedFileSystem).'''
+	def scandir(self, path):
+		'''Returns a list of (name, is_dir, is_symlink) for the entries of the
+directory path, classified the way os.walk classifies them.'''
+		out = []
+		with os.scandir(path) as entries:
+			for entry in entries:
+				out.append((entry.name, _is_dir(entry), _is_symlink(entry)))
+		return out
+	
+	def isfile(self, path):
+		return os.path.isfile(path)
+	
+	def stat(self, path):
+		return os.stat(path)
+	
+	def read(self, path):
+		'''Returns the contents of the file path as bytes.'''
+		with open(path, 'rb') as f:
+			return f.read()
+
+
+def _agrep_file(fs, file, matcher, encoding):
+	'''_grep_file for agrep: reads the file through the FileSystem fs.'''
+	try:
+		text, encoding = _decode_text(fs.read(file), encoding)
+	except (OSError, UnicodeError):
+		print("Could not find the encoding for this file.")
+		return [], None
+	return list(matcher.matching_lines(text)), encoding
+
+
+class _AsyncSearch:
+	'''The state of one agrep search: every blocking call goes through call,
+which runs it on the thread pool executor.'''
+	def __init__(self, fs, executor, matcher, encoding_cache):
+		self.fs = fs
+		self.executor = executor
+		self.matcher = matcher
+		self.encoding_cache = encoding_cache
+	
+	async def call(self, func, *args):
+		import asyncio
+		return await asyncio.get_running_loop().run_in_executor(self.executor, func, *args)
+	
+	async def listing(self, path):
+		try:
+			return await self.call(self.fs.scandir, path)
+		except OSError:
+			return [] # like os.walk and the os.listdir in grep
+	
+	async def search_file(self, file):
+		'''Returns a list of (file, line index, line) for the matching lines of file.'''
+		stat = encoding = None
+		if self.encoding_cache is not None:
+			try:
+				stat = await self.call(self.fs.stat, file)
+			except OSError:
+				pass
+			else:
+				encoding = self.encoding_cache.get(file, stat)
+		matches, found = await self.call(_agrep_file, self.fs, file, self.matcher, encoding)
+		if stat is not None and found not in (None, encoding):
+			self.encoding_cache.set(file, found, stat)
+		return [(file, ind, line) for ind, line in matches]
+	
+	async def tree(self, path, r, found):
+		'''Lists the directory path (and, if r, every directory beneath it, all at
+once) and returns the concatenation, in os.walk order, of found(path, entries)
+for each of these directories. found is a coroutine function taking the
+directory and its entries (see FileSystem.scandir) and returning a list.'''
+		import asyncio
+		entries = await self.listing(path)
+		parts = [found(path, entries)]
+		if r:
+			parts.extend(self.tree(os.path.join(path, name), r, found)
+						 for name, is_dir, is_symlink in entries
+						 if is_dir and not is_symlink) # os.walk doesn't follow links
+		return [x for part in await asyncio.gather(*parts) for x in part]
+
+
+async def agrep(Input, concurrency = 32, encoding_cache = None, fs = None):
+	"""Asynchronous version of grep for slow (e.g. network-mounted) filesystems,
+taking the same queries and returning the same results.
+grep makes one blocking call at a time, so on a filesystem where every
+listing, stat and open has a long latency it spends most of its time waiting.
+agrep lists every directory of a -r search and reads every file concurrently,
+keeping up to concurrency of these calls in flight on a pool of threads.
+Usage: asyncio.run(gsfd.agrep("-r 'zebra' /delicious"))
+-}} pipelines and -g aren't supported (a ValueError is raised), since the
+ignore files and binary checks of -g would bypass fs; -b and -j are ignored.
+
+encoding_cache: as for grep.
+fs: the FileSystem to search (default: FileSystem(), the local filesystem).
+	"""
+	from concurrent.futures import ThreadPoolExecutor
+	if ' -}} ' in Input:
+		raise ValueError("agrep doesn't support -}} pipelines; use grep instead.")
+	options, regex, dirName = _parse_query(Input)
+	if 'g' in options:
+		raise ValueError("agrep doesn't support -g; use grep instead.")
+	if fs is None:
+		fs = FileSystem()
+	executor = ThreadPoolExecutor(concurrency)
+	try:
+		search = _AsyncSearch(fs, executor, GrepMatcher(regex, re.I if 'i' in options else 0,
+												  'o' in options, 'v' in options),
+							  encoding_cache)
+		isfile = await search.call(fs.isfile, dirName)
+		if encoding_cache is True:
+			root = os.path.dirname(dirName) if isfile else dirName
+			search.encoding_cache = await search.call(EncodingCache.for_root, root)
+		try:
+			results = await _asearch(search, options, dirName, isfile)
+		finally:
+			if encoding_cache is True:
+				await search.call(search.encoding_cache.save)
+	finally:
+		executor.shutdown(wait = False, cancel_futures = True)
+	return _collect(results, options)
+
+
+async def _asearch(search, options, dirName, isfile):
+	'''Returns the list of (file, line index, line) tuples _igrep would yield.'''
+	import asyncio
+	v = ('v' in options)
+	d = ('d' in options)
+	r = ('r' in options)
+	f = ('f' in options)
+	a = ('a' in options)
+	name_matches = search.matcher.name_matches
+	
+	if isfile:
+		if d:
+			return []
+		if f:
+			return [(dirName, None, None)] if name_matches(dirName) ^ v else []
+		return await search.search_file(dirName)
+	
+	if d:
+		async def found(path, entries):
+			return [(Dir, None, None) for Dir in (os.path.join(path, name)
+												  for name, is_dir, is_symlink in entries if is_dir)
+					if name_matches(Dir) ^ v]
+		results = await search.tree(dirName, r, found)
+		if name_matches(dirName) ^ v:
+			results.append((dirName, None, None)) #need to consider the starting dir too
+		return results
+	
+	def fnames(path, entries):
+		# what _list_files yields, which is what grep tests the regexes against
+		for name, is_dir, is_symlink in entries:
+			if name == EncodingCache.FILENAME or (r and is_dir):
+				continue
+			yield os.path.join(path, name) if r else name
+	
+	if f:
+		async def found(path, entries):
+			return [(os.path.join(dirName, fname), None, None) for fname in fnames(path, entries)
+					if (a or re.search(textTypeFiles, fname)) and name_matches(fname) ^ v]
+	else:
+		async def found(path, entries):
+			parts = await asyncio.gather(*(search.search_file(os.path.join(dirName, fname))
+										   for fname in fnames(path, entries)
+										   if re.search(textTypeFiles, fname)))
+			return [x for part in parts for x in part]
+	return await search.tree(dirName, r, found)
+
+
+def _sed_files(grep_or_fname):
+	'''The list of files sed and bulk_sed work on: grep_or_fname if it's a file
+name or an iterable of file names, else the files its grep query finds.'''
+	try:
+		is_grep_query = not os.path.isfile(grep_or_fname)
+	except: #it's an iterable of file names, not a string, which causes error
+		is_grep_query = False
+	if is_grep_query:
+		return list(grep(grep_or_fname))
+	if is_iterable(grep_or_fname):
+		return list(grep_or_fname)
+	return [grep_or_fname]
+
+
+def _replacement(match, repl):
+	'''What re.sub would replace match with.'''
+	if callable(repl):
+		return repl(match)
+	if '\\' not in repl:
+		return repl
+	return match.expand(repl)
+
+
+def _sed_newfile(file, name_mangle):
+	if name_mangle == '':
+		return file
+	fname,ext = get_ext(file)
+	return increment_name(fname + name_mangle + ext)
+
+
+SED_CHUNK_SIZE = 1 << 20 # characters substituted at a time by bulk_sed
+SED_OVERLAP = 1 << 12 # characters a bulk_sed match can see beyond its chunk
+
+
+def _sub_stream(findregex, repl, infile, outfile, chunk_size, overlap):
+	'''Writes the text read from the text file infile to outfile with every
+match of findregex replaced (like findregex.sub(repl, text)), reading and
+substituting chunk_size characters at a time.
+A match that comes within overlap characters of the end of the text read so
+far is held back until more is read, so that matches (including anything
+their lookarounds or $ need to see) up to overlap characters long are found
+exactly as they would be in the whole text.
+Returns the number of replacements.'''
+	count = 0
+	buffer = ''
+	pos = 0 # buffer[:pos] is already written; it is kept for lookbehinds
+	empty_at_pos = False # whether an empty match at pos was already replaced
+	eof = False
+	while not eof:
+		chunk = infile.read(chunk_size)
+		eof = not chunk
+		buffer += chunk
+		limit = len(buffer) if eof else len(buffer) - overlap
+		if not eof and limit <= pos:
+			continue
+		parts = []
+		last = pos
+		for match in findregex.finditer(buffer, pos):
+			start, end = match.span()
+			if empty_at_pos and end == pos:
+				# re.sub doesn't match empty twice in one place, and finditer
+				# goes on to look for a longer match here, as it would have
+				continue
+			if not eof and end >= limit:
+				if start < limit:
+					limit = start # it might go on in the text not read yet
+				break
+			parts.append(buffer[last:start])
+			parts.append(_replacement(match, repl))
+			last = end
+			count += 1
+			empty_at_pos = (start == end)
+		if last < limit:
+			parts.append(buffer[last:limit])
+			last = limit
+			empty_at_pos = False
+		outfile.write(''.join(parts))
+		keep = max(0, last - overlap)
+		buffer = buffer[keep:]
+		pos = last - keep
+	return count
+
+
+class _ChainedReader:
+	'''A text file whose first read returns first, already read from infile.'''
+	def __init__(self, first, infile):
+		self.first = first
+		self.infile = infile
+	
+	def read(self, size):
+		if self.first is not None:
+			first, self.first = self.first, None
+			return first
+		return self.infile.read(size)
+
+
+def _newline_style(newlines):
+	'''The newline to write a file with, given the newlines attribute of the
+text file it was read from: its line ending if it only has one kind, else None.'''
+	return newlines if isinstance(newlines, str) else None
+
+
+def _sed_to_temp(file, newfile, findregex, repl, encoding, chunk_size, overlap):
+	'''Writes the text of file (decoded with encoding) with every match of
+findregex replaced by repl to a new temporary file in the directory of
+newfile, in the same encoding and with the same line endings as file if it
+only has one kind. file is closed again by the time this returns, so the
+temporary file can be renamed over it even on Windows.
+Returns (number of replacements, name of the temporary file), or (0, None)
+(and no temporary file) if there were no replacements.'''
+	import tempfile
+	dirname, basename = os.path.split(os.path.abspath(newfile))
+	newline = False # not known until the first chunk has been read
+	while True:
+		with open(file, 'r', encoding = encoding) as infile:
+			first = infile.read(chunk_size)
+			if newline is False:
+				newline = _newline_style(infile.newlines)
+			fd, tmp = tempfile.mkstemp(prefix = '.' + basename + '.', suffix = '.tmp', dir = dirname)
+			try:
+				with os.fdopen(fd, 'w', encoding = encoding, newline = newline) as outfile:
+					count = _sub_stream(findregex, repl, _ChainedReader(first, infile), outfile,
+										chunk_size, overlap)
+			except BaseException:
+				os.remove(tmp)
+				raise
+			final = _newline_style(infile.newlines)
+		if not count:
+			os.remove(tmp)
+			return 0, None
+		if final == newline:
+			return count, tmp
+		# the line endings of the first chunk weren't those of the whole file
+		os.remove(tmp)
+		newline = final
+
+
+def _bulk_sed_file(args):
+	'''Worker used by bulk_sed to rewrite a single file.
+args is a tuple (file, findregex, repl, name_mangle, chunk_size, overlap).
+Returns (file, number of replacements), or (file, None) if the file couldn't
+be read, decoded or written.'''
+	file, findregex, repl, name_mangle, chunk_size, overlap = args
+	try:
+		with open(file, 'rb') as f:
+			sample = f.read(SAMPLE_SIZE + 1)
+	except OSError:
+		print(f"File {file} not found.")
+		return file, None
+	newfile = _sed_newfile(file, name_mangle)
+	for encoding in _candidate_encodings(sample):
+		try:
+			count, tmp = _sed_to_temp(file, newfile, findregex, repl, encoding, chunk_size,
+									  overlap)
+		except UnicodeDecodeError: # the sample's best encoding didn't fit the rest
+			continue
+		except UnicodeEncodeError as ex: # the replacements don't fit the file's encoding
+			print(f"File {file} could not be rewritten in its encoding, {encoding}: {ex}")
+			return file, None
+		except OSError as ex:
+			print(f"File {file} could not be rewritten: {ex}")
+			return file, None
+		if tmp is not None:
+			import shutil
+			try:
+				shutil.copymode(file, tmp)
+				os.replace(tmp, newfile)
+			except OSError as ex:
+				os.remove(tmp)
+				print(f"File {newfile} could not be written: {ex}")
+				return file, None
+		return file, count
+	print(f"The encoding of file {file} could not be determined.")
+	return file, None
+
+
+def bulk_sed(grep_or_fname, regex, repl, name_mangle = '_sed', flags = 0, workers = None,
+			 chunk_size = SED_CHUNK_SIZE, overlap = SED_OVERLAP):
+	"""Non-interactive sed for rewriting many (possibly big) files at once.
+Replaces every match of regex with repl in each file, like re.sub, and
+returns a dict mapping each file to its number of replacements (None for
+files that couldn't be read, decoded or written). Files with no replacements are left
+alone and no new file is written for them.
+grep_or_fname, regex, repl, name_mangle, flags: as for sed. If repl is a
+	function, it must be picklable (not a lambda) to use workers.
+workers: int or None. If not None or 1, files are rewritten in parallel by a
+	pool of this many worker processes.
+chunk_size: each file is read and substituted chunk_size characters at a time,
+	so memory use doesn't grow with the size of the file.
+overlap: a match (and whatever its lookarounds or $ look at) must fit in
+	overlap characters to be treated exactly as re.sub would treat it.
+
+Each file is decoded with its detected encoding and written back in the same
+encoding and (if it has only one kind) with the same line endings. The new
+text goes to a temporary file that is renamed over the target only when it's
+complete, so an interrupted bulk_sed never leaves a half-written file.
+	"""
+	findregex = re.compile(regex,flags)
+	files = _sed_files(grep_or_fname)
+	if len(files)==0:
+		print("No files found.")
+	tasks = [(file, findregex, repl, name_mangle, chunk_size, overlap) for file in files]
+	if not workers or workers == 1:
+		return dict(map(_bulk_sed_file, tasks))
+	chunksize = max(1, len(tasks) // (workers * 8))
+	from concurrent.futures import ProcessPoolExecutor
+	with ProcessPoolExecutor(workers) as executor:
+		return dict(executor.map(_bulk_sed_file, tasks, chunksize = chunksize))
+
+
+def sed(grep_or_fname,regex,repl,ask_permission = True,name_mangle = '_sed',flags=0):
+	"""Search for regex in files, replace them, writing to new files if desired.
+grep_or_fname: a filename, a list of filenames, or a grep query for
+	filenames.
+regex: string, a regular expression or string to be replaced.
+repl: string, a pattern for replacing the string in the file(s).
+ask_permission: bool. If True, shows what will be replaced before each
+	replacement, and allows you to quit at any point if you want.
+name_mangle: string. If '', files will be overwritten by this function.
+	THIS IS OBVIOUSLY DANGEROUS! Thus, the default is to write a new file
+	with '_sed' appended to the filename.
+Files are written back in the encoding they were read with.
+For rewriting many files without being asked, see bulk_sed.
+
+Solution: http://thinkpython2.com/code/sed.py.
+meat=re.compile('meat', flags=re.I)
+Test for non-recursive form: gsfd.sed('ludd', 'eehive', './/delicious//bluddText inc15.txt')
+Test for recursive form: gsfd.sed(meat, 'tofu', './/delicious', recursive=True)
+Test for non-recursive form with name choice: gsfd.sed('ludd', 'eehive', 'bluddNew.txt', './/delicious//bluddText inc15.txt')
+Test for error handling in recursive form: gsfd.sed('dfd', '23rer', '33254223432', recursive=True)
+Test for error handling in non-recursive form: gsfd.sed('dfd', '23rer', '33254223432')
+zargothrax=gsfd.grep("-i -r 'argothrax' /C:/Users/molso/Documents/html stuff")
+	"""
+	findregex = re.compile(regex,flags)
+	files = _sed_files(grep_or_fname)
+	if len(files)==0:
+		print("No files found.")
+	for file in files:
+		try:
+			text, encoding = _read_text(file)
+		except:
+			print(f"File {file} not found, or its encoding could not be determined.")
+			continue
+		newtext = []
+		last_index = 0
+		if ask_permission:
+			print(f"\nNow in file {file}.")
+		has_replacements = not ask_permission
+		for to_replace in findregex.finditer(text):
+			start,end = to_replace.span()
+			old = text[start:end]
+			new_ = _replacement(to_replace, repl)
+			if ask_permission:
+				has_replacements = True
+				decision = input((f"\nAre you sure you want to replace \"{old}\""
+						   f" with \"{new_}\"?"
+						   "\nIf yes, press 1. If no, press something else."
+						   "\nIf you don't want to be asked permission again, press 99.\t"))
+				if decision not in ['1','99']:
+					next_decision = input(("\nPrematurely terminating replacements."
+						   " Press 1 to continue to other files, "
+						   "or something else to exit function.\t"))
+					if next_decision == '1':
+						break
+					else:
+						return
+				if decision == '99':
+					print("\nPermission will no longer be requested.")
+					ask_permission = False
+			newtext.append(text[last_index:start])
+			newtext.append(new_)
+			last_index = end
+		newtext.append(text[last_index:])
+		if has_replacements: #only overwrite file if anything has been changed
+			newtext = ''.join(newtext)
+			try: #before opening newfile empties it
+				newtext.encode(encoding)
+			except UnicodeEncodeError as ex:
+				print(f"File {file} could not be rewritten in its encoding, {encoding}: {ex}")
+				continue
+			newfile = _sed_newfile(file, name_mangle)
+			#this will overwrite old file if name_mangle is ''
+			with open(newfile,'w',encoding = encoding) as f:
+				f.write(newtext)
+	return
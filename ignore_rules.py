@@ -0,0 +1,187 @@
+'''Rules for the files and directories a gsfd.grep search should skip (its -g
+option): .gitignore-style ignore files, user-supplied exclude globs, version
+control directories, virtualenvs, and binary files.
+>>> gsfd.grep("-r -g 'zebra' /monorepo")
+>>> gsfd.grep("-r 'zebra' /monorepo", ignore = IgnoreRules(excludes = ['*.min.js', 'build/']))
+An ignore file applies to the directory it's in and everything beneath it,
+and the rules in deeper ignore files win over those in shallower ones, like
+in git. Only the ignore files in and beneath the searched directory are read.
+Directories that are ignored aren't walked into at all, so nothing inside
+them costs anything.
+'''
+import codecs
+import os
+import re
+
+IGNORE_FILES = ('.gitignore', '.ignore')
+VCS_DIRS = ('.git', '.hg', '.svn', '.bzr')
+SNIFF_SIZE = 1024 # bytes of each file is_binary looks at
+_WIDE_BOMS = (codecs.BOM_UTF32_LE, codecs.BOM_UTF32_BE, codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)
+
+
+def is_binary(fname, sniff_size = SNIFF_SIZE):
+	'''True if the first sniff_size bytes of the file fname contain a NUL byte,
+unless they start with a UTF-16 or UTF-32 byte order mark (text in those
+encodings is full of NULs). False if the file can't be read.'''
+	try:
+		with open(fname, 'rb') as f:
+			data = f.read(sniff_size)
+	except OSError:
+		return False
+	return b'\0' in data and not data.startswith(_WIDE_BOMS)
+
+
+def translate(pattern):
+	'''Compiles a gitignore pattern (without any leading ! or trailing /) into a
+regex that fullmatches the paths it applies to, relative to the directory of
+its ignore file and with / as the separator.
+A pattern with no / in it (other than at the end) matches a name at any
+depth; otherwise it's anchored to that directory.
+Examples:
+>>> translate('*.pyc').match('a/b/c.pyc')
+<re.Match object; span=(0, 9), match='a/b/c.pyc'>
+>>> translate('/build').match('a/build') # None
+>>> translate('docs/**/*.html').match('docs/a/b/index.html')
+<re.Match object; span=(0, 19), match='docs/a/b/index.html'>
+	'''
+	anchored = '/' in pattern
+	if pattern.startswith('/'):
+		pattern = pattern[1:]
+	out = []
+	ii = 0
+	n = len(pattern)
+	while ii < n:
+		c = pattern[ii]
+		if (pattern.startswith('**', ii) and (ii == 0 or pattern[ii-1] == '/')
+				and (ii + 2 == n or pattern[ii+2] == '/')):
+			if ii + 2 == n: # trailing /**: everything inside
+				out.append('.*')
+			else: # leading **/ or /**/: zero or more directories
+				out.append('(?:.*/)?')
+				ii += 1
+			ii += 2
+			continue
+		if c == '*':
+			out.append('[^/]*')
+		elif c == '?':
+			out.append('[^/]')
+		elif c == '[':
+			jj = ii + 1
+			if jj < n and pattern[jj] == '!':
+				jj += 1
+			if jj < n and pattern[jj] == ']':
+				jj += 1
+			jj = pattern.find(']', jj)
+			if jj == -1:
+				out.append('\\[')
+			else:
+				stuff = pattern[ii+1:jj].replace('\\', '\\\\')
+				if stuff.startswith('!'):
+					stuff = '^' + stuff[1:]
+				out.append('[' + stuff + ']')
+				ii = jj
+		elif c == '\\' and ii + 1 < n:
+			ii += 1
+			out.append(re.escape(pattern[ii]))
+		else:
+			out.append(re.escape(c))
+		ii += 1
+	return re.compile(('' if anchored else '(?:.*/)?') + ''.join(out) + r'\Z', re.S)
+
+
+def parse_line(line):
+	'''Parses a line of an ignore file into (regex, negated, dir_only), or
+returns None for blank lines and comments. negated is True for !patterns,
+which re-include what earlier patterns excluded; dir_only is True for
+patterns ending in /, which only match directories.'''
+	line = line.rstrip('\r\n')
+	if not line or line.startswith('#'):
+		return None
+	stripped = line.rstrip(' ')
+	if stripped.endswith('\\') and len(stripped) < len(line): # escaped trailing space
+		stripped += ' '
+	line = stripped
+	negated = line.startswith('!')
+	if negated or line.startswith(('\\!', '\\#')):
+		line = line[1:]
+	dir_only = line.endswith('/')
+	if dir_only:
+		line = line[:-1]
+	if not line:
+		return None
+	return translate(line), negated, dir_only
+
+
+def _relative(path, base):
+	'''path (beneath the directory base) relative to base, with / separators.'''
+	rel = path[len(base):].lstrip(os.sep)
+	return rel.replace(os.sep, '/') if os.sep != '/' else rel
+
+
+class IgnoreRules:
+	'''Decides which files and directories a grep search skips.
+excludes: gitignore-style globs (e.g. '*.min.js', 'build/', '/vendor') for
+	things to skip, relative to the directory searched. Unlike the patterns
+	in ignore files, nothing can re-include what they exclude.
+ignore_files: the names of the ignore files to honor in each directory.
+skip_vcs: skip version control directories (VCS_DIRS).
+skip_venvs: skip Python virtualenvs (directories with a pyvenv.cfg).
+skip_binary: skip files that look binary (see is_binary).
+	'''
+	def __init__(self, excludes = (), ignore_files = IGNORE_FILES, skip_vcs = True,
+				 skip_venvs = True, skip_binary = True):
+		self.excludes = [rule for rule in map(parse_line, excludes) if rule is not None]
+		self.ignore_files = tuple(ignore_files)
+		self.skip_vcs = skip_vcs
+		self.skip_venvs = skip_venvs
+		self.skip_binary = skip_binary
+		self._parsed = {} # ignore file -> (mtime_ns, size, rules)
+	
+	def root_rules(self, root):
+		'''The rules in effect at the top of a search of the directory root, to
+be passed to dir_rules.'''
+		return (root, ())
+	
+	def _read(self, fname, base):
+		'''The rules in the ignore file fname (in the directory base), parsed
+again only if it has changed since the last search.'''
+		try:
+			stat = os.stat(fname)
+			parsed = self._parsed.get(fname)
+			if parsed is not None and parsed[:2] == (stat.st_mtime_ns, stat.st_size):
+				return parsed[2]
+			with open(fname, encoding = 'utf-8', errors = 'replace') as f:
+				rules = tuple((base,) + rule for rule in map(parse_line, f) if rule is not None)
+		except OSError:
+			return ()
+		self._parsed[fname] = (stat.st_mtime_ns, stat.st_size, rules)
+		return rules
+	
+	def dir_rules(self, dirpath, names, parent_rules):
+		'''The rules in effect in the directory dirpath, whose entries are names:
+parent_rules (from root_rules or the dir_rules of its parent) plus those in
+its own ignore files.'''
+		root, rules = parent_rules
+		for fname in self.ignore_files:
+			if fname in names:
+				rules = rules + self._read(os.path.join(dirpath, fname), dirpath)
+		return root, rules
+	
+	def ignores(self, path, is_dir, rules):
+		'''True if the file or directory path is to be skipped, given the rules
+(from dir_rules) of the directory it's in.'''
+		if is_dir:
+			if self.skip_vcs and os.path.basename(path) in VCS_DIRS:
+				return True
+			if self.skip_venvs and os.path.exists(os.path.join(path, 'pyvenv.cfg')):
+				return True
+		root, rules = rules
+		if self.excludes:
+			rel = _relative(path, root)
+			for regex, negated, dir_only in self.excludes:
+				if (is_dir or not dir_only) and not negated and regex.match(rel):
+					return True
+		for base, regex, negated, dir_only in reversed(rules): # the last match wins
+			if (is_dir or not dir_only) and regex.match(_relative(path, base)):
+				return not negated
+		return False
@@ -0,0 +1,246 @@
+'''Benchmarks for json_funcs.
+Run this module (python json_benchmarks.py) to print the timings.
+The documents are generated from a fixed random seed, so the numbers from two
+versions of json_funcs can be compared directly.
+'''
+import json
+import os
+import random
+import sys
+import tempfile
+import timeit
+import tracemalloc
+import json_funcs
+from json_funcs import is_iterable
+
+WORDS = ('foo', 'bar', 'baz', 'meat', 'tofu', 'alpha', 'beta', 'gamma', 'zebra')
+
+
+def make_wide(n_records = 100000, seed = 0):
+	'''Returns a list of n_records tweet-like dicts, like a big JSON Lines file
+loaded as an array.'''
+	rng = random.Random(seed)
+	return [{'id': ii,
+			 'text': ' '.join(rng.choice(WORDS) for jj in range(8)),
+			 'user': {'name': f'user{rng.randrange(1000)}', 'followers': rng.randrange(10000),
+					  'tags': [rng.choice(WORDS) for jj in range(3)]},
+			 'retweets': rng.randrange(100)}
+			for ii in range(n_records)]
+
+
+def make_deep(depth = 50000):
+	'''Returns depth nested [index, {'child': ...}] pairs with {'leaf': depth} at
+the bottom.'''
+	doc = {'leaf': depth}
+	for ii in range(depth):
+		doc = [ii, {'child': doc}]
+	return doc
+
+
+def old_json_extract(json, path):
+	'''json_funcs.json_extract before it kept its own stack: a recursive closure
+that copies the rest of the path and the path so far at every level. Kept here
+for comparison.'''
+	_arr = []
+	if type(path) not in [tuple,list]:
+		path = [path]
+	if len(path)==0:
+		return []
+	def extract(graph, path, arr = _arr, curpath = None):
+		if type(graph)==dict:
+			iterator = iter(graph)
+		else:
+			iterator = range(len(graph))
+		if curpath is None:
+			curpath = []
+		path0_is_itbl = is_iterable(path[0])
+		for curnode in iterator:
+			newgraph = graph[curnode]
+			if len(path)==1 and ((curnode in path[0]) if path0_is_itbl else (curnode == path[0])):
+				arr.append(newgraph)
+				continue
+			if is_iterable(newgraph):
+				if (curnode in path[0]) if path0_is_itbl else (curnode == path[0]):
+					extract(newgraph, path[1:], arr, curpath + [curnode])
+				else:
+					extract(newgraph, path, arr, curpath + [curnode])
+		return arr
+	return extract(json, path)
+
+
+EXTRACT_PATHS = ('name', ('user', 'tags', 0), (('id', 'retweets'),), 'missing')
+
+
+def bench_extract(n_records = 100000, number = 3, paths = EXTRACT_PATHS):
+	'''Times old_json_extract and json_funcs.json_extract on make_wide(n_records)
+for each of paths, checking that both find the same things.
+Returns a list of (path, old seconds, new seconds), best of number runs.'''
+	doc = make_wide(n_records)
+	results = []
+	for path in paths:
+		assert old_json_extract(doc, path) == json_funcs.json_extract(doc, path)
+		old = min(timeit.repeat(lambda: old_json_extract(doc, path), number = 1, repeat = number))
+		new = min(timeit.repeat(lambda: json_funcs.json_extract(doc, path), number = 1,
+								repeat = number))
+		results.append((path, old, new))
+	return results
+
+
+def bench_many(n_records = 100000, number = 3, paths = EXTRACT_PATHS):
+	'''Times running each of paths over each of the make_wide(n_records) records
+separately, as when they come from a JSON Lines file: with old_json_extract
+and json_funcs.json_extract on each record, and with one
+json_funcs.compile_path(path).extract_many over all of them.
+Returns a list of (path, old seconds, json_extract seconds, extract_many
+seconds), best of number runs.'''
+	docs = make_wide(n_records)
+	results = []
+	for path in paths:
+		matcher = json_funcs.compile_path(path)
+		expected = [old_json_extract(doc, path) for doc in docs]
+		assert list(matcher.extract_many(docs)) == expected
+		assert [json_funcs.json_extract(doc, path) for doc in docs] == expected
+		old = min(timeit.repeat(lambda: [old_json_extract(doc, path) for doc in docs],
+								number = 1, repeat = number))
+		new = min(timeit.repeat(lambda: [json_funcs.json_extract(doc, path) for doc in docs],
+								number = 1, repeat = number))
+		many = min(timeit.repeat(lambda: list(json_funcs.compile_path(path).extract_many(docs)),
+								 number = 1, repeat = number))
+		results.append((path, old, new, many))
+	return results
+
+
+def bench_deep(depth = 50000, number = 3):
+	'''Times json_funcs.json_extract finding the leaf of make_deep(depth), far
+deeper than the recursion limit, and checks whether old_json_extract can.
+Returns (best of number runs in seconds, True if old_json_extract hit the
+recursion limit).'''
+	doc = make_deep(depth)
+	path = ('child', 'leaf')
+	assert json_funcs.json_extract(doc, path) == [depth]
+	seconds = min(timeit.repeat(lambda: json_funcs.json_extract(doc, path), number = 1,
+								repeat = number))
+	try:
+		old_json_extract(doc, path)
+	except RecursionError:
+		return seconds, True
+	return seconds, False
+
+
+def _peak_memory(func):
+	'''Runs func and returns the peak memory (in bytes) it allocated.'''
+	tracemalloc.start()
+	try:
+		func()
+		return tracemalloc.get_traced_memory()[1]
+	finally:
+		tracemalloc.stop()
+
+
+def bench_stream(n_records = 100000, path = ('user', 'name'), number = 3):
+	'''Writes make_wide(n_records) to a JSON file (an array of records) and a
+JSON Lines file, and finds path in them by loading the whole JSON file with
+json.load and running json_funcs.json_extract on it, and with
+json_funcs.json_extract_file on each file, checking that all three agree.
+Returns (size of the JSON file in bytes, list of (method, seconds (best of
+number runs), peak memory in bytes)).'''
+	records = make_wide(n_records)
+	with tempfile.TemporaryDirectory() as root:
+		fname = os.path.join(root, 'records.json')
+		with open(fname, 'w', encoding = 'utf-8') as f:
+			json.dump(records, f)
+		jsonl_name = os.path.join(root, 'records.jsonl')
+		with open(jsonl_name, 'w', encoding = 'utf-8') as f:
+			for record in records:
+				f.write(json.dumps(record) + '\n')
+		del records
+		def load():
+			with open(fname, encoding = 'utf-8') as f:
+				return json_funcs.json_extract(json.load(f), path)
+		methods = [('json.load + json_extract', load),
+				   ('json_extract_file', lambda: list(json_funcs.json_extract_file(fname, path))),
+				   ('json_extract_file (JSON Lines)',
+					lambda: list(json_funcs.json_extract_file(jsonl_name, path)))]
+		expected = load()
+		results = []
+		for method, func in methods:
+			assert func() == expected
+			seconds = min(timeit.repeat(func, number = 1, repeat = number))
+			results.append((method, seconds, _peak_memory(func)))
+		return os.path.getsize(fname), results
+
+
+def bench_structure(n_records = 100000, number = 3):
+	'''Times printing the structure of make_wide(n_records) by building the whole
+json_funcs.show_json_structure string, and by writing the lines of
+json_funcs.iter_json_structure as they come, in full and summarized.
+Returns a list of (method, number of lines, seconds (best of number runs), peak
+memory in bytes).'''
+	doc = make_wide(n_records)
+	def build():
+		return json_funcs.show_json_structure(doc).count('\n') + 1
+	def stream(**kwargs):
+		lines = 0
+		with open(os.devnull, 'w') as f:
+			for line in json_funcs.iter_json_structure(doc, **kwargs):
+				f.write(line + '\n')
+				lines += 1
+		return lines
+	methods = [('show_json_structure', build),
+			   ('iter_json_structure', stream),
+			   ('max_items_per_container = 10', lambda: stream(max_items_per_container = 10)),
+			   ('summarize', lambda: stream(summarize = True))]
+	results = []
+	for method, func in methods:
+		lines = func()
+		seconds = min(timeit.repeat(func, number = 1, repeat = number))
+		results.append((method, lines, seconds, _peak_memory(func)))
+	return results
+
+
+def bench_schema(n_records = 200000, number = 3):
+	'''Writes make_wide(n_records) to a JSON Lines file and times inferring its
+schema with json_funcs.infer_schema_file in one process and split among one
+process per CPU, checking that both agree with json_funcs.infer_schema.
+Returns (seconds for one process, seconds in parallel, number of processes),
+best of number runs.'''
+	records = make_wide(n_records)
+	expected = json_funcs.infer_schema(records).as_dict()
+	with tempfile.TemporaryDirectory() as root:
+		fname = os.path.join(root, 'records.jsonl')
+		with open(fname, 'w', encoding = 'utf-8') as f:
+			for record in records:
+				f.write(json.dumps(record) + '\n')
+		del records
+		processes = os.cpu_count() or 1
+		chunk_size = os.path.getsize(fname) // processes + 1
+		def serial():
+			return json_funcs.infer_schema_file(fname, 1)
+		def parallel():
+			return json_funcs.infer_schema_file(fname, processes, chunk_size)
+		assert serial().as_dict() == parallel().as_dict() == expected
+		return (min(timeit.repeat(serial, number = 1, repeat = number)),
+				min(timeit.repeat(parallel, number = 1, repeat = number)), processes)
+
+
+if __name__ == '__main__':
+	print('json_extract over 100000 records (recursive vs. explicit stack):')
+	for path, old, new in bench_extract():
+		print(f"{path!r:28} {old:9.3f} s {new:9.3f} s ({old/new:.1f}x)")
+	print('The same paths over each of 100000 records (recursive, json_extract, compiled):')
+	for path, old, new, many in bench_many():
+		print(f"{path!r:28} {old:9.3f} s {new:9.3f} s {many:9.3f} s ({old/many:.1f}x)")
+	size, results = bench_stream()
+	print(f'Streaming a {size/1e6:.1f} MB JSON file (seconds, peak memory):')
+	for method, seconds, peak in results:
+		print(f"{method:32} {seconds:9.3f} s {peak/1e6:9.1f} MB")
+	print('Structure of 100000 records (lines, seconds, peak memory):')
+	for method, lines, seconds, peak in bench_structure():
+		print(f"{method:32} {lines:9} {seconds:9.3f} s {peak/1e6:9.1f} MB")
+	serial, parallel, processes = bench_schema()
+	print(f'Schema of 200000 records: {serial:.3f} s in one process,'
+		  f' {parallel:.3f} s in {processes} ({serial/parallel:.1f}x)')
+	seconds, recursion_error = bench_deep()
+	print(f'json_extract through 50000 levels: {seconds:.3f} s'
+		  f" (recursive: {'RecursionError' if recursion_error else 'ok'};"
+		  f' recursion limit {sys.getrecursionlimit()})')
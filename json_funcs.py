@@ -1,3 +1,8 @@
+import functools
+import itertools
+import json
+import os
+import re
 import traceback
 
 bad_json = {'a': 1, 'b': 3, '6': 7, '9': 'ball', 
@@ -34,63 +39,295 @@ Examples:
 [2, {'y': 'b', 'm': 9}, 10]
 >>> json_extract({'a':{'b':1,'a':2,'c':3},'b':{'b':4,'a':5},'c':6},(('a','b'),('a','b')))
 [1, 2, 4, 5]
+To run the same path over many documents, compile it once with compile_path.
     Inspired by, but NOT copied from https://hackersandslackers.com/extract-data-from-complex-json-python/ and
     https://bcmullins.github.io/parsing-json-python/
     '''
-    _arr = [] #holds all the matching records
-    if type(path) not in [tuple,list]:
-        path = [path]
-    if len(path)==0:
-        return []
-    def extract(graph,path,arr=_arr,curpath = None):
-        if type(graph)==dict:
-            iterator = iter(graph)
-        else:
-            iterator = range(len(graph))
-        if curpath is None:
-            curpath = []
-        path0_is_itbl = is_iterable(path[0])
-        for curnode in iterator:
-            newgraph = graph[curnode]
-            if path0_is_itbl:
-                if len(path)==1 and curnode in path[0]:
-                    arr.append(newgraph)
-                    continue
-            else:
-                if len(path)==1 and curnode == path[0]:
-                    #since the path loses the first node each time you find a node that matches
-                    #the first node in the path, once the path has length one and curnode matches
-                    #the first element in the path, the originally specified path is satisfied.
-                    arr.append(newgraph)
+    try: #like re, remember the paths used recently
+        matcher = _compile_cached(path)
+    except TypeError: #not hashable, e.g. a list
+        matcher = compile_path(path)
+    return matcher.extract(json)
+
+
+def compile_path(path):
+    '''Compiles path (as for json_extract) into a PathMatcher, so that running it
+over many documents only costs the traversals:
+>>> matcher = compile_path(('user', ('name', 'id')))
+>>> matcher.extract(tweet) # same as json_extract(tweet, ('user', ('name', 'id')))
+>>> for names in matcher.extract_many(tweets): ...
+    '''
+    return PathMatcher(path)
+
+
+_compile_cached = functools.lru_cache(maxsize = 128)(compile_path)
+
+
+class PathMatcher:
+    '''A compiled json_extract path (see compile_path).
+The path is matched by a little NFA over its steps: state n means the first n
+steps have been found on the way down to the current node. A key in step n's
+alternatives moves to state n+1 (or, from the last state, is a match), and any
+other key stays in state n, which is how unnamed keys can come between the
+named ones. states holds (alternatives, is_last) for each state, where the
+alternatives are a frozenset, so that testing a key is one hash lookup.
+    '''
+    def __init__(self, path):
+        if type(path) not in [tuple,list]:
+            path = [path]
+        self.path = tuple(path)
+        self.states = tuple((_alternatives(step), ii == len(path) - 1)
+                            for ii, step in enumerate(path))
+
+    def extract(self, json):
+        '''json_extract(json, self.path): a list of everything in json that the
+path reaches, in document order.'''
+        states = self.states
+        if not states:
+            return []
+        # the traversal keeps its own stack instead of recursing, so documents can
+        # be nested far deeper than the recursion limit. children iterates over the
+        # (key, child) pairs of the current container, and state is the NFA state
+        # there; stack holds them for the containers above.
+        arr = [] #holds all the matching records
+        stack = []
+        children = _children(json)
+        state = 0
+        keys, is_last = states[0]
+        while True:
+            for curnode, newgraph in children:
+                kind = type(newgraph)
+                if kind in _SCALARS: #the common case, and nothing to look inside
+                    if is_last and curnode in keys:
+                        arr.append(newgraph)
                     continue
-            if is_iterable(newgraph): #if newgraph is an array or dict
-                if path0_is_itbl:
-                    if curnode in path[0]:
-                        #continue recursively searching, this time for any paths that match
-                        #the rest of the path (not including the first node in the path, which
-                        #we already found).
-                        placeholder = extract(newgraph, path[1:], arr, curpath + [curnode])
-                    else:
-                        placeholder = extract(newgraph, path, arr, curpath + [curnode])
-                else:       
-                    if curnode == path[0]:
-                        #continue recursively searching, this time for any paths that match
-                        #the rest of the path (not including the first node in the path, which
-                        #we already found).
-                        placeholder = extract(newgraph, path[1:], arr, curpath + [curnode])
-                    else:
-                        placeholder = extract(newgraph, path, arr, curpath + [curnode])
-        return arr
+                if curnode in keys:
+                    if is_last:
+                        #the whole path has been found, so this is a match.
+                        arr.append(newgraph)
+                        continue
+                    if kind is dict or kind is list or is_iterable(newgraph):
+                        #look for the rest of the path beneath this node.
+                        stack.append((children, state))
+                        children = _children(newgraph)
+                        state += 1
+                        keys, is_last = states[state]
+                        break
+                elif kind is dict or kind is list or is_iterable(newgraph):
+                    #keys that aren't in the path can come between keys that are.
+                    stack.append((children, state))
+                    children = _children(newgraph)
+                    break
+            else: #done with this container; back to its parent
+                if not stack:
+                    return arr
+                children, state = stack.pop()
+                keys, is_last = states[state]
+
+    def extract_many(self, docs):
+        '''Yields self.extract(doc) for each of the documents docs (e.g., the
+records of a JSON Lines file), as each is needed.'''
+        extract = self.extract
+        for doc in docs:
+            yield extract(doc)
+
+    def extract_stream(self, f, jsonl = False, chunk_size = None):
+        '''Yields what the path reaches in the JSON read from the text file f, in
+document order, reading it chunk_size characters at a time (default
+STREAM_CHUNK_SIZE) without ever loading the whole document: only the values
+that match are built, so memory use is bounded by the biggest of those (and
+the longest string in the file), not by the size of the file.
+f can hold a sequence of JSON documents, e.g. JSON Lines, each of which is
+searched like a separate json_extract. With jsonl, f is read a line at a time
+and each line is parsed whole, which is much faster, but then a line has to
+fit in memory.
+Raises ValueError if f isn't valid JSON.'''
+        if not self.states:
+            return
+        if jsonl:
+            for line in f:
+                if line.strip():
+                    yield from self.extract(json.loads(line))
+            return
+        yield from _stream_matches(f, self.states, chunk_size or STREAM_CHUNK_SIZE)
+
+    def __repr__(self):
+        return f'compile_path({self.path!r})'
+
+
+def _alternatives(step):
+    '''The keys a step of a path accepts, as a frozenset, or as a tuple if
+some of them can't be hashed.'''
+    keys = tuple(step) if is_iterable(step) else (step,)
+    try:
+        return frozenset(keys)
+    except TypeError: #'in' on a tuple compares them one at a time instead
+        return keys
+
 
-    return extract(json,path)
+_SCALARS = frozenset((str, int, float, bool, type(None)))
 
 
-def show_json_structure(json,show_parents_only = False,keys_of_interest = tuple()):
+def _children(graph):
+    '''An iterator over the (key, child) pairs of graph, a dict or an array.'''
+    if type(graph)==dict:
+        return iter(graph.items())
+    return enumerate(graph)
+
+
+def json_extract_file(file, path, jsonl = None, chunk_size = None):
+    '''Streaming json_extract for JSON files bigger than memory: yields everything
+in the file that path reaches, in document order, building only those values.
+file: the name of a JSON or JSON Lines file, or a text file object.
+jsonl: True to parse the file a line at a time (faster; see
+    PathMatcher.extract_stream). By default, True if file is the name of a
+    .jsonl or .ndjson file.
+chunk_size: the number of characters to read at a time.
+Example:
+>>> for name in json_extract_file('tweets.json', ('user', 'name')):
+...     print(name)
+    '''
+    if not isinstance(file, str):
+        yield from compile_path(path).extract_stream(file, bool(jsonl), chunk_size)
+        return
+    if jsonl is None:
+        jsonl = file.lower().endswith(('.jsonl', '.ndjson'))
+    with open(file, encoding = 'utf-8') as f:
+        yield from compile_path(path).extract_stream(f, jsonl, chunk_size)
+
+
+STREAM_CHUNK_SIZE = 1 << 16 #characters
+
+# one JSON token, after any whitespace: group 1 opens a container, 2 closes one,
+# 3 is a comma or colon, 4 is the inside of a string, and 5 any other scalar
+_TOKEN = re.compile(r'[ \t\n\r]*(?:([{\[])|([}\]])|([,:])|"([^"\\]*(?:\\.[^"\\]*)*)"'
+                    r'|(-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][-+]?[0-9]+)?|true|false|null))',
+                    re.S)
+#what the tokenizer expects next
+_VALUE, _VALUE_OR_CLOSE, _KEY, _KEY_OR_CLOSE, _COLON, _AFTER, _DOCUMENT = range(7)
+
+
+def _stream_matches(f, states, chunk_size):
+    '''Generator behind PathMatcher.extract_stream: tokenizes the text file f a
+chunk at a time, runs the NFA of states (see PathMatcher) on the keys of the
+containers it's in, and yields the values that match.
+Each open container has a frame [is_dict, state, key or index of the current
+child] on stack. The text of a matching container that doesn't fit in the
+chunk read so far is kept (from capture_start) until the container ends, and
+then parsed whole.'''
+    match = _TOKEN.match
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0 #in buf
+    offset = 0 #of buf in the file, for error messages
+    eof = False
+    stack = []
+    expect = _DOCUMENT
+    capture_start = None
+    capture_depth = 0
+    while True:
+        m = match(buf, pos)
+        if m is None or (m.lastindex == 5 and not eof and len(buf) - m.end() < 3):
+            # the next token might not all be in buf (a number could go on)
+            if eof:
+                if buf[pos:].strip():
+                    raise ValueError(f'Invalid JSON at character {offset + pos}')
+                if stack or capture_start is not None:
+                    raise ValueError('Unexpected end of JSON')
+                return
+            chunk = f.read(chunk_size)
+            if not chunk:
+                eof = True
+                continue
+            keep = pos if capture_start is None else capture_start
+            buf = buf[keep:] + chunk
+            pos -= keep
+            offset += keep
+            if capture_start is not None:
+                capture_start -= keep
+            continue
+        pos = m.end()
+        token = m.lastindex
+        if capture_start is not None: #inside a matching container
+            if token == 1:
+                capture_depth += 1
+            elif token == 2:
+                capture_depth -= 1
+                if capture_depth == 0:
+                    yield json.loads(buf[capture_start:pos])
+                    capture_start = None
+                    expect = _AFTER
+            continue
+        if token == 3:
+            if m.group(3) == ':':
+                if expect != _COLON:
+                    raise ValueError(f'Invalid JSON at character {offset + m.start(3)}')
+                expect = _VALUE
+            elif expect != _AFTER:
+                raise ValueError(f'Invalid JSON at character {offset + m.start(3)}')
+            elif stack[-1][0]:
+                expect = _KEY
+            else:
+                stack[-1][2] += 1
+                expect = _VALUE
+            continue
+        if token == 2:
+            if not stack or stack[-1][0] != (m.group(2) == '}') or expect not in (
+                    _AFTER, _KEY_OR_CLOSE if stack[-1][0] else _VALUE_OR_CLOSE):
+                raise ValueError(f'Invalid JSON at character {offset + m.start(2)}')
+            stack.pop()
+            expect = _AFTER if stack else _DOCUMENT
+            continue
+        if expect in (_KEY, _KEY_OR_CLOSE):
+            if token != 4:
+                raise ValueError(f'Invalid JSON at character {offset + m.start(token)}')
+            key = m.group(4)
+            stack[-1][2] = json.loads(m.group(0)) if '\\' in key else key
+            expect = _COLON
+            continue
+        if expect == _COLON or expect == _AFTER:
+            raise ValueError(f'Invalid JSON at character {offset + m.start(token)}')
+        # a value, in the container on top of the stack (if any)
+        if not stack: #a whole document; its children are what can match
+            if token == 1:
+                stack.append([m.group(1) == '{', 0, None if m.group(1) == '{' else 0])
+                expect = _KEY_OR_CLOSE if m.group(1) == '{' else _VALUE_OR_CLOSE
+            continue
+        frame = stack[-1]
+        keys, is_last = states[frame[1]]
+        hit = frame[2] in keys
+        if hit and is_last:
+            if token != 1:
+                yield json.loads(m.group(0))
+                expect = _AFTER
+                continue
+            start = m.start(1)
+            try: #most matches are in the chunk already
+                value, end = decoder.raw_decode(buf, start)
+            except json.JSONDecodeError: #read on to the end of it
+                capture_start = start
+                capture_depth = 1
+                continue
+            yield value
+            pos = end
+            expect = _AFTER
+        elif token == 1:
+            is_dict = m.group(1) == '{'
+            stack.append([is_dict, frame[1] + 1 if hit else frame[1], None if is_dict else 0])
+            expect = _KEY_OR_CLOSE if is_dict else _VALUE_OR_CLOSE
+        else:
+            expect = _AFTER
+
+
+def show_json_structure(json,show_parents_only = False,keys_of_interest = tuple(),
+                        max_depth = None,max_items_per_container = None,summarize = False):
     '''Returns a pretty-print string of the keys (and, if show_parents_only is False, 
     the values in arrays) in a json object.
 If show_parents_only is True, it only prints keys and indices of arrays if those indices
     or keys have a child that is also a json object and not just a scalar.
 If keys_of_interest is not empty, only show the keys_of_interest and their children.
+max_depth, max_items_per_container and summarize bound the output for huge
+    documents; see iter_json_structure, which yields the same lines one at a time.
 
 Example:
 >>> bad_json = {'a': 1, 'b': 3, '6': 7, '9': 'ball', 'jub': {'uy': [1, 2, 3], 'yu': [[6, {'y': 'b', 'm': 9}], 10], 'status': 'jubar'}}
@@ -161,57 +398,333 @@ Example:
     },
 }
     '''
-    if not is_iterable(keys_of_interest):
-        keys_of_interest = [[keys_of_interest]]
-    else:
-        keys = []
-        for key in keys_of_interest:
-            if is_iterable(key):
-                keys.append(key)
-            else:
-                keys.append([key])
-        keys_of_interest = keys
-    print(keys_of_interest)
-    def repr_if_string(x):
-        if type(x)==str:
-            return repr(x)
-        else:
-            return str(x)
-    out_arr = []
-    def traverse(arr = out_arr,**kwargs):
-        graph = kwargs.get('graph')
-        depth = kwargs.get('depth',0)
-        keys_of_interest = kwargs.get('keys_of_interest',tuple())
-        if type(graph)==dict:
-            iterator = iter(graph)
-            arr.append('\t'*depth + '{')
-        else:
-            iterator = range(len(graph))
-            arr.append('\t'*depth + '[')
-        #curpath = kwargs.get('curpath',[])
-        for curnode in iterator:
-            newgraph = graph[curnode]
-            if len(keys_of_interest)==0 or curnode in keys_of_interest[0]:
-                if is_iterable(newgraph):
-                    arr.append('\t'*depth + repr_if_string(curnode))
-                    #curpath = curpath + [curnode]
-                    placeholder = traverse(arr, graph = newgraph,
-                                            depth= depth+1,
-                                            keys_of_interest=keys_of_interest[1:])
-                elif not show_parents_only:
-                    if type(graph)==dict:
-                        arr.append('\t'*depth + repr_if_string(curnode))
-                    else:
-                        arr.append('\t'*depth + repr_if_string(newgraph))
-        if type(graph)==dict:
-            arr.append('\t'*depth + '},')
-        else:
-            arr.append('\t'*depth + '],')
-    
     try:
-        traverse(out_arr,graph=json,keys_of_interest = keys_of_interest)
-        return '\n'.join(out_arr)[:-1]
+        return '\n'.join(iter_json_structure(json, show_parents_only, keys_of_interest,
+                                             max_depth, max_items_per_container, summarize))
     except:
         print(traceback.format_exc())
+
+
+def iter_json_structure(json,show_parents_only = False,keys_of_interest = tuple(),
+                        max_depth = None,max_items_per_container = None,summarize = False):
+    '''Yields the lines of show_json_structure(json, ...) one at a time, without
+building them all, so that the structure of a huge document can be printed or
+paged through in constant memory. Like json_extract, it keeps its own stack, so
+any depth of nesting is fine.
+max_depth: containers nested deeper than this (the top level is depth 0) are
+    shown as {...} or [...] instead of being walked into.
+max_items_per_container: only the first this many keys or items of each
+    container are shown, followed by a line like "... 999,990 more".
+summarize: if True, an array whose items all have the same shape is shown as
+    one line instead, like [ 1,000,000 x {id, text, user{...}} ], where the shape
+    is the keys of a dict (with {...} or [...] after those holding containers),
+    [...] for an array, or the type of a scalar. Arrays whose indices are
+    filtered by keys_of_interest aren't summarized.
+Example:
+>>> for line in iter_json_structure(tweets, summarize = True): print(line)
+[ 1,000,000 x {id, text, user{...}, retweets} ]
+    '''
+    def enter(graph, depth, keys):
+        #the line that opens graph, and the frame for walking it (None if it's
+        #shown on that one line)
+        indent = '\t'*depth
+        is_dict = type(graph)==dict
+        if max_depth is not None and depth >= max_depth:
+            return indent + ('{...}' if is_dict else '[...]'), None
+        if summarize and not is_dict and not keys:
+            shape = _homogeneous_shape(graph)
+            if shape is not None:
+                return f'{indent}[ {len(graph):,} x {shape} ]', None
+        children = _children(graph)
+        if max_items_per_container is not None:
+            children = itertools.islice(children, max_items_per_container)
+        return indent + ('{' if is_dict else '['), (graph, is_dict, children, depth, keys)
+    
+    line, frame = enter(json, 0, _keys_of_interest(keys_of_interest))
+    yield line
+    stack = []
+    while frame is not None:
+        graph, is_dict, children, depth, keys = frame
+        indent = '\t'*depth
+        for curnode, newgraph in children:
+            if keys and curnode not in keys[0]:
+                continue
+            if type(newgraph) not in _SCALARS and is_iterable(newgraph):
+                yield indent + _repr_if_string(curnode)
+                line, child = enter(newgraph, depth+1, keys[1:])
+                if child is None:
+                    yield line + ','
+                    continue
+                yield line
+                stack.append(frame)
+                frame = child
+                break
+            elif not show_parents_only:
+                yield indent + _repr_if_string(curnode if is_dict else newgraph)
+        else: #done with this container; back to its parent
+            if max_items_per_container is not None and len(graph) > max_items_per_container:
+                yield f'{indent}... {len(graph) - max_items_per_container:,} more'
+            closer = indent + ('}' if is_dict else ']')
+            if stack:
+                yield closer + ','
+                frame = stack.pop()
+            else:
+                yield closer
+                frame = None
+
+
+def _keys_of_interest(keys_of_interest):
+    '''keys_of_interest (as for show_json_structure) as a list of lists of keys.'''
+    if not is_iterable(keys_of_interest):
+        return [[keys_of_interest]]
+    return [key if is_iterable(key) else [key] for key in keys_of_interest]
+
+
+def _repr_if_string(x):
+    if type(x)==str:
+        return repr(x)
+    return str(x)
+
+
+_NESTED_SHAPES = {dict: '{...}', list: '[...]', tuple: '[...]'}
+
+
+def _shape(x):
+    '''A one-line description of x for summarized arrays: the keys of a dict, with
+{...} or [...] after those holding containers, [...] for an array, and the type
+of a scalar.'''
+    if type(x)==dict:
+        return '{' + ', '.join(str(key) + _NESTED_SHAPES.get(type(value), '')
+                               for key, value in x.items()) + '}'
+    if type(x) not in _SCALARS and is_iterable(x):
+        return '[...]'
+    return 'None' if x is None else type(x).__name__
+
+
+def _homogeneous_shape(arr):
+    '''The _shape shared by every item of the array arr, or None if they don't all
+have the same one (or arr is empty).'''
+    if len(arr)==0:
+        return None
+    first = arr[0]
+    kind = type(first)
+    #compare the items without building a string for each of them
+    if kind in _SCALARS:
+        for x in arr:
+            if type(x) is not kind:
+                return None
+    elif kind is dict:
+        keys = tuple(first)
+        nested = tuple(map(_NESTED_SHAPES.get, map(type, first.values())))
+        for x in arr:
+            if (type(x) is not dict or tuple(x) != keys
+                    or tuple(map(_NESTED_SHAPES.get, map(type, x.values()))) != nested):
+                return None
+    else:
+        for x in arr:
+            if _shape(x) != '[...]':
+                return None
+    return _shape(first)
+
+
+class JsonSchema:
+    '''The shape of a collection of JSON documents, merged into one tree: which
+keys appear where, how often, and with which types of values.
+count: the number of values seen at this place in the documents.
+types: the name of each type of those values -> how many had it.
+keys: each key of the dicts among them -> the JsonSchema of its values.
+items: the JsonSchema of the items of the arrays among them (None if there
+    were no arrays).
+Schemas are built a document at a time with add, so a stream of records can
+be profiled in one pass, and partial schemas (e.g. of different chunks of the
+records, built in different processes) combine with merge. as_dict and
+from_dict convert a schema to and from plain JSON.
+Printing a schema shows it like show_json_structure, with the type counts:
+>>> print(infer_schema(json.loads(line) for line in open('tweets.jsonl')))
+dict (1,000,000)
+	'id': int (1,000,000)
+	'user': dict (1,000,000)
+		'name': str (1,000,000)
+		'tags': list (1,000,000)
+			[]: str (3,000,000)
+	'geo': None (900,000) | dict (100,000)
+		'lat': float (100,000)
+    '''
+    def __init__(self):
+        self.count = 0
+        self.types = {}
+        self.keys = {}
+        self.items = None
+
+    def add(self, doc):
+        '''Adds the document doc to the schema. Returns self.'''
+        stack = [(doc, self)] #like json_extract, nesting can be as deep as you like
+        while stack:
+            value, node = stack.pop()
+            node.count += 1
+            kind = type(value)
+            name = 'None' if value is None else kind.__name__
+            node.types[name] = node.types.get(name, 0) + 1
+            if kind in _SCALARS:
+                continue
+            if kind is dict:
+                keys = node.keys
+                for key, child in value.items():
+                    sub = keys.get(key)
+                    if sub is None:
+                        sub = keys[key] = JsonSchema()
+                    if type(child) in _SCALARS: #no need to push it on the stack
+                        sub.count += 1
+                        name = 'None' if child is None else type(child).__name__
+                        sub.types[name] = sub.types.get(name, 0) + 1
+                    else:
+                        stack.append((child, sub))
+            elif is_iterable(value):
+                if node.items is None:
+                    node.items = JsonSchema()
+                items = node.items
+                stack.extend((child, items) for child in value)
+        return self
+
+    def merge(self, other):
+        '''Adds everything in the JsonSchema other to this one. Returns self.'''
+        stack = [(other, self)]
+        while stack:
+            src, dst = stack.pop()
+            dst.count += src.count
+            for name, count in src.types.items():
+                dst.types[name] = dst.types.get(name, 0) + count
+            for key, sub in src.keys.items():
+                mine = dst.keys.get(key)
+                if mine is None:
+                    mine = dst.keys[key] = JsonSchema()
+                stack.append((sub, mine))
+            if src.items is not None:
+                if dst.items is None:
+                    dst.items = JsonSchema()
+                stack.append((src.items, dst.items))
+        return self
+
+    def as_dict(self):
+        '''The schema as nested dicts of plain JSON: {'count': ..., 'types': {...},
+'keys': {key: {'count': ...}, ...}}, plus 'items' if there were arrays.'''
+        out = {}
+        stack = [(self, out)]
+        while stack:
+            node, d = stack.pop()
+            d['count'] = node.count
+            d['types'] = dict(node.types)
+            d['keys'] = {}
+            for key, sub in node.keys.items():
+                d['keys'][key] = {}
+                stack.append((sub, d['keys'][key]))
+            if node.items is not None:
+                d['items'] = {}
+                stack.append((node.items, d['items']))
+        return out
+
+    @classmethod
+    def from_dict(cls, d):
+        '''The JsonSchema that as_dict turned into d.'''
+        out = cls()
+        stack = [(d, out)]
+        while stack:
+            d, node = stack.pop()
+            node.count = d['count']
+            node.types = dict(d['types'])
+            for key, sub in d['keys'].items():
+                node.keys[key] = cls()
+                stack.append((sub, node.keys[key]))
+            if d.get('items') is not None:
+                node.items = cls()
+                stack.append((d['items'], node.items))
+        return out
+
+    def union(self):
+        '''The types of the values here with their counts, most common first,
+e.g. "None (900) | dict (100)".'''
+        return ' | '.join(f'{name} ({count:,})' for name, count
+                          in sorted(self.types.items(), key = lambda x: -x[1]))
+
+    def lines(self, max_depth = None):
+        '''Yields the lines of str(self), leaving out everything nested more than
+max_depth levels down.'''
+        def children(node):
+            for key, sub in node.keys.items():
+                yield _repr_if_string(key) + ': ', sub
+            if node.items is not None:
+                yield '[]: ', node.items
+        yield self.union()
+        if max_depth is not None and max_depth < 1:
+            return
+        stack = [children(self)]
+        while stack:
+            for label, node in stack[-1]:
+                yield '\t'*len(stack) + label + node.union()
+                if (node.keys or node.items is not None) and (max_depth is None
+                                                              or len(stack) < max_depth):
+                    stack.append(children(node))
+                    break
+            else:
+                stack.pop()
+
+    def __str__(self):
+        return '\n'.join(self.lines())
+
+    def __repr__(self):
+        return f'<JsonSchema of {self.count:,} values>'
+
+
+def infer_schema(docs, schema = None):
+    '''The JsonSchema of the documents docs (any iterable, e.g. the records of a
+JSON Lines file as they're parsed), added to schema if it's given.'''
+    if schema is None:
+        schema = JsonSchema()
+    for doc in docs:
+        schema.add(doc)
+    return schema
+
+
+SCHEMA_CHUNK_SIZE = 1 << 26 #bytes
+
+
+def infer_schema_file(fname, processes = None, chunk_size = SCHEMA_CHUNK_SIZE):
+    '''The JsonSchema of the records of the JSON Lines file fname.
+The file is split into chunks of about chunk_size bytes, whose partial schemas
+are built by up to processes worker processes (default: one per CPU) and then
+merged, so a big file is profiled in one parallel pass. With processes = 1 it's
+all done in this process.'''
+    size = os.path.getsize(fname)
+    starts = range(0, size, chunk_size)
+    ends = [min(start + chunk_size, size) for start in starts]
+    schema = JsonSchema()
+    if processes == 1 or len(starts) <= 1:
+        for start, end in zip(starts, ends):
+            schema.merge(_chunk_schema(fname, start, end))
+        return schema
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(processes) as executor:
+        for partial in executor.map(_chunk_schema, [fname]*len(ends), starts, ends):
+            schema.merge(partial)
+    return schema
+
+
+def _chunk_schema(fname, start, end):
+    '''The JsonSchema of the lines of the JSON Lines file fname that start at
+byte start or later and before byte end.'''
+    schema = JsonSchema()
+    with open(fname, 'rb') as f:
+        if start:
+            f.seek(start - 1)
+            f.readline() #the rest of a line that began in the previous chunk
+        pos = f.tell()
+        while pos < end:
+            line = f.readline()
+            if not line:
+                break
+            pos += len(line)
+            if line.strip():
+                schema.add(json.loads(line))
+    return schema
         
         
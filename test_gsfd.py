@@ -0,0 +1,135 @@
+'''Regression tests for gsfd (run with python -m pytest).
+gsfd's queries take Windows-style paths, so these chdir into a temporary
+directory and search "/tree" inside it, like grep_benchmarks does.
+'''
+import io
+import os
+import random
+import re
+import gsfd
+
+
+def _make_tree(root, files):
+	'''Writes files (relative path -> text) beneath root/tree.'''
+	for rel, text in files.items():
+		fname = os.path.join(root, 'tree', *rel.split('/'))
+		os.makedirs(os.path.dirname(fname), exist_ok = True)
+		with open(fname, 'w', encoding = 'utf-8') as f:
+			f.write(text)
+
+
+def test_pipeline_overlapping_directories(tmp_path, monkeypatch):
+	# -d '.' finds both sub and sub/deep, and -d 'deep' then reaches sub/deep
+	# from each of them, so deep/a.txt is searched twice
+	_make_tree(tmp_path, {'sub/deep/a.txt': 'foo\nbar\nfoo\n', 'sub/b.txt': 'foo\n'})
+	monkeypatch.chdir(tmp_path)
+	fname = os.path.join(str(tmp_path), 'tree', 'sub', 'deep', 'a.txt')
+	assert gsfd.subGrep(["-r -d '.' /tree", "-d 'deep'", "-c 'foo'"]) == {fname: 2}
+	assert gsfd.grep("-r -d '.' /tree -}} -d 'deep' -}} -n 'foo'") == {fname: [(0, 'foo'), (2, 'foo')]}
+	assert gsfd.grep("-r -d '.' /tree -}} -d 'deep' -}} 'foo'") == {fname: ['foo', 'foo']}
+	assert list(gsfd.igrep("-r -d '.' /tree -}} -d 'deep' -}} -c 'foo'")) == [(fname, None, None)]*2
+
+
+def test_sub_stream_matches_re_subn():
+	# small chunks put matches (including empty ones, like those of '|a' and
+	# 'x*|a') on every chunk boundary
+	rng = random.Random(0)
+	patterns = ['a', 'ab', 'a*', '|a', 'x*|a', 'b*|ab', '(?=a)|a', '(?m)^a', 'a$', r'\bab\b',
+				r'(?<=a)b', '\n', r'\s+', '', r'\Z']
+	for trial in range(3000):
+		text = ''.join(rng.choice('ab \nx') for ii in range(rng.randrange(60)))
+		regex = re.compile(rng.choice(patterns))
+		repl = rng.choice(['X', r'<\g<0>>', ''])
+		out = io.StringIO()
+		count = gsfd._sub_stream(regex, repl, io.StringIO(text), out, rng.randrange(1, 8),
+								 rng.randrange(3, 8))
+		assert (out.getvalue(), count) == regex.subn(repl, text), (regex.pattern, text)
+
+
+def test_bulk_sed_in_place(tmp_path):
+	# the file's CRLFs only come after what the first chunk (or the decoder's
+	# own buffer) reads
+	fname = str(tmp_path / 'crlf.txt')
+	with open(fname, 'w', encoding = 'utf-8', newline = '') as f:
+		f.write('x'*100000 + '\r\nfoo\r\nfoo bar\r\n')
+	assert gsfd.bulk_sed([fname], 'foo', 'baz', name_mangle = '', chunk_size = 4096,
+						 overlap = 3) == {fname: 2}
+	with open(fname, 'rb') as f:
+		assert f.read() == b'x'*100000 + b'\r\nbaz\r\nbaz bar\r\n'
+	assert os.listdir(str(tmp_path)) == ['crlf.txt'] # no temporary files left
+	assert gsfd.bulk_sed([fname], 'zebra', 'baz', name_mangle = '') == {fname: 0}
+
+
+def test_stats_counts(tmp_path, monkeypatch):
+	_make_tree(tmp_path, {'a.txt': 'zebra\n', 'sub/b.txt': 'zebra café\n'})
+	monkeypatch.chdir(tmp_path)
+	gsfd.grep("-r 'zebra' /tree", encoding_cache = True) # writes the encoding cache's file
+	assert gsfd.EncodingCache.FILENAME in os.listdir(os.path.join(str(tmp_path), 'tree'))
+	for query in ("-r 'zebra' /tree", "'zebra' /tree"):
+		stats = gsfd.SearchStats()
+		files = gsfd.grep(query, stats = stats)
+		# neither the encoding cache's file nor the directory sub is a file walked,
+		# and UTF-8 files are decoded with the first encoding tried on them
+		assert stats.files_walked == stats.files_read == len(files)
+		assert stats.encoding_attempts == len(files)
+
+
+def test_agrep_rejects_unsupported_options(tmp_path, monkeypatch):
+	import asyncio
+	import pytest
+	_make_tree(tmp_path, {'a.txt': 'zebra\n', '.gitignore': 'a.txt\n'})
+	monkeypatch.chdir(tmp_path)
+	assert asyncio.run(gsfd.agrep("-r 'zebra' /tree")) == gsfd.grep("-r 'zebra' /tree")
+	for query in ("-r -g 'zebra' /tree", "-r 'zebra' /tree -}} 'z'"):
+		with pytest.raises(ValueError):
+			asyncio.run(gsfd.agrep(query))
+
+
+def test_sed_replacement_not_in_encoding(tmp_path):
+	# the file is latin-1, which has no euro sign
+	fname = str(tmp_path / 'latin1.txt')
+	original = 'café foo\n'.encode('latin-1')*3
+	with open(fname, 'wb') as f:
+		f.write(original)
+	gsfd.sed([fname], 'foo', '€', ask_permission = False, name_mangle = '')
+	with open(fname, 'rb') as f:
+		assert f.read() == original
+	# an error, not "no replacements", and nothing written in another encoding
+	assert gsfd.bulk_sed([fname], 'foo', '€', name_mangle = '') == {fname: None}
+	with open(fname, 'rb') as f:
+		assert f.read() == original
+	assert os.listdir(str(tmp_path)) == ['latin1.txt']
+
+
+def test_index_ignorecase_matches_unindexed(tmp_path, monkeypatch):
+	from trigram_index import TrigramIndex
+	# with re.I, 'ſ' matches s, 'İ' and 'ı' match i, and the Kelvin sign matches k
+	_make_tree(tmp_path, {'long_s.txt': 'ſſſ\n', 'dotted_i.txt': 'İii\n', 'dotless_i.txt': 'ııı\n',
+						  'kelvin.txt': 'Kkk\n', 'ascii.txt': 'SSS III KKK this\n',
+						  'other.txt': 'zebra\n'})
+	monkeypatch.chdir(tmp_path)
+	index = TrigramIndex(os.path.join(str(tmp_path), 'tree'))
+	for query in ("-r -i 'sss' /tree", "-r -i 'iii' /tree", "-r -i 'kkk' /tree",
+				  "-r '(?i)iii' /tree", "-r -i 'this|zebra' /tree", "-r -i 'zebra' /tree",
+				  "-r 'SSS' /tree"):
+		assert gsfd.grep(query, index = index) == gsfd.grep(query), query
+	# queries without those letters are still narrowed down by the index
+	assert index.candidates('zebra', re.I) == {os.path.join(str(tmp_path), 'tree', 'other.txt')}
+
+
+def test_grep_prints_results_as_found(tmp_path, monkeypatch, capsys):
+	import grep
+	_make_tree(tmp_path, {'a.txt': 'zebra\n', 'b.txt': 'zebra\nzebra\n', 'c.txt': 'okapi\n'})
+	monkeypatch.chdir(tmp_path)
+	printed = [] # what had been printed each time the search was resumed
+	def igrep(*args, **kwargs):
+		for result in gsfd.igrep(*args, **kwargs):
+			yield result
+			printed.append(capsys.readouterr().out)
+	monkeypatch.setattr(grep, 'igrep', igrep)
+	grep.process_grep_query("'zebra' /tree", has_warned_fname = True)
+	printed.append(capsys.readouterr().out)
+	resultset = gsfd.grep("'zebra' /tree")
+	records = [str(x) for x in grep.resultset_records(resultset)]
+	# each match is printed before the search goes on to the next one
+	assert printed == [record + '\n' for record in records] + ['2\n']
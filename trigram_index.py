@@ -0,0 +1,189 @@
+'''An index from trigrams (3-character substrings) to the text files containing
+them, for a directory tree.
+When the same tree is searched many times (e.g., from the grep.py REPL),
+gsfd.grep can use a TrigramIndex to find the few files that could possibly
+match a regex without reading any of the others:
+>>> index = TrigramIndex('C:/Users/molso/Documents/html stuff')
+>>> gsfd.grep("-r 'zargothrax' /C:/Users/molso/Documents/html stuff", index = index)
+Only the literal text in a regex can be used this way (e.g., 'zargo' and
+'hrax' in 'zargo.+hrax'). Regexes with no literal runs of at least 3
+characters, and -v queries, still read every file.
+The index is updated (only re-reading the files whose modification time or
+size changed) every time grep uses it.
+'''
+import os
+import re
+try:
+	from re import _parser as sre_parse, _constants as sre_constants
+except ImportError: # Python < 3.11
+	import sre_parse, sre_constants
+from gsfd import get_text_best_encoding, textTypeFiles, EncodingCache
+
+_REPEATS = tuple(getattr(sre_constants, name) for name in
+				 ('MAX_REPEAT', 'MIN_REPEAT', 'POSSESSIVE_REPEAT')
+				 if hasattr(sre_constants, name))
+
+
+def trigrams(text):
+	'''The set of all 3-character substrings of text, lowercased.'''
+	text = text.lower()
+	return {text[ii:ii+3] for ii in range(len(text) - 2)}
+
+
+# with re.I, these also match non-ASCII characters (e.g. 'ſ' for s, 'İ' and 'ı'
+# for i, the Kelvin sign for k) that don't lowercase to them, so the index's
+# lowercased trigrams can't stand for them
+_EXTRA_FOLDS = frozenset(map(ord, 'iksIKS'))
+
+
+def _literal_runs(items, runs, ignorecase = False):
+	'''Adds to the list runs the runs of ASCII literal characters that every
+match of the parsed regex items must contain, and returns runs.
+With ignorecase (re.I), the characters of _EXTRA_FOLDS end a run.'''
+	current = []
+	for op, av in items:
+		if (op is sre_constants.LITERAL and av < 128
+				and not (ignorecase and av in _EXTRA_FOLDS)):
+			current.append(chr(av))
+			continue
+		runs.append(''.join(current))
+		current = []
+		if op is sre_constants.SUBPATTERN:
+			group, add_flags, del_flags, pattern = av
+			_literal_runs(pattern, runs, (ignorecase or bool(add_flags & re.I))
+						  and not del_flags & re.I)
+		elif op in _REPEATS and av[0] >= 1: # repeated at least once
+			_literal_runs(av[2], runs, ignorecase)
+	runs.append(''.join(current))
+	return runs
+
+
+def query_trigrams(regex, flags = 0):
+	'''Returns a list of sets of trigrams such that any text the regex matches
+somewhere contains (once lowercased) every trigram in at least one of the
+sets. There is one set for each alternative of a top-level |.
+Returns None if the regex doesn't have the literal text to make such sets.
+Examples:
+>>> query_trigrams('zebra')
+[{'zeb', 'ebr', 'bra'}]
+>>> query_trigrams('meat|tofu')
+[{'mea', 'eat'}, {'tof', 'ofu'}]
+>>> query_trigrams('ze.ra') # no literal runs of 3 or more
+>>> query_trigrams('this', re.I) # with re.I, i, k and s can be non-ASCII letters
+	'''
+	try:
+		parsed = sre_parse.parse(regex, flags)
+	except Exception:
+		return None
+	ignorecase = bool((flags | parsed.state.flags) & re.I) # (?i) sets parsed.state.flags
+	items = list(parsed)
+	if len(items) == 1 and items[0][0] is sre_constants.BRANCH:
+		alternatives = items[0][1][1]
+	else:
+		alternatives = [items]
+	out = []
+	for alternative in alternatives:
+		tris = set()
+		for run in _literal_runs(alternative, [], ignorecase):
+			tris |= trigrams(run)
+		if not tris:
+			return None
+		out.append(tris)
+	return out
+
+
+class TrigramIndex:
+	'''Maps each trigram in the text-type files (see gsfd.textTypeFiles) under
+the directory root to the set of those files that contain it.
+encoding_cache: an optional gsfd.EncodingCache used when reading the files.
+Call update() to bring the index up to date with the files on disk;
+gsfd.grep does this before it uses the index.
+	'''
+	def __init__(self, root, encoding_cache = None):
+		self.root = os.path.abspath(root)
+		self.encoding_cache = encoding_cache
+		self.files = {} # file -> (mtime_ns, size, frozenset of its trigrams), in os.walk order
+		self.postings = {} # trigram -> set of files
+
+	def __len__(self):
+		return len(self.files)
+
+	def covers(self, dirName):
+		'''True if dirName is root or a directory beneath it.'''
+		dirName = os.path.abspath(dirName)
+		return dirName == self.root or dirName.startswith(os.path.join(self.root, ''))
+
+	def _post(self, file, tris):
+		for tri in tris:
+			self.postings.setdefault(tri, set()).add(file)
+
+	def _unpost(self, file, tris):
+		for tri in tris:
+			files = self.postings[tri]
+			files.discard(file)
+			if not files:
+				del self.postings[tri]
+
+	def update(self):
+		'''Walks root, indexing files that are new or whose modification time or
+size has changed, and forgetting files that are gone.
+Returns (number of files (re)indexed, number of files forgotten).'''
+		files = {}
+		indexed = 0
+		for root, dirs, fnames in os.walk(self.root):
+			for fname in fnames:
+				if fname == EncodingCache.FILENAME or not re.search(textTypeFiles, fname):
+					continue
+				file = os.path.join(root, fname)
+				try:
+					stat = os.stat(file)
+				except OSError:
+					continue
+				old = self.files.get(file)
+				if old is not None and old[:2] == (stat.st_mtime_ns, stat.st_size):
+					files[file] = old
+					continue
+				if old is not None:
+					self._unpost(file, old[2])
+				try:
+					tris = frozenset(trigrams(get_text_best_encoding(file,
+										encoding_cache = self.encoding_cache)))
+				except (OSError, UnicodeError): # grep can't read it either
+					tris = frozenset()
+				self._post(file, tris)
+				files[file] = (stat.st_mtime_ns, stat.st_size, tris)
+				indexed += 1
+		forgotten = [file for file in self.files if file not in files]
+		for file in forgotten:
+			self._unpost(file, self.files[file][2])
+		self.files = files
+		return indexed, len(forgotten)
+
+	def candidates(self, regex, flags = 0):
+		'''Returns the set of indexed files that could contain a match for regex,
+or None if the index can't rule any files out (see query_trigrams).'''
+		alternatives = query_trigrams(regex, flags)
+		if alternatives is None:
+			return None
+		found = set()
+		for tris in alternatives:
+			postings = sorted((self.postings.get(tri, set()) for tri in tris), key = len)
+			files = set(postings[0])
+			for posting in postings[1:]:
+				if not files:
+					break
+				files &= posting
+			found |= files
+		return found
+
+	def files_under(self, dirName, recursive = True):
+		'''Yields the indexed files in the directory dirName (and, if recursive,
+its subdirectories), in the order os.walk would find them.'''
+		dirName = os.path.abspath(dirName)
+		prefix = os.path.join(dirName, '')
+		for file in self.files:
+			if recursive:
+				if file.startswith(prefix):
+					yield file
+			elif os.path.dirname(file) == dirName:
+				yield file